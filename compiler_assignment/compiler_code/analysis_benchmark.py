@@ -0,0 +1,74 @@
+# Benchmark of parallel semantic analysis. Times a sequential analysis against analyze(workers), and the
+# body checks sent one function per worker task against the same checks sent in batches.
+import contextlib
+import io
+import os
+import time
+from semantic_analyser import SemanticAnalyzer, check_function_bodies
+
+###########################################################################################################################################
+
+# Builds a program of functions whose bodies declare and print nested additions and multiplications
+def build_program(functions, statements, depth):
+    program = []
+    for function in range(functions):
+        body = []
+        for index in range(statements):
+            expression = ("IDENTIFIER", "x")
+            for level in range(depth):
+                expression = ("PLUS" if level % 3 else "MUL", expression, ("INTEGER_LITERAL", level))
+            body.append(("DECLARATION", "TYPE_INT", f"v{index}", expression))
+            body.append(("PRINT", ("IDENTIFIER", f"v{index}")))
+        body.append(("RETURN", ("IDENTIFIER", "x")))
+        program.append(("FUNCTION_DEF", f"f{function}", [("x", "int")], "int", ("BLOCK", body)))
+    return program
+
+#---------------------------------------------------------------------------------------------------------------------------------------
+
+# Returns the best time, in seconds, over several runs of a function, keeping the prints out of the report
+def best_time(run, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+    return best
+
+def analyze(program, workers):
+    SemanticAnalyzer(program).analyze(workers)
+
+# Checks the bodies the way analyze(workers) does, but with the given number of batches, whatever the
+# machine, so that sending one body per task can be compared with sending batches
+def check_bodies(program, workers, batches):
+    analyzer = SemanticAnalyzer(program)
+    deferred_bodies = []
+    for position, node in enumerate(program):
+        analyzer.declare_function(node)
+        deferred_bodies.append((position, node, analyzer.symbol_table.snapshot()))
+    check_function_bodies(deferred_bodies, workers, batches)
+
+###########################################################################################################################################
+
+# Usage:
+
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    workers = max(2, os.cpu_count() or 1)
+    repeats = 3
+
+    print("\n" + "-"*100)
+    print(f"\nParallel semantic analysis benchmark ({os.cpu_count()} CPU(s), {workers} workers, best of {repeats} runs):\n")
+
+    for name, program in [
+        ("small program", build_program(functions=8, statements=10, depth=10)),
+        ("large program", build_program(functions=200, statements=40, depth=30)),
+    ]:
+        sequential = best_time(lambda: analyze(program, None), repeats)
+        parallel = best_time(lambda: analyze(program, workers), repeats)
+        per_body = best_time(lambda: check_bodies(program, workers, len(program)), repeats)
+        batched = best_time(lambda: check_bodies(program, workers, None), repeats)
+        print(f"{name:<14} sequential: {sequential * 1000:>7.1f} ms   analyze({workers}): {parallel * 1000:>7.1f} ms   "
+              f"pool, one body per task: {per_body * 1000:>7.1f} ms   pool, batched: {batched * 1000:>7.1f} ms")
+
+    print("\n" + "-"*100)
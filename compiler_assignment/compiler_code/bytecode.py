@@ -0,0 +1,298 @@
+# Binary encoding of PixIR. Every instruction is a one-byte opcode, followed by its operand when it has one:
+# integers as zigzag varints, colours, floats and strings as varint indices into the constant pool, and
+# labels as the varint byte offset, in the code, of the instruction they stand for. The header holds the
+# constant pool, the label names and, for each jump or push naming a label that shares its offset with an
+# earlier one, which of the names it used, so that the disassembler gives back exactly the text the program
+# came from.
+import struct
+from constant_pool import ConstantPool, is_pooled, read_program
+
+###########################################################################################################################################
+
+class BytecodeError(Exception):
+    pass
+
+# Identifies a PixIR bytecode file, and the version of the format
+MAGIC = b"PIXB"
+VERSION = 2
+
+# Opcode of every PixIR instruction without an operand
+OPCODES = {name: code for code, name in enumerate((
+    "nop", "halt", "ret", "call", "alloc", "st", "ld", "dup", "drop",
+    "add", "sub", "mul", "div", "mod", "inc", "dec", "max", "min",
+    "lt", "le", "gt", "ge", "eq", "neq", "and", "or", "not",
+    "print", "delay", "pixel", "pixelr", "clear", "irnd", "read", "width", "height",
+))}
+
+# Opcodes of the instructions with an operand, after the ones without
+PUSH_INT = len(OPCODES)
+PUSH_CONSTANT = PUSH_INT + 1
+PUSH_LABEL = PUSH_INT + 2
+JMP = PUSH_INT + 3
+CJMP = PUSH_INT + 4
+
+# Opcode of each instruction taking a label, and the instruction each opcode with a label stands for
+LABEL_OPCODES = {"push": PUSH_LABEL, "jmp": JMP, "cjmp": CJMP}
+LABEL_INSTRUCTIONS = {opcode: name for name, opcode in LABEL_OPCODES.items()}
+MNEMONICS = {code: name for name, code in OPCODES.items()}
+
+# How each constant in the pool is stored: colours as three bytes, floats as eight, anything else as text
+COLOUR_CONSTANT, FLOAT_CONSTANT, TEXT_CONSTANT = range(3)
+
+###########################################################################################################################################
+
+def write_varint(out, value):
+    # Unsigned LEB128: seven bits per byte, low bits first, the top bit set on every byte but the last
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+def varint_size(value):
+    size = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+def zigzag(value):
+    # Maps 0, -1, 1, -2, ... to 0, 1, 2, 3, ... so that small negative numbers stay short
+    return value * 2 if value >= 0 else -value * 2 - 1
+
+def unzigzag(value):
+    return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+class Reader:
+    def __init__(self, data, position=0):
+        self.data = data
+        self.position = position
+
+    def byte(self):
+        if self.position >= len(self.data):
+            raise BytecodeError("Unexpected end of bytecode.")
+        self.position += 1
+        return self.data[self.position - 1]
+
+    def bytes(self, count):
+        if self.position + count > len(self.data):
+            raise BytecodeError("Unexpected end of bytecode.")
+        self.position += count
+        return self.data[self.position - count:self.position]
+
+    def varint(self):
+        value = 0
+        shift = 0
+        while True:
+            byte = self.byte()
+            value |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value
+
+###########################################################################################################################################
+
+# Two-pass assembler from PixIR text lines to bytecode. The first pass works out the byte offset of every
+# label, the second encodes the instructions with their operands. A label's varint can grow as the offsets
+# before it move, so the first pass repeats until the offsets stop changing, which they do after a pass or
+# two as they only ever grow.
+class Assembler:
+    def __init__(self, code, constant_pool=None):
+        # The PixIR instructions and label definitions, one per line
+        self.code = [line for line in code if line]
+        # The constants the code refers to; the code generator's pool, so that its table's indices hold
+        self.constant_pool = constant_pool if constant_pool is not None else ConstantPool()
+        # Byte offset in the code of every label
+        self.labels = {}
+        # Labels at each offset, in the order they are defined
+        self.names = {}
+        # Offset in the code of each instruction naming a label other than the first defined at its offset,
+        # with the position of that name among the labels at the offset
+        self.aliases = []
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def assemble(self):
+        for line in self.code:
+            opcode, _, operand = line.partition(" ")
+            if opcode == "push" and is_pooled(operand):
+                self.constant_pool.add(operand)
+
+        while True:
+            labels = self.layout()
+            if labels == self.labels:
+                break
+            self.labels = labels
+
+        for label, offset in self.labels.items():
+            self.names.setdefault(offset, []).append(label)
+
+        body = bytearray()
+        for line in self.code:
+            if not line.startswith("."):
+                self.encode(line, body)
+
+        out = bytearray(MAGIC)
+        out.append(VERSION)
+        self.write_constants(out)
+        self.write_labels(out)
+        self.write_aliases(out)
+        write_varint(out, len(body))
+        return bytes(out + body)
+
+    # Byte offset of every label, given the offsets found by the previous pass for the label operands
+    def layout(self):
+        labels = {}
+        offset = 0
+        for line in self.code:
+            if line.startswith("."):
+                if line in labels:
+                    raise BytecodeError(f"Label '{line}' is defined more than once.")
+                labels[line] = offset
+            else:
+                offset += self.size(line)
+        return labels
+
+    def size(self, line):
+        opcode, _, operand = line.partition(" ")
+        if not operand:
+            return 1
+        if opcode in LABEL_OPCODES and operand.startswith("."):
+            return 1 + varint_size(self.labels.get(operand, 0))
+        if opcode == "push" and is_pooled(operand):
+            return 1 + varint_size(self.constant_pool.indices[operand])
+        return 1 + varint_size(zigzag(self.integer(line, operand)))
+
+    def encode(self, line, out):
+        opcode, _, operand = line.partition(" ")
+        if not operand:
+            if opcode not in OPCODES:
+                raise BytecodeError(f"Unknown instruction '{line}'.")
+            out.append(OPCODES[opcode])
+        elif opcode in LABEL_OPCODES and operand.startswith("."):
+            if operand not in self.labels:
+                raise BytecodeError(f"Undefined label '{operand}'.")
+            names = self.names[self.labels[operand]]
+            if names[0] != operand:
+                self.aliases.append((len(out), names.index(operand)))
+            out.append(LABEL_OPCODES[opcode])
+            write_varint(out, self.labels[operand])
+        elif opcode == "push" and is_pooled(operand):
+            out.append(PUSH_CONSTANT)
+            write_varint(out, self.constant_pool.indices[operand])
+        else:
+            out.append(PUSH_INT)
+            write_varint(out, zigzag(self.integer(line, operand)))
+
+    def integer(self, line, operand):
+        if line.partition(" ")[0] != "push":
+            raise BytecodeError(f"Unknown instruction '{line}'.")
+        try:
+            return int(operand)
+        except ValueError:
+            raise BytecodeError(f"Unsupported operand in '{line}'.")
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def write_constants(self, out):
+        write_varint(out, len(self.constant_pool.entries))
+        for operand in self.constant_pool.entries:
+            if len(operand) == 7 and operand == operand.lower() and operand.startswith("#") \
+                    and all(digit in "0123456789abcdef" for digit in operand[1:]):
+                out.append(COLOUR_CONSTANT)
+                out += bytes.fromhex(operand[1:])
+            elif not operand.startswith(('"', "#")) and str(float(operand)) == operand:
+                out.append(FLOAT_CONSTANT)
+                out += struct.pack("<d", float(operand))
+            else:
+                # Strings, and anything that would not come back with the same spelling
+                text = operand.encode("utf-8")
+                out.append(TEXT_CONSTANT)
+                write_varint(out, len(text))
+                out += text
+
+    # Label names, so that the disassembly uses the names the code was written with
+    def write_labels(self, out):
+        write_varint(out, len(self.labels))
+        for label in self.labels:
+            text = label.encode("utf-8")
+            write_varint(out, self.labels[label])
+            write_varint(out, len(text))
+            out += text
+
+    def write_aliases(self, out):
+        write_varint(out, len(self.aliases))
+        for position, name_index in self.aliases:
+            write_varint(out, position)
+            write_varint(out, name_index)
+
+###########################################################################################################################################
+
+def assemble(code, constant_pool=None):
+    # Accepts the generator's text, with its constant table, or its list of lines
+    table, code = read_program(code)
+    return Assembler(code, constant_pool if constant_pool is not None else table).assemble()
+
+# Turns bytecode back into PixIR text lines, with the constants and label names of its header. Labels that
+# share an offset are all defined again, in order, and each instruction referring to that offset gets back
+# the name it was written with.
+def disassemble(data):
+    reader = Reader(data)
+    if reader.bytes(len(MAGIC)) != MAGIC:
+        raise BytecodeError("Not PixIR bytecode.")
+    version = reader.byte()
+    if version != VERSION:
+        raise BytecodeError(f"Unsupported bytecode version {version}.")
+
+    constants = []
+    for _ in range(reader.varint()):
+        kind = reader.byte()
+        if kind == COLOUR_CONSTANT:
+            constants.append("#" + reader.bytes(3).hex())
+        elif kind == FLOAT_CONSTANT:
+            constants.append(str(struct.unpack("<d", reader.bytes(8))[0]))
+        elif kind == TEXT_CONSTANT:
+            constants.append(reader.bytes(reader.varint()).decode("utf-8"))
+        else:
+            raise BytecodeError(f"Unknown constant kind {kind}.")
+
+    labels = {}
+    for _ in range(reader.varint()):
+        offset = reader.varint()
+        name = reader.bytes(reader.varint()).decode("utf-8")
+        labels.setdefault(offset, []).append(name)
+
+    # Instructions naming a label other than the first at its offset, with the position of that name
+    aliases = {}
+    for _ in range(reader.varint()):
+        position = reader.varint()
+        aliases[position] = reader.varint()
+
+    code = []
+    body = Reader(reader.bytes(reader.varint()))
+    while body.position < len(body.data):
+        code += labels.get(body.position, [])
+        position = body.position
+        opcode = body.byte()
+        if opcode in MNEMONICS:
+            code.append(MNEMONICS[opcode])
+        elif opcode == PUSH_INT:
+            code.append(f"push {unzigzag(body.varint())}")
+        elif opcode == PUSH_CONSTANT:
+            index = body.varint()
+            if index >= len(constants):
+                raise BytecodeError(f"Constant {index} is not in the pool.")
+            code.append(f"push {constants[index]}")
+        elif opcode in LABEL_INSTRUCTIONS:
+            offset = body.varint()
+            names = labels.get(offset, [])
+            if aliases.get(position, 0) >= len(names):
+                raise BytecodeError(f"No label at offset {offset}.")
+            code.append(f"{LABEL_INSTRUCTIONS[opcode]} {names[aliases.get(position, 0)]}")
+        else:
+            raise BytecodeError(f"Unknown opcode {opcode}.")
+    code += labels.get(body.position, [])
+    return code
@@ -0,0 +1,212 @@
+# Basic-block IR between the AST and PixIR text. The code generator emits straight-line instructions into
+# basic blocks and ends each block with an explicit terminator; the graph can then be cleaned up and laid
+# out before it is turned into PixIR, where every label is unique.
+
+###########################################################################################################################################
+
+# Terminators. A block ends in exactly one of them, and they are the only source of control-flow edges.
+class Jump:
+    def __init__(self, target):
+        self.target = target
+
+    def successors(self):
+        return [self.target]
+
+class Branch:
+    # PixIR's cjmp jumps when the condition on the stack is false and falls through when it is true
+    def __init__(self, if_false, if_true):
+        self.if_false = if_false
+        self.if_true = if_true
+
+    def successors(self):
+        return [self.if_false, self.if_true]
+
+class Return:
+    def successors(self):
+        return []
+
+###########################################################################################################################################
+
+class BasicBlock:
+    def __init__(self, label):
+        # Unique label the block starts with, e.g. '.WHILE_START_3'
+        self.label = label
+        # Straight-line PixIR instructions, without labels or jumps
+        self.instructions = []
+        # How control leaves the block; None while the block is still being filled
+        self.terminator = None
+
+    def successors(self):
+        return self.terminator.successors() if self.terminator is not None else []
+
+    def __repr__(self):
+        return f"BasicBlock({self.label})"
+
+###########################################################################################################################################
+
+class ControlFlowGraph:
+    def __init__(self):
+        # Every block, in the order it was created
+        self.blocks = []
+        # Blocks control can enter from outside: the program entry and each function entry
+        self.roots = []
+        # Counter used to number labels so that none is ever reused
+        self.label_count = 0
+        self.entry = self.new_block("ENTRY")
+        self.roots.append(self.entry)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Creates a block whose label is the given name plus a unique number (or exactly the name, if numbered is False)
+    def new_block(self, name, numbered=True):
+        if numbered:
+            self.label_count += 1
+            name = f"{name}_{self.label_count}"
+        block = BasicBlock(f".{name}")
+        self.blocks.append(block)
+        return block
+
+    # Blocks reachable from the roots (or from the given ones), in depth-first order
+    def reachable(self, roots=None):
+        seen = set()
+        order = []
+        stack = list(reversed(self.roots if roots is None else roots))
+        while stack:
+            block = stack.pop()
+            if id(block) in seen:
+                continue
+            seen.add(id(block))
+            order.append(block)
+            stack.extend(reversed(block.successors()))
+        return order
+
+    def predecessors(self):
+        predecessors = {id(block): [] for block in self.blocks}
+        for block in self.blocks:
+            for successor in block.successors():
+                predecessors[id(successor)].append(block)
+        return predecessors
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Dead-code elimination: drops every block control can never reach
+    def remove_unreachable(self):
+        reachable = {id(block) for block in self.reachable()}
+        removed = len(self.blocks) - len(reachable)
+        self.blocks = [block for block in self.blocks if id(block) in reachable]
+        return removed
+
+    # Jump threading: an edge into an empty block that only jumps on goes straight to where that block jumps
+    def thread_jumps(self):
+        threaded = 0
+
+        def final_target(block):
+            seen = set()
+            while not block.instructions and isinstance(block.terminator, Jump) and id(block) not in seen \
+                    and block not in self.roots:
+                seen.add(id(block))
+                block = block.terminator.target
+            return block
+
+        for block in self.blocks:
+            terminator = block.terminator
+            if isinstance(terminator, Jump):
+                target = final_target(terminator.target)
+                if target is not terminator.target:
+                    terminator.target = target
+                    threaded += 1
+            elif isinstance(terminator, Branch):
+                for attribute in ("if_false", "if_true"):
+                    target = final_target(getattr(terminator, attribute))
+                    if target is not getattr(terminator, attribute):
+                        setattr(terminator, attribute, target)
+                        threaded += 1
+                # Both ways lead to the same place: the condition only has to be popped
+                if terminator.if_false is terminator.if_true:
+                    block.instructions.append("drop")
+                    block.terminator = Jump(terminator.if_true)
+        return threaded
+
+    # Appends a block to its only predecessor when that predecessor jumps straight to it
+    def merge_blocks(self):
+        merged = 0
+        predecessors = self.predecessors()
+        removed = set()
+        for block in self.blocks:
+            if id(block) in removed:
+                continue
+            while isinstance(block.terminator, Jump):
+                target = block.terminator.target
+                if target is block or target in self.roots or len(predecessors[id(target)]) != 1:
+                    break
+                block.instructions.extend(target.instructions)
+                block.terminator = target.terminator
+                for successor in target.successors():
+                    predecessors[id(successor)] = [block if predecessor is target else predecessor
+                                                   for predecessor in predecessors[id(successor)]]
+                removed.add(id(target))
+                merged += 1
+        self.blocks = [block for block in self.blocks if id(block) not in removed]
+        return merged
+
+    # Block layout: chains each block with the successor it falls through to, so those edges need no jump.
+    # The blocks of each root are placed together, so every function's code is one piece.
+    def layout(self):
+        placed = set()
+        order = []
+        starts = []
+        for root in self.roots:
+            region = {id(block) for block in self.reachable([root])}
+            starts += [root] + [block for block in self.blocks if id(block) in region]
+        for start in starts + self.blocks:
+            block = start
+            while block is not None and id(block) not in placed:
+                placed.add(id(block))
+                order.append(block)
+                terminator = block.terminator
+                if isinstance(terminator, Jump):
+                    block = terminator.target
+                elif isinstance(terminator, Branch):
+                    block = terminator.if_true
+                else:
+                    block = None
+        self.blocks = order
+
+    # Runs the clean-up passes until they stop finding work, then lays the blocks out
+    def optimize(self):
+        while self.remove_unreachable() + self.thread_jumps() + self.merge_blocks():
+            pass
+        self.layout()
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Turns the blocks, in their current order, into PixIR lines. Jumps to the next block are left out, and
+    # so are labels nothing refers to, so that straight-line code stays in one piece for the peephole optimizer.
+    def emit(self):
+        bodies = []
+        referenced = {block.label for block in self.roots[1:]}
+        for index, block in enumerate(self.blocks):
+            following = self.blocks[index + 1] if index + 1 < len(self.blocks) else None
+            body = list(block.instructions)
+
+            terminator = block.terminator
+            if isinstance(terminator, Jump):
+                if terminator.target is not following:
+                    body.append(f"jmp {terminator.target.label}")
+                    referenced.add(terminator.target.label)
+            elif isinstance(terminator, Branch):
+                body.append(f"cjmp {terminator.if_false.label}")
+                referenced.add(terminator.if_false.label)
+                if terminator.if_true is not following:
+                    body.append(f"jmp {terminator.if_true.label}")
+                    referenced.add(terminator.if_true.label)
+            elif isinstance(terminator, Return):
+                body.append("ret")
+            bodies.append(body)
+
+        code = []
+        for block, body in zip(self.blocks, bodies):
+            if block.label in referenced:
+                code.append(block.label)
+            code.extend(body)
+        return code
@@ -2,38 +2,61 @@
 from lexer import *
 from parser_ import *
 from semantic_analyser import *
+from inlining import FunctionInliner
+from constant_folding import ConstantFolder, IMPURE_TAGS
+from constant_propagation import ConstantPropagator
+from pixel_coalescing import PixelCoalescer
+from frame_optimization import FrameOptimizer
+from peephole import PeepholeOptimizer
+from slot_allocation import SlotAllocator, VIRTUAL_SLOT_PREFIX, virtual_slot
+from ssa import SSAOptimizer
+from dead_code import DeadCodeEliminator
+from cse import CommonSubexpressionEliminator
+from constant_pool import ConstantPool
+from bytecode import assemble, disassemble, BytecodeError
+from cfg import ControlFlowGraph, Jump, Branch, Return
+from visitor import ASTVisitor, VisitorError, iter_nodes
 
 # Custom exception class for code generation errors
-class CodeGenerationError(Exception):
+class CodeGenerationError(VisitorError):
     def __init__(self, message="An error occurred during code generation."):
         self.message = message
         super().__init__(self.message)
 
-class PixIRCodeGenerator:
-    def __init__(self, ast):
+class PixIRCodeGenerator(ASTVisitor):
+    def __init__(self, ast, expression_types=None, optimize=True):
         # The abstract syntax tree to be traversed
         self.ast = ast
-        # List of generated code lines
-        self.code = []
-        # Offset to track the relative position of variables in memory
+        # Types resolved for each expression node during semantic analysis
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Basic blocks of the program; code is emitted into the current block until a jump or return ends it
+        self.cfg = ControlFlowGraph()
+        self.block = self.cfg.entry
+        # List of generated code lines, which is the current block's instruction list while generating
+        self.code = self.block.instructions
+        # Number of virtual slots handed out; frame slots are assigned from them once the code is complete
         self.frame_offset = 0
-        # Dictionary to store variables and their corresponding offsets
+        # Dictionary to store variables and their corresponding offsets, for the frame being generated
         self.variables = {} 
+        # Variables of the program's own frame, which function bodies reach at frame level 1
+        self.program_variables = self.variables
+        # Parameter slots of every function, by the label of its entry block
+        self.function_parameters = {}
+        # Declared type of the variable in each virtual slot, and parameter and return types of each function
+        self.slot_types = {}
+        self.function_types = {}
+        # Colour, float and string literals of the program, each encoded once
+        self.constant_pool = ConstantPool()
+        # Whether to run the peephole optimizer over the generated code
+        self.optimize = optimize
+        # Name, parameter slots and body start block of the function being generated, if any
+        self.function = None
         
     #---------------------------------------------------------------------------------------------------------------------------------------
         
-    def visit(self, node):
-        # Check if the node is a tuple. If so, it's a node we can visit.
-        if isinstance(node, tuple):
-            # Generate method name for visiting this node type
-            method_name = f'visit_{node[0]}'
-            # Try to get the method from the current instance, if it doesn't exist, use generic_visit method
-            visitor = getattr(self, method_name, self.generic_visit)
-            # Call the method and return its result
-            return visitor(node)
-        else:
-            # If the node is not a tuple, raise an error indicating the node type is unsupported
-            raise CodeGenerationError(f"Unsupported node type '{type(node).__name__}'.")
+    def unsupported_node(self, node):
+        # If the node is not a tuple, raise an error indicating the node type is unsupported
+        raise CodeGenerationError(f"Unsupported node type '{type(node).__name__}'.")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
         
@@ -44,13 +67,41 @@ class PixIRCodeGenerator:
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
+    def type_of(self, node):
+        # Look up the type semantic analysis recorded for the expression, instead of re-deriving it
+        return self.expression_types.lookup(node)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    
+    # Hands out the next virtual slot, e.g. '$3'; SlotAllocator maps it to a frame slot
+    def new_slot(self):
+        slot = f"{VIRTUAL_SLOT_PREFIX}{self.frame_offset}"
+        self.frame_offset += 1
+        return slot
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Continues emitting code into the given block
+    def start_block(self, block):
+        self.block = block
+        self.code = block.instructions
+
+    # Ends the current block with a jump, branch or return. Code that follows goes into a fresh block
+    # nothing jumps to, which dead-code elimination removes.
+    def end_block(self, terminator):
+        self.block.terminator = terminator
+        self.start_block(self.cfg.new_block("UNREACHABLE"))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    
     def get_var_offset(self, name):
-        # Check if the variable has been declared
-        if name not in self.variables:
-            # If not, raise an error
-            raise CodeGenerationError(f"Variable '{name}' has not been declared.")
-        # If the variable has been declared, return its offset
-        return self.variables[name]
+        # Variables of the current frame are at level 0; inside a function, the program's are one level out
+        if name in self.variables:
+            return self.variables[name], 0
+        if self.function is not None and name in self.program_variables:
+            return self.program_variables[name], 1
+        # Anything else has not been declared, or belongs to an enclosing function's frame
+        raise CodeGenerationError(f"Variable '{name}' has not been declared.")
     
     #---------------------------------------------------------------------------------------------------------------------------------------
         
@@ -58,23 +109,18 @@ class PixIRCodeGenerator:
         # Unpack the node, which contains the data type, name and expression of the variable to be declared
         _, data_type, name, expression = node
         
-        # Visit the expression node to evaluate its value
-        self.visit(expression)
-        
-        # Generate PixIR code to allocate memory for the variable
-        self.code.append("push 1")
-        self.code.append("alloc")
+        # Evaluate the expression as a value of the variable's type
+        declared_type = resolve_type(data_type)
+        self.visit_as(expression, declared_type)
 
-        # Generate PixIR code to store the evaluated value in the allocated memory
-        self.code.append(f"push {self.frame_offset}")
+        # Give the variable a virtual slot; the frame itself is allocated once, after liveness analysis
+        self.variables[name] = self.new_slot()
+        self.slot_types[self.variables[name]] = declared_type
+
+        # Generate PixIR code to store the evaluated value in the variable's slot
+        self.code.append(f"push {self.variables[name]}")
         self.code.append("push 0")
         self.code.append("st")
-
-        # Save the frame offset of the declared variable in the variables dictionary
-        self.variables[name] = self.frame_offset
-
-        # Increment the frame offset for the next variable
-        self.frame_offset += 1
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -82,47 +128,59 @@ class PixIRCodeGenerator:
         # Unpack the node, which contains the name and expression of the variable to be assigned
         _, name, expression = node
         
-        # Visit the expression node to evaluate its value
-        self.visit(expression)
+        # Get the frame offset and frame level of the variable to be assigned
+        var_offset, level = self.get_var_offset(name)
 
-        # Get the frame offset of the variable to be assigned
-        var_offset = self.get_var_offset(name)
+        # Evaluate the expression as a value of the variable's type
+        self.visit_as(expression, self.slot_types.get(var_offset))
 
         # Generate PixIR code to store the evaluated value in the memory location of the variable
         self.code.append(f"push {var_offset}")
-        self.code.append("push 0")
+        self.code.append(f"push {level}")
         self.code.append("st")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
     def visit_PLUS(self, node):
         # Visit the nodes of the operands of the plus operation to evaluate their values
-        self.visit(node[1])
-        self.visit(node[2])
+        self.visit_operands(node[1], node[2], self.type_of(node))
 
         # Generate PixIR code to perform the addition operation
         self.code.append("add")
 
     def visit_MUL(self, node):
         # Visit the nodes of the operands of the multiplication operation to evaluate their values
-        self.visit(node[1])
-        self.visit(node[2])
+        self.visit_operands(node[1], node[2], self.type_of(node))
 
         # Generate PixIR code to perform the multiplication operation
         self.code.append("mul")
 
+    # Evaluates both operands of an arithmetic or comparison operator as values of the type they promote to
+    def visit_operands(self, left_expr, right_expr, data_type):
+        self.visit_as(left_expr, data_type)
+        self.visit_as(right_expr, data_type)
+
+    # Evaluates an expression as a value of the given type. The PAD promotes an int to a float when it meets
+    # one; an int literal used as a float is pushed as the float itself, so that the conversion happens here
+    # rather than at run time. Other ints are left for the PAD to promote, as PixIR has no conversion instruction.
+    def visit_as(self, node, data_type):
+        if data_type is FLOAT and node[0] == "INTEGER_LITERAL":
+            self.code.append(f"push {self.constant_pool.literal('FLOAT_LITERAL', float(node[1]))}")
+        else:
+            self.visit(node)
+
     #---------------------------------------------------------------------------------------------------------------------------------------    
     
     def visit_VARIABLE(self, node):
         # Unpack the node, which contains the name of the variable
         _, name = node
         
-        # Get the frame offset of the variable
-        var_offset = self.get_var_offset(name)
+        # Get the frame offset and frame level of the variable
+        var_offset, level = self.get_var_offset(name)
 
         # Generate PixIR code to load the value of the variable from memory
         self.code.append(f"push {var_offset}")
-        self.code.append("push 0")
+        self.code.append(f"push {level}")
         self.code.append("ld")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
@@ -141,7 +199,7 @@ class PixIRCodeGenerator:
         _, value = node
         
         # Generate PixIR code to push the float value onto the stack
-        self.code.append(f"push {value}")
+        self.code.append(f"push {self.constant_pool.literal('FLOAT_LITERAL', value)}")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -159,7 +217,7 @@ class PixIRCodeGenerator:
         _, value = node
         
         # Generate PixIR code to push the color value onto the stack
-        self.code.append(f"push {value}")
+        self.code.append(f"push {self.constant_pool.literal('COLOR_LITERAL', value)}")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -167,11 +225,9 @@ class PixIRCodeGenerator:
         # Unpack the node, which contains the string value
         _, value = node
         
-        # Encode the string value into a comma-separated string of ordinal values
-        encoded_string = ",".join(str(ord(char)) for char in value)
-        
-        # Generate PixIR code to push the encoded string onto the stack
-        self.code.append(f'push "{encoded_string}"')
+        # Generate PixIR code to push the string, encoded as a comma-separated string of ordinal values the
+        # first time it appears
+        self.code.append(f"push {self.constant_pool.literal('STRING_LITERAL', value)}")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -264,11 +320,11 @@ class PixIRCodeGenerator:
     def visit_IDENTIFIER(self, node):
         # Unpack the node, which contains the name of the identifier
         _, name = node
-        var_offset = self.get_var_offset(name)
+        var_offset, level = self.get_var_offset(name)
 
         # Generate PixIR code to load the value of the identifier from memory
         self.code.append(f"push {var_offset}")
-        self.code.append("push 0")
+        self.code.append(f"push {level}")
         self.code.append("ld")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
@@ -283,61 +339,158 @@ class PixIRCodeGenerator:
             
     #---------------------------------------------------------------------------------------------------------------------------------------
     
+    # PixIR instruction for each comparison operator
+    COMPARISON_INSTRUCTIONS = {
+        "<": "lt",
+        "<=": "le",
+        ">": "gt",
+        ">=": "ge",
+        "==": "eq",
+        "!=": "neq",
+    }
+
     def visit_RELATIONAL_OPERATOR(self, node):
-        # Unpack the node, which contains the left and right expressions for the relational operator
-        _, left_expr, right_expr = node
-
-        # Determine the type of the operator based on the types of the left and right expressions
-        if left_expr[0] == "IDENTIFIER" and right_expr[0] == "INTEGER_LITERAL":
-            operator = ">"
-        elif left_expr[0] == "INTEGER_LITERAL" and right_expr[0] == "IDENTIFIER":
-            operator = "<"
-        else:
-            raise CodeGenerationError(f"Unsupported relational operator between {left_expr[0]} and {right_expr[0]}.")
+        # Unpack the node, which contains the left and right expressions and the operator itself
+        _, left_expr, right_expr, operator = node
 
-        # Visit the left and right expression nodes to evaluate their values
-        self.visit(left_expr)
-        self.visit(right_expr)
+        # Ordering only makes sense for numbers; the operand types were resolved during semantic analysis
+        if operator in ("<", "<=", ">", ">="):
+            for operand in (left_expr, right_expr):
+                data_type = self.type_of(operand)
+                if data_type is not None and not data_type.is_numeric:
+                    raise CodeGenerationError(f"Unsupported operand of type '{data_type}' for relational operator '{operator}'.")
 
         # Add the appropriate operation to the code based on the operator
-        if operator == "<":
-            self.code.append("lt")
-        elif operator == "<=":
-            self.code.append("le")
-        elif operator == ">":
-            self.code.append("gt")
-        elif operator == ">=":
-            self.code.append("ge")
-        elif operator == "==":
-            self.code.append("eq")
-        elif operator == "!=":
-            self.code.append("neq")
-        else:
+        if operator not in self.COMPARISON_INSTRUCTIONS:
             raise CodeGenerationError(f"Unsupported relational operator '{operator}'.")
-        
+
+        # Comparing a bool with true or false is the bool itself or its negation
+        boolean = self.boolean_comparison(node)
+        if boolean is not None:
+            operand, negated = boolean
+            self.visit(operand)
+            if negated:
+                self.code.append("not")
+            return
+
+        # Visit the left and right expression nodes to evaluate their values, promoted to a common type
+        self.visit_operands(left_expr, right_expr, join(self.type_of(left_expr), self.type_of(right_expr)))
+        self.code.append(self.COMPARISON_INSTRUCTIONS[operator])
+
+    # For 'b == true', 'false != b' and the like, returns the bool operand and whether the comparison is its
+    # negation; returns None for any other comparison
+    def boolean_comparison(self, node):
+        _, left_expr, right_expr, operator = node
+        if operator not in ("==", "!="):
+            return None
+        for literal, operand in ((left_expr, right_expr), (right_expr, left_expr)):
+            if literal[0] == "BOOLEAN_LITERAL" and self.type_of(operand) is BOOL:
+                return operand, (operator == "==") != bool(literal[1])
+        return None
+
+    def visit_EQUALITY_OPERATOR(self, node):
+        # Equality shares the comparison instructions of the relational operators
+        self.visit_RELATIONAL_OPERATOR(node)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # PixIR instruction for each logical operator that evaluates both of its operands
+    LOGICAL_INSTRUCTIONS = {"and": "and", "or": "or"}
+
+    def visit_LOGICAL_AND(self, node):
+        self.visit_logical(node[1], node[2], "and")
+
+    def visit_LOGICAL_OPERATOR(self, node):
+        _, left_expr, right_expr, operator = node
+        if operator not in self.LOGICAL_INSTRUCTIONS:
+            raise CodeGenerationError(f"Unsupported logical operator '{operator}'.")
+        self.visit_logical(left_expr, right_expr, operator)
+
+    # The value of 'and' or 'or'. A right operand without side effects costs less to evaluate than the
+    # branches that would skip it, so both operands are evaluated and combined by 'and'/'or'. Otherwise
+    # the right operand must only run when the left one leaves the result open: the operator is compiled
+    # as a condition whose two outcomes store 1 or 0 in a temporary, which is loaded where they meet.
+    def visit_logical(self, left_expr, right_expr, operator):
+        if self.is_pure(right_expr):
+            self.visit(left_expr)
+            self.visit(right_expr)
+            self.code.append(self.LOGICAL_INSTRUCTIONS[operator])
+            return
+
+        if_true = self.cfg.new_block("LOGICAL_TRUE")
+        if_false = self.cfg.new_block("LOGICAL_FALSE")
+        end = self.cfg.new_block("LOGICAL_END")
+        result = self.new_slot()
+        self.visit_condition(("LOGICAL_OPERATOR", left_expr, right_expr, operator), if_true, if_false)
+
+        for block, value in ((if_true, 1), (if_false, 0)):
+            self.start_block(block)
+            self.code += [f"push {value}", f"push {result}", "push 0", "st"]
+            self.end_block(Jump(end))
+
+        self.start_block(end)
+        self.code += [f"push {result}", "push 0", "ld"]
+
+    def is_pure(self, node):
+        return all(child[0] not in IMPURE_TAGS for child in iter_nodes(node))
+
+    # Ends the current block by branching on a condition, to if_true when it holds and to if_false when it
+    # does not, without computing its value as a boolean first. 'and' and 'or' short-circuit: the left
+    # operand branches straight to the outcome it decides and otherwise on to the code of the right operand.
+    # cjmp jumps on false, so by default the code falls through towards if_true; with jump_if_true the
+    # condition's last test is reversed so that it jumps to if_true and falls through towards if_false.
+    def visit_condition(self, node, if_true, if_false, jump_if_true=False):
+        operator = "and" if node[0] == "LOGICAL_AND" else node[3] if node[0] == "LOGICAL_OPERATOR" else None
+        if operator in ("and", "or"):
+            right = self.cfg.new_block("CONDITION")
+            if operator == "and":
+                # A false left operand makes the whole condition false
+                self.visit_condition(node[1], right, if_false)
+            else:
+                # A true left operand makes the whole condition true
+                self.visit_condition(node[1], if_true, right, jump_if_true=True)
+            self.start_block(right)
+            self.visit_condition(node[2], if_true, if_false, jump_if_true)
+        elif node[0] == "BOOLEAN_LITERAL":
+            self.end_block(Jump(if_true if node[1] else if_false))
+        elif node[0] in ("RELATIONAL_OPERATOR", "EQUALITY_OPERATOR") and self.boolean_comparison(node) is not None:
+            # Branching on the negation of a bool is branching on the bool with the outcomes swapped, which
+            # needs no 'not' when the bool is tested as it is
+            operand, negated = self.boolean_comparison(node)
+            if negated:
+                self.visit_condition(operand, if_false, if_true)
+            else:
+                self.visit_condition(operand, if_true, if_false, jump_if_true)
+        elif jump_if_true:
+            self.visit_negated(node)
+            self.end_block(Branch(if_false=if_true, if_true=if_false))
+        else:
+            self.visit(node)
+            self.end_block(Branch(if_false=if_false, if_true=if_true))
+
     #---------------------------------------------------------------------------------------------------------------------------------------
 
     def visit_WHILE(self, node):
         # Unpack the node, which contains the condition and body for the while loop
         _, condition, body = node
+        start = self.cfg.new_block("WHILE_START")
+        loop_body = self.cfg.new_block("WHILE_BODY")
+        end = self.cfg.new_block("WHILE_END")
 
-        # Generate PixIR code to mark the start of the loop
-        self.code.append(".WHILE_START")  
+        # The condition is checked at the start of the loop
+        self.end_block(Jump(start))
+        self.start_block(start)
 
-        # Visit the condition node to evaluate its value
-        self.visit(condition)
+        # Jump to the end of the loop if the condition is false, otherwise run the body
+        self.visit_condition(condition, loop_body, end)
 
-        # Generate PixIR code to jump to the end of the loop if the condition is false
-        self.code.append("cjmp .WHILE_END")
-
-        # Visit the body node to generate PixIR code for the body of the loop
+        # Generate the body, then jump back to the start of the loop
+        self.start_block(loop_body)
         self.visit(body)
+        self.end_block(Jump(start))
 
-        # Generate PixIR code to jump back to the start of the loop
-        self.code.append("jmp .WHILE_START")
-
-        # Generate PixIR code to mark the end of the loop
-        self.code.append(".WHILE_END")
+        # Code after the loop continues at its end
+        self.start_block(end)
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -347,130 +500,327 @@ class PixIRCodeGenerator:
 
         # Visit each statement node to generate PixIR code for each statement
         for statement in statements:
-            self.visit(statement)
+            self.visit_statement(statement)
+
+    # A call made as a statement leaves the function's result on the stack, where nothing uses it
+    def visit_statement(self, node):
+        self.visit(node)
+        if node[0] == "FUNCTION_CALL":
+            self.code.append("drop")
             
     #---------------------------------------------------------------------------------------------------------------------------------------
 
     def visit_IF(self, node):
         # Unpack the node, which contains the condition, if block, and else block for the if statement
         _, condition, if_block, *else_block = node
+        then_block = self.cfg.new_block("THEN")
+        else_start = self.cfg.new_block("ELSE") if else_block else None
+        end = self.cfg.new_block("ENDIF")
 
-        # Visit the condition node to evaluate its value
-        self.visit(condition)
-
-        # Generate PixIR code to jump to the else block if the condition is false
-        self.code.append("cjmp .ELSE")
+        # Branch on the condition, to the else block (or past the if statement) if it is false
+        self.visit_condition(condition, then_block, else_start or end)
 
-        # Visit the if block node to generate PixIR code for the if block
+        # Generate the if block, then jump to the end of the if statement
+        self.start_block(then_block)
         self.visit(if_block)
+        self.end_block(Jump(end))
 
-        # Generate PixIR code to jump to the end of the if statement if the if block was executed
-        self.code.append("jmp .ENDIF")
-
-        # If there is an else block, visit the else block node to generate PixIR code for the else block
+        # If there is an else block, generate it in its own block
         if else_block:
+            self.start_block(else_start)
             self.visit(else_block[0])
+            self.end_block(Jump(end))
 
-        # Generate PixIR code to mark the end of the if statement
-        self.code.append(".ENDIF")
+        # Code after the if statement continues at its end
+        self.start_block(end)
         
     def visit_ELSE(self, node):
-        _, _, else_block = node
-
-        # This label will be jumped to if the condition in the IF statement was false
-        self.code.append(".ELSE")
+        # The label of the else block is placed by visit_IF; only its statements are generated here
+        else_block = node[-1]
 
         # Visit the ELSE block
         self.visit(else_block)
 
     #---------------------------------------------------------------------------------------------------------------------------------------
     
+    # Calling convention: the caller pushes the arguments in order, then their number and the function's
+    # label, and 'call' moves the arguments into slots 0, 1, ... of a new frame for the callee. The callee
+    # allocates the rest of its frame on entry, reaches its own slots at frame level 0 and the program's at
+    # level 1, and 'ret' closes its frame and returns with the result on top of the stack.
     def visit_FUNCTION_DEF(self, node):
         _, function_name, parameters, return_type, body = node
 
-        # Generate a label for the function name
-        self.code.append(f".{function_name}")
-
-        # Add parameters to the variable environment and adjust the frame offset
+        # The function gets its own entry block, labelled with the function name, outside the code around it
+        caller_block = self.block
+        caller_function = self.function
+        caller_variables = self.variables
+        entry = self.cfg.new_block(function_name, numbered=False)
+        self.cfg.roots.append(entry)
+        self.start_block(entry)
+
+        # The function's frame starts with its parameters, each with its own virtual slot
+        self.variables = {}
+        parameter_slots = []
         for parameter in parameters:
-            name, type_ = parameter
-            self.variables[name] = self.frame_offset
-            self.frame_offset += 1
+            name = parameter[0] if isinstance(parameter, tuple) else parameter
+            self.variables[name] = self.new_slot()
+            parameter_slots.append(self.variables[name])
+        for slot, parameter_type in zip(parameter_slots, self.function_types[function_name][0]):
+            self.slot_types[slot] = parameter_type
+        self.function_parameters[entry.label] = parameter_slots
+
+        # Tail calls of the function to itself jump back to the start of its body
+        start = self.cfg.new_block(f"{function_name}_START")
+        self.end_block(Jump(start))
+        self.start_block(start)
+        self.function = (function_name, parameter_slots, start)
 
         # Generate code for the function body
         self.visit(body)
 
-        # Add a return statement if not already present in the body
-        if body[-1][0] != "RETURN":
-            self.code.append("ret")
+        # A body that runs off its end still returns a value, so that every call leaves exactly one
+        self.code.append("push 0")
+        self.end_block(Return())
+
+        # Carry on generating the code around the definition
+        self.function = caller_function
+        self.variables = caller_variables
+        self.start_block(caller_block)
 
     def visit_RETURN(self, node):
         _, expression = node
+        if self.is_tail_call(expression):
+            self.tail_call(expression)
+            return
+
+        # Generate code to evaluate the returned expression onto the stack, as a value of the return type
         if expression is not None:
-            # Generate code to load the value of the returned variable onto the stack
-            name = expression[1]
-            var_offset = self.get_var_offset(name)
-            self.code.append(f"push {var_offset}")
+            self.visit_as(expression, self.function_types[self.function[0]][1] if self.function is not None else None)
+        else:
+            self.code.append("push 0")
+
+        self.end_block(Return())
+
+    def visit_FUNCTION_CALL(self, node):
+        _, function_name, arguments = node
+
+        # Evaluate the arguments from left to right, as values of the parameter types; they become the first
+        # slots of the callee's frame
+        parameter_types = self.function_types.get(function_name, ([], None))[0]
+        for index, argument in enumerate(arguments):
+            self.visit_as(argument, parameter_types[index] if index < len(parameter_types) else None)
+
+        # Call the function, which leaves its result on the stack
+        self.code.append(f"push {len(arguments)}")
+        self.code.append(f"push .{function_name}")
+        self.code.append("call")
+
+    # Whether a returned expression is a call of the function it is returned from
+    def is_tail_call(self, expression):
+        return self.function is not None and isinstance(expression, tuple) and expression[0] == "FUNCTION_CALL" \
+            and expression[1] == self.function[0]
+
+    # Compiles 'return f(...)' inside f as a loop: the arguments are evaluated, stored over the parameters
+    # and the body starts again, so recursion in tail position runs in constant frame space
+    def tail_call(self, node):
+        _, function_name, arguments = node
+        _, parameter_slots, start = self.function
+
+        # All arguments are evaluated before any parameter changes, as they may read the parameters
+        for argument, slot in zip(arguments, parameter_slots):
+            self.visit_as(argument, self.slot_types.get(slot))
+        for slot in reversed(parameter_slots):
+            self.code.append(f"push {slot}")
             self.code.append("push 0")
-            self.code.append("ld")
+            self.code.append("st")
 
-        self.code.append("ret")
+        self.end_block(Jump(start))
 
     #---------------------------------------------------------------------------------------------------------------------------------------
     
-    # ToDo For loop 
+    # Opposite of each comparison operator
+    NEGATED_COMPARISONS = {"<": ">=", ">=": "<", ">": "<=", "<=": ">", "==": "!=", "!=": "=="}
+
+    def visit_FOR(self, node):
+        # Unpack the node, which contains the initialisation, condition, update and body of the loop
+        _, initialization, condition, update, body = node
+        loop_body = self.cfg.new_block("FOR_BODY")
+        end = self.cfg.new_block("FOR_END")
+
+        # A variable declared by the loop gets a slot of its own, visible only inside the loop
+        declared = initialization[2] if initialization[0] == "DECLARATION" else None
+        outer_slot = self.variables.get(declared)
+        self.visit(initialization)
+
+        # The condition is tested once before the first iteration, to skip the loop altogether
+        self.visit_condition(condition, loop_body, end)
+
+        # Generate the body and the update. The condition is tested again at the bottom with its outcome
+        # reversed, so that cjmp jumps back to the body while it holds and falls through to the end of the
+        # loop: every iteration runs one compare-and-branch and no jump.
+        self.start_block(loop_body)
+        self.visit(body)
+        self.visit(update)
+        self.visit_condition(condition, loop_body, end, jump_if_true=True)
+
+        # Code after the loop continues at its end, where the loop variable is out of scope again
+        self.start_block(end)
+        if declared is not None:
+            if outer_slot is None:
+                del self.variables[declared]
+            else:
+                self.variables[declared] = outer_slot
+
+    # Evaluates the negation of a condition. Comparisons are turned round where that gives the same result,
+    # which for ordering needs integer operands; anything else is followed by 'not'.
+    def visit_negated(self, node):
+        if node[0] in ("RELATIONAL_OPERATOR", "EQUALITY_OPERATOR") and node[3] in self.NEGATED_COMPARISONS:
+            _, left_expr, right_expr, operator = node
+            if operator in ("==", "!=") or (self.type_of(left_expr) == INT and self.type_of(right_expr) == INT):
+                self.visit_RELATIONAL_OPERATOR((node[0], left_expr, right_expr, self.NEGATED_COMPARISONS[operator]))
+                return
+        self.visit(node)
+        self.code.append("not")
     
     #---------------------------------------------------------------------------------------------------------------------------------------
 
+    # Parameter and return types of a function, None where they are not given
+    def signature(self, node):
+        _, _, parameters, return_type, _ = node
+        parameter_types = [resolve_type(parameter[1]) if isinstance(parameter, tuple) else None for parameter in parameters]
+        return parameter_types, resolve_type(return_type) if return_type is not None else None
+
     def generate(self):
+        # Calls may come before the definitions of the functions they call
+        for node in iter_nodes(self.ast):
+            if node[0] == "FUNCTION_DEF":
+                self.function_types[node[1]] = self.signature(node)
+
         # Loop over each node in the abstract syntax tree (AST)
         for node in self.ast:
             # Call the visit method to generate PixIR code for each node
-            self.visit(node)
-        
-        # Append the 'ret' instruction to the end of the code to mark the end of the program
-        self.code.append("ret")
-
-        # Join all the PixIR code lines with new line characters and return the result
-        return "\n".join(self.code)
+            self.visit_statement(node)
+        
+        # End the program with a 'ret' instruction
+        self.end_block(Return())
+
+        # Remove unreachable blocks, thread jumps and lay the blocks out, then turn them into PixIR lines
+        if self.optimize:
+            self.cfg.optimize()
+            # Rename variables into SSA form, optimize the values and turn them back into stack code
+            self.ssa_optimizer = SSAOptimizer(self.cfg, self.new_slot)
+            self.ssa_optimizer.optimize()
+            # Drop constant branches, stores nothing reads and side-effect free values computed only to be dropped
+            self.dead_code_eliminator = DeadCodeEliminator(self.cfg)
+            self.dead_code_eliminator.eliminate()
+            # Compute values repeated within a block once, where keeping them in a temporary pays
+            self.cse = CommonSubexpressionEliminator(self.cfg, self.new_slot)
+            self.cse.eliminate()
+            self.cfg.optimize()
+        else:
+            # Layout keeps each function's blocks together, so that its frame's code is in one piece
+            self.cfg.remove_unreachable()
+            self.cfg.layout()
+        self.code = self.cfg.emit()
+
+        # Rewrite redundant instruction sequences before the code is joined
+        if self.optimize:
+            self.code = PeepholeOptimizer(self.code).optimize()
+
+        # Map variables to frame slots, sharing slots between variables that are never live together
+        self.code = self.allocate_frames(self.code)
+
+        # The constant table lists the literals the finished code uses
+        self.constant_pool.rebuild(self.code)
+
+        # Join the constant table and the PixIR code lines, which refer to the constants by index, with new
+        # line characters and return the result
+        return "\n".join(self.constant_pool.emit(self.code))
+
+    # Allocates the slots of each frame separately: the program's first, then every function's, which starts
+    # at the function's label and reaches the program's variables through the program's slots
+    def allocate_frames(self, code):
+        pieces = [[]]
+        for instruction in code:
+            if instruction in self.function_parameters:
+                pieces.append([])
+            pieces[-1].append(instruction)
+        program, functions = pieces[0], pieces[1:]
+
+        # Program variables that functions use must keep their slots to themselves for the whole program
+        used_by_functions = {virtual_slot(instruction) for piece in functions for instruction in piece}
+        self.slot_allocator = SlotAllocator(program, reuse=self.optimize, shared=used_by_functions)
+        code = self.slot_allocator.allocate()
+
+        for piece in functions:
+            allocator = SlotAllocator(piece, reuse=self.optimize, parameters=self.function_parameters[piece[0]],
+                                      outer=self.slot_allocator.slots, entry=piece[0])
+            code += allocator.allocate()
+        return code
     
 ###########################################################################################################################################
 
 # Usage:
 
-# Specify the name of the file
-filename = 'input.txt'
-
-# Open the file and read the contents into a string
-with open(filename, 'r') as file:
-    source_code = file.read()
-
-try:
-    # Tokenization
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
-
-    # Parsing
-    parser = Parser(tokens)
-    ast = parser.parse()
-    
-    # Semantic Analysis
-    semantic_analyzer = SemanticAnalyzer(ast)
-    for node in ast:
-        semantic_analyzer.visit(node)
-
-    # PixIR Code Generation
-    code_generator = PixIRCodeGenerator(ast)
-    pixir_code = code_generator.generate()
-    print("\nGenerated PixIR code:\n")
-    print(pixir_code)
-    print("\n"+"-"*100)
-
-except LexerError as e:
-    print(f"Error: {e}")
-except ParserError as e:
-    print(f"Error: {e}")
-except SemanticError as e:
-    print(f"Error: {e}")
-except CodeGenerationError as e:
-    print(f"Error: {e}")
\ No newline at end of file
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    # Specify the name of the file
+    filename = 'input.txt'
+
+    # Open the file and read the contents into a string
+    with open(filename, 'r') as file:
+        source_code = file.read()
+
+    try:
+        # Tokenization
+        lexer = Lexer(source_code)
+        tokens = lexer.tokenize()
+
+        # Parsing
+        parser = Parser(tokens)
+        ast = parser.parse()
+
+        # Semantic Analysis
+        semantic_analyzer = SemanticAnalyzer(ast)
+        semantic_analyzer.analyze()
+
+        # Function Inlining
+        ast = FunctionInliner(ast, semantic_analyzer.expression_types).inline()
+
+        # Constant Folding
+        ast = ConstantFolder(ast, semantic_analyzer.expression_types).fold()
+
+        # Constant Propagation
+        ast = ConstantPropagator(ast, semantic_analyzer.expression_types).propagate()
+
+        # Pixel Coalescing
+        ast = PixelCoalescer(ast, semantic_analyzer.expression_types).coalesce()
+
+        # Frame Optimization
+        ast = FrameOptimizer(ast, semantic_analyzer.expression_types).optimize()
+
+        # PixIR Code Generation
+        code_generator = PixIRCodeGenerator(ast, semantic_analyzer.expression_types)
+        pixir_code = code_generator.generate()
+        print("\nGenerated PixIR code:\n")
+        print(pixir_code)
+
+        # Bytecode Assembly
+        bytecode = assemble(pixir_code)
+        print(f"\nBytecode: {len(bytecode)} bytes, for {len(pixir_code.encode())} bytes of PixIR text")
+
+        # Disassembly, which gives back the generated code line for line
+        round_trip = disassemble(bytecode) == code_generator.code
+        print(f"Disassembled bytecode matches the generated code: {round_trip}")
+        print("\n"+"-"*100)
+
+    except LexerError as e:
+        print(f"Error: {e}")
+    except ParserError as e:
+        print(f"Error: {e}")
+    except SemanticError as e:
+        print(f"Error: {e}")
+    except CodeGenerationError as e:
+        print(f"Error: {e}")
+    except BytecodeError as e:
+        print(f"Error: {e}")
\ No newline at end of file
@@ -0,0 +1,241 @@
+# Import all definitions from the semantic analyser code
+from semantic_analyser import *
+from visitor import ASTVisitor
+import math
+
+###########################################################################################################################################
+
+# Integers are only folded while they stay exactly representable as a double, which is what the PAD computes with
+MAX_EXACT_INT = 2 ** 53
+
+# Node tag for each Python type a folded value can have
+LITERAL_TAGS = {bool: "BOOLEAN_LITERAL", int: "INTEGER_LITERAL", float: "FLOAT_LITERAL"}
+
+# Literal nodes whose value is known at compile time
+CONSTANT_TAGS = ("INTEGER_LITERAL", "FLOAT_LITERAL", "BOOLEAN_LITERAL", "COLOR_LITERAL", "STRING_LITERAL")
+
+# Expressions that read the display, the clock or the random generator, or call user code, can never be dropped
+IMPURE_TAGS = ("READ_STATEMENT", "RANDI_STATEMENT", "FUNCTION_CALL", "WIDTH", "HEIGHT")
+
+###########################################################################################################################################
+
+# Rewrites the AST after semantic analysis, evaluating every expression whose operands are known at compile
+# time and removing arithmetic identities. New nodes get the type of the expression they replace.
+class ConstantFolder(ASTVisitor):
+    def __init__(self, ast, expression_types=None):
+        # The abstract syntax tree to be folded
+        self.ast = ast
+        # Types recorded during semantic analysis; folded nodes are added to it
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Number of expressions replaced by a literal or by one of their operands
+        self.folded = 0
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the folded program; unchanged statements keep their original node objects
+    def fold(self):
+        return [self.visit(node) for node in self.ast]
+
+    def unsupported_node(self, node):
+        # Statement and argument lists are folded element by element; anything else is left as it is. A list
+        # whose elements all come back unchanged is returned itself, so its parents are kept too.
+        if isinstance(node, list):
+            children = [self.visit(child) for child in node]
+            return node if all(new is old for new, old in zip(children, node)) else children
+        return node
+
+    # Nodes with no rule of their own just have their children folded
+    def generic_visit(self, node):
+        children = [self.visit(child) if isinstance(child, (tuple, list)) else child for child in node[1:]]
+        if all(new is old for new, old in zip(children, node[1:])):
+            return node
+        return self.replace(node, (node[0], *children))
+
+    def visit_FUNCTION_DEF(self, node):
+        # The parameter list holds (name, type) pairs rather than nodes, so only the body is folded
+        _, name, params, return_type, body = node
+        folded_body = self.visit(body)
+        if folded_body is body:
+            return node
+        return ("FUNCTION_DEF", name, params, return_type, folded_body)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Records the type of the node being replaced for its replacement, so later passes still find it
+    def replace(self, node, new_node):
+        data_type = self.expression_types.lookup(node)
+        if data_type is not None:
+            self.expression_types.record(new_node, data_type)
+        return new_node
+
+    # Replaces an expression with the literal for a value computed at compile time
+    def literal(self, node, value):
+        self.folded += 1
+        new_node = (LITERAL_TAGS[type(value)], value)
+        self.expression_types.record(new_node, {bool: BOOL, int: INT, float: FLOAT}[type(value)])
+        return new_node
+
+    # Replaces an expression with one of its operands; only done if that keeps the expression's type
+    def operand(self, node, operand):
+        data_type = self.expression_types.lookup(node)
+        if data_type is None or data_type is not self.type_of(operand):
+            return None
+        self.folded += 1
+        return operand
+
+    def type_of(self, node):
+        # Literals carry their own type; anything else uses the type semantic analysis recorded
+        if node[0] in LITERAL_TAGS.values():
+            return {"INTEGER_LITERAL": INT, "FLOAT_LITERAL": FLOAT, "BOOLEAN_LITERAL": BOOL}[node[0]]
+        return self.expression_types.lookup(node)
+
+    def is_number(self, node, value=None):
+        # Checks for an int or float literal, optionally with a particular value
+        if node[0] not in ("INTEGER_LITERAL", "FLOAT_LITERAL"):
+            return False
+        return value is None or node[1] == value
+
+    # An expression is pure if evaluating it has no effect other than its value
+    def is_pure(self, node):
+        for child in iter_nodes(node):
+            if child[0] in IMPURE_TAGS:
+                return False
+        return True
+
+    # Folded numbers must behave the same as the instructions they replace
+    def fits(self, value):
+        if isinstance(value, bool):
+            return True
+        if isinstance(value, int):
+            return -MAX_EXACT_INT <= value <= MAX_EXACT_INT
+        return math.isfinite(value)
+
+    # Folds the operands of a binary node, returning the (possibly new) node and its operands
+    def fold_operands(self, node):
+        left = self.visit(node[1])
+        right = self.visit(node[2])
+        if left is not node[1] or right is not node[2]:
+            node = self.replace(node, (node[0], left, right, *node[3:]))
+        return node, left, right
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def visit_PLUS(self, node):
+        node, left, right = self.fold_operands(node)
+        if self.is_number(left) and self.is_number(right) and self.fits(left[1] + right[1]):
+            return self.literal(node, left[1] + right[1])
+        # x + 0 and 0 + x
+        if self.is_number(right, 0):
+            return self.operand(node, left) or node
+        if self.is_number(left, 0):
+            return self.operand(node, right) or node
+        return node
+
+    def visit_MINUS(self, node):
+        node, left, right = self.fold_operands(node)
+        if self.is_number(left) and self.is_number(right) and self.fits(left[1] - right[1]):
+            return self.literal(node, left[1] - right[1])
+        # x - 0
+        if self.is_number(right, 0):
+            return self.operand(node, left) or node
+        return node
+
+    def visit_MUL(self, node):
+        node, left, right = self.fold_operands(node)
+        if self.is_number(left) and self.is_number(right) and self.fits(left[1] * right[1]):
+            return self.literal(node, left[1] * right[1])
+        # x * 1 and 1 * x
+        if self.is_number(right, 1):
+            return self.operand(node, left) or node
+        if self.is_number(left, 1):
+            return self.operand(node, right) or node
+        # x * 0 is 0 for integers, as long as x has no side effects (for floats it could be NaN)
+        for zero, other in ((right, left), (left, right)):
+            if zero == ("INTEGER_LITERAL", 0) and self.type_of(other) is INT and self.is_pure(other):
+                return self.literal(node, 0)
+        return node
+
+    def visit_DIV(self, node):
+        node, left, right = self.fold_operands(node)
+        # Division always gives a float; division by zero is left to fail at run time
+        if self.is_number(left) and self.is_number(right) and right[1] != 0:
+            value = float(left[1]) / float(right[1])
+            if self.fits(value):
+                return self.literal(node, value)
+        # x / 1 keeps the value of x, but only if x is already a float
+        if self.is_number(right, 1):
+            return self.operand(node, left) or node
+        return node
+
+    def visit_MOD(self, node):
+        node, left, right = self.fold_operands(node)
+        # Python and the PAD disagree on the sign of a remainder with negative operands, so those are left alone
+        if left[0] == "INTEGER_LITERAL" and right[0] == "INTEGER_LITERAL" and left[1] >= 0 and right[1] > 0:
+            return self.literal(node, left[1] % right[1])
+        return node
+
+    def visit_NEGATIVE(self, node):
+        operand = self.visit(node[1])
+        if self.is_number(operand):
+            return self.literal(node, -operand[1])
+        if operand is not node[1]:
+            return self.replace(node, ("NEGATIVE", operand))
+        return node
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Compile-time version of each comparison operator
+    COMPARISONS = {
+        "<": lambda left, right: left < right,
+        "<=": lambda left, right: left <= right,
+        ">": lambda left, right: left > right,
+        ">=": lambda left, right: left >= right,
+        "==": lambda left, right: left == right,
+        "!=": lambda left, right: left != right,
+    }
+
+    def visit_RELATIONAL_OPERATOR(self, node):
+        node, left, right = self.fold_operands(node)
+        operator = node[3]
+        if left[0] not in CONSTANT_TAGS or right[0] not in CONSTANT_TAGS or operator not in self.COMPARISONS:
+            return node
+
+        # Numbers compare by value (an int equals the same float), everything else only with its own kind
+        if self.is_number(left) and self.is_number(right):
+            left_value, right_value = left[1], right[1]
+        elif left[0] == right[0] and operator in ("==", "!="):
+            left_value, right_value = left[1], right[1]
+            if left[0] == "COLOR_LITERAL":
+                # '#FF0000' and '#ff0000' are the same colour
+                left_value, right_value = left_value.lower(), right_value.lower()
+        else:
+            return node
+        return self.literal(node, self.COMPARISONS[operator](left_value, right_value))
+
+    def visit_EQUALITY_OPERATOR(self, node):
+        return self.visit_RELATIONAL_OPERATOR(node)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def visit_LOGICAL_OPERATOR(self, node):
+        node, left, right = self.fold_operands(node)
+        return self.fold_logical(node, left, right, node[3])
+
+    def visit_LOGICAL_AND(self, node):
+        node, left, right = self.fold_operands(node)
+        return self.fold_logical(node, left, right, "and")
+
+    def fold_logical(self, node, left, right, operator):
+        if operator not in ("and", "or"):
+            return node
+
+        # true and x == x, false or x == x; the other constant decides the result whenever x has no side effects
+        identity = operator == "and"
+        for constant, other in ((left, right), (right, left)):
+            if constant[0] != "BOOLEAN_LITERAL":
+                continue
+            if constant[1] == identity:
+                return self.operand(node, other) or node
+            if self.is_pure(other):
+                return self.literal(node, not identity)
+        return node
@@ -0,0 +1,139 @@
+# Per-program pool of the literals that are not plain integers: colours, floats and strings. Each distinct
+# literal is encoded into its PixIR operand once and gets an index. The emitted program starts with the
+# pool's table, a 'constants <count>' line followed by one '<index> <operand>' line per constant, and its
+# instructions refer to the constants by index, as in 'push @2'. Inside the compiler the code keeps the
+# operands themselves, which is what the optimizers compare and rewrite.
+
+###########################################################################################################################################
+
+class ConstantPoolError(Exception):
+    pass
+
+# First word of the header line giving the number of constants
+HEADER = "constants"
+
+# Prefix of an operand referring to a constant by its index in the pool
+REFERENCE_PREFIX = "@"
+
+def is_pooled(operand):
+    # Whether a push operand is a colour, a string or a float, rather than an integer or a label
+    if operand.startswith("#") or operand.startswith('"'):
+        return True
+    if operand.startswith(".") or operand.startswith("$"):
+        return False
+    try:
+        int(operand)
+        return False
+    except ValueError:
+        pass
+    try:
+        float(operand)
+        return True
+    except ValueError:
+        return False
+
+###########################################################################################################################################
+
+class ConstantPool:
+    def __init__(self):
+        # Operand of each constant, by index
+        self.entries = []
+        # Index of each operand in the pool
+        self.indices = {}
+        # Operand each literal was encoded into, by its node tag and value
+        self.encoded = {}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the index of an operand, adding it to the pool the first time it is seen
+    def add(self, operand):
+        index = self.indices.get(operand)
+        if index is None:
+            index = len(self.entries)
+            self.indices[operand] = index
+            self.entries.append(operand)
+        return index
+
+    # Returns the operand of a literal node's value, encoding it only the first time it is seen
+    def literal(self, tag, value):
+        key = (tag, type(value), value)
+        operand = self.encoded.get(key)
+        if operand is None:
+            operand = self.encode(tag, value)
+            self.encoded[key] = operand
+            self.add(operand)
+        return operand
+
+    def encode(self, tag, value):
+        if tag == "STRING_LITERAL":
+            # A string is the comma-separated list of its characters' ordinals
+            return '"' + ",".join(str(ord(char)) for char in value) + '"'
+        if tag == "COLOR_LITERAL":
+            # Always spelt in lower case, so that equal colours are the same constant to the optimizers
+            return value.lower()
+        return str(float(value))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Renumbers the pool to hold exactly the constants of the finished code, in order of first use: the
+    # optimizers may have removed some literals and folded others into new ones
+    def rebuild(self, code):
+        self.entries = []
+        self.indices = {}
+        for instruction in code:
+            opcode, _, operand = instruction.partition(" ")
+            if opcode == "push" and is_pooled(operand):
+                self.add(operand)
+
+    # One line per constant, giving its index and operand
+    def table(self):
+        return [f"{index} {operand}" for index, operand in enumerate(self.entries)]
+
+    # The program as emitted: the table as its header, then the code, with every pooled operand replaced by
+    # a reference to its constant
+    def emit(self, code):
+        lines = [f"{HEADER} {len(self.entries)}"] + self.table()
+        for instruction in code:
+            opcode, _, operand = instruction.partition(" ")
+            if opcode == "push" and is_pooled(operand):
+                instruction = f"push {REFERENCE_PREFIX}{self.add(operand)}"
+            lines.append(instruction)
+        return lines
+
+    def __len__(self):
+        return len(self.entries)
+
+###########################################################################################################################################
+
+# Reads an emitted program, as text or lines, back into its constant pool and its code with the operands
+# in place of the references. Code without a header is returned as it is, with the pool of its literals.
+def read_program(program):
+    lines = program.split("\n") if isinstance(program, str) else list(program)
+    pool = ConstantPool()
+    start = 0
+    if lines and lines[0].startswith(HEADER + " "):
+        try:
+            count = int(lines[0][len(HEADER) + 1:])
+        except ValueError:
+            raise ConstantPoolError(f"Invalid constant table header '{lines[0]}'.")
+        if len(lines) <= count:
+            raise ConstantPoolError("The constant table is shorter than its header says.")
+        for index, line in enumerate(lines[1:count + 1]):
+            number, _, operand = line.partition(" ")
+            if number != str(index) or not is_pooled(operand):
+                raise ConstantPoolError(f"Invalid constant table entry '{line}'.")
+            pool.add(operand)
+        start = count + 1
+
+    code = []
+    for instruction in lines[start:]:
+        opcode, _, operand = instruction.partition(" ")
+        if opcode == "push" and operand.startswith(REFERENCE_PREFIX):
+            index = operand[len(REFERENCE_PREFIX):]
+            if not index.isdigit() or int(index) >= len(pool.entries):
+                raise ConstantPoolError(f"Constant '{operand}' is not in the table.")
+            instruction = f"push {pool.entries[int(index)]}"
+        elif opcode == "push" and is_pooled(operand):
+            pool.add(operand)
+        code.append(instruction)
+    return pool, code
@@ -0,0 +1,272 @@
+# Import all definitions from the constant folding code
+from constant_folding import *
+from visitor import ASTVisitor, iter_nodes
+
+###########################################################################################################################################
+
+# One declared variable (or parameter) as seen by the analysis
+class Binding:
+    def __init__(self, name, data_type, droppable=True):
+        self.name = name
+        self.data_type = data_type
+        # Literal node the variable is known to hold at the current point, or None if it is not constant there
+        self.value = None
+        # Number of reads left in the program after propagation
+        self.reads = 0
+        # Statements that store to the variable (its declaration and assignments)
+        self.stores = []
+        # Parameters and for-loop counters are part of a larger construct and are never removed
+        self.droppable = droppable
+
+###########################################################################################################################################
+
+# Forward dataflow analysis over the program's control flow: tracks which variables hold a known constant at
+# each point, replaces their reads with literals (folding whatever becomes constant as a result), then removes
+# declarations and assignments of variables that are no longer read at all.
+class ConstantPropagator(ASTVisitor):
+    def __init__(self, ast, expression_types=None):
+        # The abstract syntax tree, normally already constant folded
+        self.ast = ast
+        # Types recorded during semantic analysis; literals put in place of reads are added to it
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Folds expressions that become constant once their variables are replaced
+        self.folder = ConstantFolder(ast, self.expression_types)
+        # Stack of scopes, each mapping a name to its Binding
+        self.scopes = [{}]
+        # Every binding created, in declaration order
+        self.bindings = []
+        # Names assigned anywhere in the program, and inside function bodies (which a call may run)
+        self.assigned_names = set()
+        self.assigned_in_functions = set()
+        # Number of reads replaced by a literal
+        self.propagated = 0
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the program with constant reads replaced and dead variables removed
+    def propagate(self):
+        for node in iter_nodes(self.ast):
+            if node[0] == "ASSIGNMENT":
+                self.assigned_names.add(node[1])
+            elif node[0] == "FUNCTION_DEF":
+                self.assigned_in_functions.update(child[1] for child in iter_nodes(node[4]) if child[0] == "ASSIGNMENT")
+
+        program = [self.visit(node) for node in self.ast]
+
+        # A variable nobody reads only needs its stores for their side effects; with pure values they can go
+        dead = set()
+        for binding in self.bindings:
+            if binding.droppable and binding.reads == 0 and all(self.folder.is_pure(store[-1]) for store in binding.stores):
+                dead.update(id(store) for store in binding.stores)
+        program = self.remove_statements(program, dead)
+
+        # Statements other than declarations and assignments had their reads replaced but not folded yet
+        return ConstantFolder(program, self.expression_types).fold()
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def unsupported_node(self, node):
+        # Statement and argument lists are visited element by element; anything else is left as it is. A list
+        # whose elements all come back unchanged is returned itself, so its parents are kept too.
+        if isinstance(node, list):
+            children = [self.visit(child) for child in node]
+            return node if all(new is old for new, old in zip(children, node)) else children
+        return node
+
+    # Nodes with no rule of their own just have their children visited, in evaluation order
+    def generic_visit(self, node):
+        children = [self.visit(child) if isinstance(child, (tuple, list)) else child for child in node[1:]]
+        if all(new is old for new, old in zip(children, node[1:])):
+            return node
+        return self.folder.replace(node, (node[0], *children))
+
+    # Visits an expression, then folds whatever its constant reads made foldable
+    def expression(self, node):
+        return self.folder.visit(self.visit(node))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def lookup(self, name):
+        for scope in reversed(self.scopes):
+            if name in scope:
+                return scope[name]
+        return None
+
+    def declare(self, name, data_type, droppable=True):
+        binding = Binding(name, resolve_type(data_type), droppable)
+        self.scopes[-1][name] = binding
+        self.bindings.append(binding)
+        return binding
+
+    # The literal a variable holds after storing value, or None if value is not a compile-time constant
+    def constant(self, binding, value):
+        if value[0] not in CONSTANT_TAGS:
+            return None
+        # An int stored in a float variable is read back as a float
+        if binding.data_type is FLOAT and value[0] == "INTEGER_LITERAL":
+            return self.folder.literal(value, float(value[1]))
+        return value
+
+    # Current value of every visible binding, so a branch can be undone and merged
+    def snapshot(self):
+        return {binding: binding.value for scope in self.scopes for binding in scope.values()}
+
+    # Forgets the value of every visible variable with one of the given names
+    def kill(self, names):
+        for scope in self.scopes:
+            for name in names:
+                if name in scope:
+                    scope[name].value = None
+
+    # Names the given nodes may assign, including through the functions they call
+    def assigned_in(self, *nodes):
+        names = set()
+        for node in nodes:
+            for child in iter_nodes(node):
+                if child[0] == "ASSIGNMENT":
+                    names.add(child[1])
+                elif child[0] == "FUNCTION_CALL":
+                    names |= self.assigned_in_functions
+        return names
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def visit_DECLARATION(self, node):
+        _, data_type, name, expression = node
+        expression = self.expression(expression)
+        binding = self.declare(name, data_type)
+        binding.value = self.constant(binding, expression)
+        if expression is not node[3]:
+            node = ("DECLARATION", data_type, name, expression)
+        binding.stores.append(node)
+        return node
+
+    def visit_ASSIGNMENT(self, node):
+        _, name, expression = node
+        expression = self.expression(expression)
+        binding = self.lookup(name)
+        if expression is not node[2]:
+            node = ("ASSIGNMENT", name, expression)
+        if binding is not None:
+            binding.value = self.constant(binding, expression)
+            binding.stores.append(node)
+        return node
+
+    def visit_IDENTIFIER(self, node):
+        binding = self.lookup(node[1])
+        if binding is None:
+            return node
+        if binding.value is not None:
+            self.propagated += 1
+            return binding.value
+        binding.reads += 1
+        return node
+
+    def visit_VARIABLE(self, node):
+        return self.visit_IDENTIFIER(node)
+
+    def visit_FUNCTION_CALL(self, node):
+        node = self.generic_visit(node)
+        # The called function may assign any variable it can see
+        self.kill(self.assigned_in_functions)
+        return node
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def visit_BLOCK(self, node):
+        self.scopes.append({})
+        statements = [self.visit(statement) for statement in node[1]]
+        self.scopes.pop()
+        if all(new is old for new, old in zip(statements, node[1])):
+            return node
+        return ("BLOCK", statements)
+
+    def visit_IF(self, node):
+        condition = self.expression(node[1])
+        before = self.snapshot()
+        if_block = self.visit(node[2])
+        after_if = self.snapshot()
+
+        for binding, value in before.items():
+            binding.value = value
+        else_node = self.visit(node[3]) if len(node) == 4 else None
+
+        # After the if statement a variable is only constant if both paths agree on its value
+        for binding in before:
+            if binding.value != after_if[binding]:
+                binding.value = None
+
+        if else_node is None:
+            return ("IF", condition, if_block)
+        return ("IF", condition, if_block, else_node)
+
+    def visit_WHILE(self, node):
+        # Anything the body assigns may differ on every iteration, including when the condition is first checked
+        assigned = self.assigned_in(node[1], node[2])
+        self.kill(assigned)
+        condition = self.expression(node[1])
+        body = self.visit(node[2])
+        # The loop is left from its condition check, where those variables are still unknown
+        self.kill(assigned)
+        return ("WHILE", condition, body)
+
+    def visit_FOR(self, node):
+        _, initialization, condition, update, body = node
+        self.scopes.append({})
+        if initialization[0] == "DECLARATION":
+            _, data_type, name, expression = initialization
+            initialization = ("DECLARATION", data_type, name, self.expression(expression))
+            counter = self.declare(name, data_type, droppable=False)
+            counter.stores.append(initialization)
+        else:
+            # 'for (i = 0; ...)' counts with a variable declared before the loop, which the loop changes
+            name = initialization[1]
+            initialization = self.visit_ASSIGNMENT(initialization)
+        # The loop's own stores are never removed, so neither may the declarations of what they store to
+        for store in (initialization, update):
+            binding = self.lookup(store[1] if store[0] == "ASSIGNMENT" else store[2])
+            if binding is not None:
+                binding.droppable = False
+
+        assigned = self.assigned_in(condition, update, body) | {name}
+        self.kill(assigned)
+        condition = self.expression(condition)
+        body = self.visit(body)
+        update = self.visit(update)
+        self.kill(assigned)
+        self.scopes.pop()
+        return ("FOR", initialization, condition, update, body)
+
+    def visit_FUNCTION_DEF(self, node):
+        _, name, params, return_type, body = node
+
+        # The body runs whenever the function is called, so only variables that are never reassigned keep their value
+        saved = self.snapshot()
+        self.kill(self.assigned_names)
+        self.scopes.append({})
+        for param_name, param_type in params:
+            self.declare(param_name, param_type, droppable=False)
+        body = self.visit(body)
+        self.scopes.pop()
+        for binding, value in saved.items():
+            binding.value = value
+
+        return ("FUNCTION_DEF", name, params, return_type, body)
+
+    def visit_RETURN(self, node):
+        if node[1] is None:
+            return node
+        return ("RETURN", self.expression(node[1]))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Removes the given statements wherever they appear in a statement list
+    def remove_statements(self, node, dead):
+        if isinstance(node, list):
+            return [self.remove_statements(child, dead) for child in node if id(child) not in dead]
+        if isinstance(node, tuple) and node[0] in ("BLOCK", "IF", "ELSE", "WHILE", "FUNCTION_DEF"):
+            return tuple(self.remove_statements(child, dead) if isinstance(child, (tuple, list)) and index else child
+                         for index, child in enumerate(node))
+        if isinstance(node, tuple) and node[0] == "FOR":
+            return node[:4] + (self.remove_statements(node[4], dead),)
+        return node
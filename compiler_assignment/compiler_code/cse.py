@@ -0,0 +1,131 @@
+# Common subexpression elimination within basic blocks. Local value numbering gives every value a block's
+# stack code computes a number, so that two side-effect free expressions computing the same value get the
+# same number. When it pays on the stack machine, the first computation is kept in a temporary slot and the
+# later ones are replaced by a load of that slot.
+from ssa import INSTRUCTIONS, ACCESS_COST
+
+###########################################################################################################################################
+
+# One value on the symbolic stack: its value number, and the instructions computing it if they are a
+# contiguous, side-effect free range (start and end are None otherwise)
+class StackEntry:
+    def __init__(self, number, start=None, end=None):
+        self.number = number
+        self.start = start
+        self.end = end
+
+###########################################################################################################################################
+
+class CommonSubexpressionEliminator:
+    def __init__(self, cfg, new_slot):
+        # The graph whose blocks are rewritten
+        self.cfg = cfg
+        # Hands out fresh virtual slots for the temporaries
+        self.new_slot = new_slot
+        # Number of computations replaced by a load
+        self.eliminated = 0
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Replaces repeated computations, most profitable first, until none is left that pays for its temporary
+    def eliminate(self):
+        for block in self.cfg.blocks:
+            while self.eliminate_best(block.instructions):
+                pass
+        return self.eliminated
+
+    def eliminate_best(self, code):
+        best = None
+        for ranges in self.computations(code).values():
+            profit = self.profit(ranges)
+            if profit > 0 and (best is None or profit > best[0]):
+                best = (profit, ranges)
+        if best is None:
+            return False
+
+        # The first computation keeps a copy of its value in the temporary; the others load it from there
+        _, ranges = best
+        slot = self.new_slot()
+        for start, end in reversed(ranges[1:]):
+            code[start:end + 1] = [f"push {slot}", "push 0", "ld"]
+        first_end = ranges[0][1]
+        code[first_end + 1:first_end + 1] = ["dup", f"push {slot}", "push 0", "st"]
+        self.eliminated += len(ranges) - 1
+        return True
+
+    # Instructions saved by computing a value once: each repeated computation becomes a load, at the cost of
+    # copying the first result into the temporary (dup plus a store)
+    def profit(self, ranges):
+        if len(ranges) < 2:
+            return 0
+        start, end = ranges[0]
+        return (len(ranges) - 1) * (end - start + 1 - ACCESS_COST) - (1 + ACCESS_COST)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Runs the block's instructions on a symbolic stack. Returns, for every value computed more than once by
+    # a pure instruction, the (start, end) index ranges of the instructions computing it, in order.
+    def computations(self, code):
+        numbers = {}
+        # Number of stores seen to each slot, so loads before and after a store get different numbers
+        versions = {}
+        # Bumped whenever memory may change in a way the analysis cannot follow
+        epoch = 0
+        stack = []
+        found = {}
+
+        def number(key):
+            return numbers.setdefault(key, len(numbers))
+
+        def pop():
+            # Values from before the block, or from an instruction the analysis does not know, are opaque
+            return stack.pop() if stack else StackEntry(number(("opaque", len(numbers))))
+
+        for index, instruction in enumerate(code):
+            opcode, _, operand = instruction.partition(" ")
+            if opcode == "push" and operand:
+                stack.append(StackEntry(number(("push", operand)), index, index))
+            elif opcode == "dup" and not operand:
+                top = pop()
+                stack += [top, StackEntry(top.number)]
+            elif opcode == "drop" and not operand:
+                pop()
+            elif opcode == "ld" and not operand:
+                frame, slot = pop(), pop()
+                key = ("ld", slot.number, frame.number, versions.get((slot.number, frame.number), 0), epoch)
+                stack.append(self.combine(number(key), [slot, frame], index))
+            elif opcode == "st" and not operand:
+                frame, slot, _ = pop(), pop(), pop()
+                if slot.start is not None and frame.start is not None and slot.start == slot.end and frame.start == frame.end:
+                    versions[(slot.number, frame.number)] = versions.get((slot.number, frame.number), 0) + 1
+                else:
+                    epoch += 1
+            elif opcode in INSTRUCTIONS and not operand:
+                pops, pushes, side_effect = INSTRUCTIONS[opcode]
+                args = [pop() for _ in range(pops)][::-1]
+                if side_effect:
+                    stack += [StackEntry(number(("effect", index))) for _ in range(pushes)]
+                    continue
+                entry = self.combine(number((opcode, *[arg.number for arg in args])), args, index)
+                stack.append(entry)
+                if entry.start is not None:
+                    found.setdefault(entry.number, []).append((entry.start, entry.end))
+            else:
+                # Unknown stack effect: nothing computed so far can be relied on
+                stack = []
+                epoch += 1
+
+        return {number: ranges for number, ranges in found.items() if len(ranges) > 1}
+
+    # The entry for a value computed at index from the given operands; it has a range only if the operands'
+    # ranges follow each other directly and end just before index
+    def combine(self, number, args, index):
+        start = args[0].start if args else index
+        expected = start
+        for arg in args:
+            if arg.start is None or arg.start != expected:
+                return StackEntry(number)
+            expected = arg.end + 1
+        if expected != index:
+            return StackEntry(number)
+        return StackEntry(number, start, index)
@@ -0,0 +1,180 @@
+# Dead-code and dead-store elimination over the basic-block graph. Branches on constant conditions become
+# jumps, blocks that can no longer be reached are dropped, stores to variable slots that are never read
+# again are removed, and so are expressions whose value is dropped unused and that have no side effects.
+# Instructions with side effects (__print, __pixel, __delay, __randi, ...) are always kept.
+from cfg import Jump, Branch
+from ssa import INSTRUCTIONS
+from slot_allocation import virtual_slot
+
+###########################################################################################################################################
+
+# Stack effect of the instructions besides those in INSTRUCTIONS: (values popped, values pushed, has side effects)
+STACK_EFFECTS = dict(INSTRUCTIONS, ld=(2, 1, False), st=(2, 0, True), push=(0, 1, False))
+
+def stack_effect(instruction):
+    # Returns the stack effect of an instruction, or None when it is not known to be pure or not
+    opcode, _, operand = instruction.partition(" ")
+    if opcode == "push":
+        return STACK_EFFECTS["push"] if operand else None
+    return STACK_EFFECTS.get(opcode) if not operand else None
+
+def slot_access(code, index):
+    # Returns the virtual slot and 'st' or 'ld' when code[index] starts a variable access, else (None, None)
+    slot = virtual_slot(code[index])
+    if slot is not None and code[index + 1:index + 2] == ["push 0"] and code[index + 2:index + 3] in (["st"], ["ld"]):
+        return slot, code[index + 2]
+    return None, None
+
+###########################################################################################################################################
+
+class DeadCodeEliminator:
+    def __init__(self, cfg):
+        # The graph to clean up, with virtual variable slots as produced by the code generator
+        self.cfg = cfg
+        # Counts of what was removed
+        self.removed = {"branches": 0, "stores": 0, "expressions": 0}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Runs the eliminations until none of them finds anything more to remove
+    def eliminate(self):
+        while self.fold_branches() + self.cfg.remove_unreachable() + self.remove_dead_stores() + self.remove_unused_expressions():
+            pass
+        return self.removed
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # A branch whose condition is a literal always goes the same way
+    def fold_branches(self):
+        folded = 0
+        for block in self.cfg.blocks:
+            terminator = block.terminator
+            if not isinstance(terminator, Branch) or not block.instructions:
+                continue
+            condition = block.instructions[-1].partition(" ")
+            if condition[0] != "push":
+                continue
+            try:
+                value = float(condition[2])
+            except ValueError:
+                continue
+            block.instructions.pop()
+            block.terminator = Jump(terminator.if_true if value else terminator.if_false)
+            folded += 1
+        self.removed["branches"] += folded
+        return folded
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Slots read by each block before it writes them, and slots it writes
+    def block_accesses(self, block):
+        read = set()
+        written = set()
+        code = block.instructions
+        for index in range(len(code)):
+            slot, access = slot_access(code, index)
+            if access == "ld" and slot not in written:
+                read.add(slot)
+            elif access == "st":
+                written.add(slot)
+        return read, written
+
+    # Slots live at the end of each block, found by iterating backwards over the graph to a fixed point
+    def live_out(self, kept):
+        accesses = {id(block): self.block_accesses(block) for block in self.cfg.blocks}
+        live_in = {id(block): set() for block in self.cfg.blocks}
+        live_out = {id(block): set(kept) for block in self.cfg.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.cfg.blocks):
+                out = set(kept)
+                for successor in block.successors():
+                    out |= live_in[id(successor)]
+                read, written = accesses[id(block)]
+                new_in = read | (out - written)
+                live_out[id(block)] = out
+                if new_in != live_in[id(block)]:
+                    live_in[id(block)] = new_in
+                    changed = True
+        return live_out
+
+    # Slots that code in another frame reaches (the program's variables, from inside functions) may be read
+    # during any call, so they are kept alive everywhere
+    def shared_slots(self):
+        shared = set()
+        for block in self.cfg.blocks:
+            code = block.instructions
+            for index in range(len(code)):
+                slot = virtual_slot(code[index])
+                if slot is not None and slot_access(code, index) == (None, None):
+                    shared.add(slot)
+        return shared
+
+    # A store to a slot that is not read again before being overwritten only has to pop its value, and one
+    # read back straight away and never again can leave the value on the stack
+    #   push $k / push 0 / st  ->  drop
+    #   push $k / push 0 / st / push $k / push 0 / ld  ->  (nothing)
+    def remove_dead_stores(self):
+        removed = 0
+        shared = self.shared_slots()
+        live_out = self.live_out(shared)
+        for block in self.cfg.blocks:
+            live = set(live_out[id(block)])
+            code = block.instructions
+            # Index and slot of the last load seen, if the slot is dead after it
+            last_load = None
+            for index in range(len(code) - 1, -1, -1):
+                slot, access = slot_access(code, index)
+                if access == "ld":
+                    last_load = (index, slot) if slot not in live else None
+                    live.add(slot)
+                elif access == "st":
+                    if last_load == (index + 3, slot):
+                        del code[index:index + 6]
+                        removed += 1
+                    elif slot not in live:
+                        code[index:index + 3] = ["drop"]
+                        removed += 1
+                    # A call between this store and the previous one may read a shared slot
+                    if slot not in shared:
+                        live.discard(slot)
+                    last_load = None
+        self.removed["stores"] += removed
+        return removed
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # A value computed without side effects and then dropped need not be computed at all
+    #   push x / push y / add / drop  ->  (nothing)
+    def remove_unused_expressions(self):
+        removed = 0
+        for block in self.cfg.blocks:
+            code = block.instructions
+            index = 0
+            while index < len(code):
+                start = self.pure_operand_start(code, index) if code[index] == "drop" else None
+                if start is None:
+                    index += 1
+                    continue
+                del code[start:index + 1]
+                removed += 1
+                index = start
+        self.removed["expressions"] += removed
+        return removed
+
+    # Index of the first instruction computing the value on top of the stack before code[index], if the
+    # instructions computing it are side-effect free and compute nothing else
+    def pure_operand_start(self, code, index):
+        needed = 1
+        for start in range(index - 1, -1, -1):
+            effect = stack_effect(code[start])
+            if effect is None:
+                return None
+            pops, pushes, side_effect = effect
+            if side_effect or pushes > needed:
+                return None
+            needed += pops - pushes
+            if needed == 0:
+                return start
+        return None
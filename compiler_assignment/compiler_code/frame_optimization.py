@@ -0,0 +1,126 @@
+# Import all definitions from the constant folding code
+from constant_folding import *
+from visitor import iter_nodes
+
+###########################################################################################################################################
+
+# Statements that contain other statements, whose statement lists are optimized separately
+COMPOUND_TAGS = ("BLOCK", "IF", "ELSE", "WHILE", "FOR", "FUNCTION_DEF")
+
+# Nodes after which the display may have been looked at: a delay shows the frame drawn so far, a read
+# looks at it, and a call may do either
+OBSERVING_TAGS = ("DELAY", "READ_STATEMENT", "FUNCTION_CALL")
+
+###########################################################################################################################################
+
+# Treats the pixel writes between two delays as the drawing of one display frame. Only the last colour
+# written to each pixel of a frame is ever seen, so a write every pixel of which is written again later in
+# the same frame is dropped; and delays that follow each other directly, with constant lengths, become
+# one delay of their total length. Frames are only followed within a statement list, up to the first
+# statement that may look at the display or leave the list's straight-line code.
+class FrameOptimizer:
+    def __init__(self, ast, expression_types=None, area_limit=4096):
+        # The abstract syntax tree, normally after constant folding, propagation and pixel coalescing
+        self.ast = ast
+        # Types recorded during semantic analysis; the lengths of merged delays are added to it
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Largest write, in pixels, checked pixel by pixel against the writes covering it
+        self.area_limit = area_limit
+        # Number of pixel writes dropped and of delays merged into the one before them
+        self.statistics = {"writes dropped": 0, "delays merged": 0}
+        # Tells which writes have arguments free of side effects, which are the only ones that may be dropped
+        self.folder = ConstantFolder(ast, self.expression_types)
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the program without overdrawn pixel writes, and with adjacent delays merged
+    def optimize(self):
+        return self.statements(self.ast)
+
+    def statements(self, statements):
+        statements = [self.statement(statement) for statement in statements]
+        return self.merge_delays(self.drop_overdrawn(statements))
+
+    # Optimizes the statement lists inside a compound statement
+    def statement(self, node):
+        tag = node[0]
+        if tag == "BLOCK":
+            return ("BLOCK", self.statements(node[1]))
+        if tag in COMPOUND_TAGS:
+            return (tag, *[self.statement(child) if isinstance(child, tuple) and child[0] in COMPOUND_TAGS
+                           else child for child in node[1:]])
+        return node
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Walks the list backwards, collecting the rectangles written later in the current frame. The end of
+    # the list ends the frame too, as whatever follows it is not known here.
+    def drop_overdrawn(self, statements):
+        covering = []
+        kept = []
+        for statement in reversed(statements):
+            if self.ends_frame(statement):
+                covering = []
+                kept.append(statement)
+                continue
+            area = self.area(statement)
+            if area is not None and self.is_covered(area, covering) and self.folder.is_pure(statement):
+                self.statistics["writes dropped"] += 1
+                continue
+            if area is not None:
+                covering.append(area)
+            kept.append(statement)
+        return kept[::-1]
+
+    # Whether the display may be looked at during a statement, or control may not carry on to the next one
+    def ends_frame(self, node):
+        if node[0] in COMPOUND_TAGS or node[0] == "RETURN":
+            return True
+        return any(child[0] in OBSERVING_TAGS for child in iter_nodes(node))
+
+    # The (x, y, width, height) rectangle a pixel write with a constant position covers, or None
+    def area(self, node):
+        if node[0] == "PIXEL_STATEMENT":
+            bounds = node[1][:2] + [("INTEGER_LITERAL", 1)] * 2
+        elif node[0] == "PIXELR_STATEMENT":
+            bounds = node[1][:4]
+        else:
+            return None
+        if any(bound[0] != "INTEGER_LITERAL" for bound in bounds):
+            return None
+        return tuple(bound[1] for bound in bounds)
+
+    # Whether every pixel of a rectangle lies in one of the covering rectangles
+    def is_covered(self, area, covering):
+        x, y, width, height = area
+        if width <= 0 or height <= 0:
+            return False
+        for left, top, cover_width, cover_height in covering:
+            if left <= x and top <= y and x + width <= left + cover_width and y + height <= top + cover_height:
+                return True
+        if width * height > self.area_limit:
+            return False
+        return all(any(left <= column < left + cover_width and top <= row < top + cover_height
+                       for left, top, cover_width, cover_height in covering)
+                   for row in range(y, y + height) for column in range(x, x + width))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Replaces delays of constant, non-negative lengths that directly follow each other by their sum
+    def merge_delays(self, statements):
+        merged = []
+        for statement in statements:
+            if merged and self.delay_length(statement) is not None and self.delay_length(merged[-1]) is not None:
+                length = self.delay_length(merged[-1]) + self.delay_length(statement)
+                length_node = ("INTEGER_LITERAL", length)
+                self.expression_types.record(length_node, INT)
+                merged[-1] = ("DELAY", length_node)
+                self.statistics["delays merged"] += 1
+            else:
+                merged.append(statement)
+        return merged
+
+    def delay_length(self, node):
+        if node[0] == "DELAY" and node[1][0] == "INTEGER_LITERAL" and node[1][1] >= 0:
+            return node[1][1]
+        return None
@@ -0,0 +1,170 @@
+# Hash array mapped trie (HAMT) giving the symbol table immutable, persistent maps.
+# Every update returns a new map that shares all untouched nodes with the old one,
+# so older versions stay valid and never have to be copied.
+
+# Number of hash bits consumed at each level of the trie (32-way branching)
+BITS_PER_LEVEL = 5
+BRANCH_MASK = (1 << BITS_PER_LEVEL) - 1
+
+# Hashes are folded to 64 bits, after which colliding keys share a collision node
+HASH_BITS = 64
+HASH_MASK = (1 << HASH_BITS) - 1
+
+###########################################################################################################################################
+
+class _Leaf:
+    __slots__ = ("key_hash", "key", "value")
+
+    def __init__(self, key_hash, key, value):
+        # Store a single key/value binding together with the key's hash
+        self.key_hash = key_hash
+        self.key = key
+        self.value = value
+
+###########################################################################################################################################
+
+class _CollisionNode:
+    __slots__ = ("key_hash", "leaves")
+
+    def __init__(self, key_hash, leaves):
+        # Store every leaf whose full hash is identical
+        self.key_hash = key_hash
+        self.leaves = leaves
+
+    def get(self, key, key_hash, shift, default):
+        for leaf in self.leaves:
+            if leaf.key == key:
+                return leaf.value
+        return default
+
+    # Returns a new node with the binding added, plus whether the key is new
+    def set(self, key, key_hash, value, shift):
+        for index, leaf in enumerate(self.leaves):
+            if leaf.key == key:
+                leaves = self.leaves[:index] + (_Leaf(key_hash, key, value),) + self.leaves[index + 1:]
+                return _CollisionNode(key_hash, leaves), False
+        return _CollisionNode(key_hash, self.leaves + (_Leaf(key_hash, key, value),)), True
+
+    def iter_leaves(self):
+        yield from self.leaves
+
+###########################################################################################################################################
+
+class _BitmapNode:
+    __slots__ = ("bitmap", "entries")
+
+    def __init__(self, bitmap, entries):
+        # The bitmap marks which of the 32 branches are present, entries holds them densely
+        self.bitmap = bitmap
+        self.entries = entries
+
+    def get(self, key, key_hash, shift, default):
+        bit = 1 << ((key_hash >> shift) & BRANCH_MASK)
+        if not self.bitmap & bit:
+            return default
+
+        entry = self.entries[bin(self.bitmap & (bit - 1)).count("1")]
+        if isinstance(entry, _Leaf):
+            return entry.value if entry.key == key else default
+        return entry.get(key, key_hash, shift + BITS_PER_LEVEL, default)
+
+    # Returns a new node with the binding added, plus whether the key is new
+    def set(self, key, key_hash, value, shift):
+        bit = 1 << ((key_hash >> shift) & BRANCH_MASK)
+        index = bin(self.bitmap & (bit - 1)).count("1")
+
+        # Empty branch: insert a new leaf
+        if not self.bitmap & bit:
+            entries = self.entries[:index] + (_Leaf(key_hash, key, value),) + self.entries[index:]
+            return _BitmapNode(self.bitmap | bit, entries), True
+
+        entry = self.entries[index]
+        if isinstance(entry, _Leaf):
+            # Same key: replace the value
+            if entry.key == key:
+                new_entry, added = _Leaf(key_hash, key, value), False
+            # Different key in the same branch: push both leaves one level down
+            else:
+                new_entry, added = _merge_leaves(entry, _Leaf(key_hash, key, value), shift + BITS_PER_LEVEL), True
+        else:
+            new_entry, added = entry.set(key, key_hash, value, shift + BITS_PER_LEVEL)
+
+        entries = self.entries[:index] + (new_entry,) + self.entries[index + 1:]
+        return _BitmapNode(self.bitmap, entries), added
+
+    def iter_leaves(self):
+        for entry in self.entries:
+            if isinstance(entry, _Leaf):
+                yield entry
+            else:
+                yield from entry.iter_leaves()
+
+#---------------------------------------------------------------------------------------------------------------------------------------
+
+# Builds the smallest subtree that holds two leaves whose hashes agree up to the given shift
+def _merge_leaves(first, second, shift):
+    if shift >= HASH_BITS or first.key_hash == second.key_hash:
+        return _CollisionNode(first.key_hash, (first, second))
+
+    first_bit = (first.key_hash >> shift) & BRANCH_MASK
+    second_bit = (second.key_hash >> shift) & BRANCH_MASK
+
+    # Still sharing a branch: go one level deeper
+    if first_bit == second_bit:
+        return _BitmapNode(1 << first_bit, (_merge_leaves(first, second, shift + BITS_PER_LEVEL),))
+
+    entries = (first, second) if first_bit < second_bit else (second, first)
+    return _BitmapNode((1 << first_bit) | (1 << second_bit), entries)
+
+###########################################################################################################################################
+
+class PersistentMap:
+    __slots__ = ("_root", "_size")
+
+    def __init__(self, root=None, size=0):
+        self._root = root if root is not None else _EMPTY_NODE
+        self._size = size
+
+    # Returns the value bound to the key, or the default if it is not present
+    def get(self, key, default=None):
+        return self._root.get(key, hash(key) & HASH_MASK, 0, default)
+
+    # Returns a new map with the key bound to the value, leaving this map untouched
+    def set(self, key, value):
+        root, added = self._root.set(key, hash(key) & HASH_MASK, value, 0)
+        return PersistentMap(root, self._size + 1 if added else self._size)
+
+    def items(self):
+        for leaf in self._root.iter_leaves():
+            yield leaf.key, leaf.value
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for key, _ in self.items():
+            yield key
+
+    # Hashes are salted per interpreter, so pickle the bindings and rebuild the trie on load
+    def __reduce__(self):
+        return (_rebuild_map, (list(self.items()),))
+
+#---------------------------------------------------------------------------------------------------------------------------------------
+
+def _rebuild_map(items):
+    result = PersistentMap()
+    for key, value in items:
+        result = result.set(key, value)
+    return result
+
+_EMPTY_NODE = _BitmapNode(0, ())
+_MISSING = object()
@@ -0,0 +1,160 @@
+# Import all definitions from the semantic analyser code
+from semantic_analyser import *
+from visitor import iter_nodes
+import contextlib
+import io
+
+###########################################################################################################################################
+
+# Statements that add a name to the scope they appear in
+DEFINING_NODES = ("DECLARATION", "FUNCTION_DEF")
+
+# Cached result of checking one top-level statement
+class AnalysisUnit:
+    def __init__(self, key, node, uses):
+        self.key = key
+        # The node whose check is cached, as the program last analysed holds it
+        self.node = node
+        # Identifiers the statement refers to
+        self.uses = uses
+        # What each name it uses or defines was bound to in the global scope when it was checked, as a
+        # (declared, value) pair; the check only depends on these, so it holds while they stay the same
+        self.environment = {}
+        # Names and values the statement added to the global scope
+        self.bindings = []
+        # Diagnostics produced while checking it, in order
+        self.diagnostics = []
+
+###########################################################################################################################################
+
+class IncrementalSemanticAnalyzer:
+    def __init__(self):
+        # Cached units from the previous run, keyed by a stable key for each top-level statement
+        self.units = {}
+        # The program as last analysed
+        self.ast = []
+        # Types of every expression in self.ast, kept up to date across runs
+        self.expression_types = TypeAnnotations()
+        # Keys of the statements re-checked by the most recent run
+        self.rechecked = []
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Analyses a new version of the program, re-checking only the statements that changed and those whose
+    # view of the global scope changed. Returns the diagnostics of the whole program in source order.
+    def analyze(self, ast):
+        keys = self.unit_keys(ast)
+
+        # Statements rebuilt without changing keep their types, moved over to the new node objects. All the
+        # types are read before any is written, as a node may move from one key to another.
+        moved = []
+        for key, node in zip(keys, ast):
+            unit = self.units.get(key)
+            if unit is not None and unit.node is not node and unit.node == node:
+                moved.append((unit, node, [self.expression_types.lookup(child) for child in iter_nodes(unit.node)]))
+
+        # Forget the types of the nodes that are no longer part of the program
+        current = {id(node) for node in ast}
+        for unit in self.units.values():
+            if id(unit.node) not in current:
+                self.forget(unit.node)
+        for unit, node, types in moved:
+            for child, data_type in zip(iter_nodes(node), types):
+                if data_type is not None:
+                    self.expression_types.record(child, data_type)
+                else:
+                    self.expression_types.forget(child)
+            unit.node = node
+
+        # Replay the global declarations in order. A statement is re-checked if it is new, if its node
+        # changed, or if any name it uses or defines is bound differently at its position than when it was
+        # last checked: a declaration before it changed, appeared, disappeared, or moved across it. Every
+        # other statement just re-applies the bindings it added last time.
+        environment = PersistentSymbolTable()
+        units = {}
+        self.rechecked = []
+        for key, node in zip(keys, ast):
+            unit = self.units.get(key)
+            if unit is None or unit.node is not node or self.environment_changed(unit, environment):
+                self.forget(node)
+                unit = self.check_unit(key, node, self.identifiers_used(node), environment)
+                self.rechecked.append(key)
+            for name, value in unit.bindings:
+                environment = PersistentSymbolTable(environment.bindings.set(name, value), environment.parent)
+            units[key] = unit
+
+        self.units = units
+        self.ast = list(ast)
+        return [diagnostic for key in keys for diagnostic in units[key].diagnostics]
+
+    # Forgets the types of a statement's nodes
+    def forget(self, node):
+        for child in iter_nodes(node):
+            self.expression_types.forget(child)
+
+    # Whether a name the unit depends on is bound differently in the environment than when it was checked
+    def environment_changed(self, unit, environment):
+        return any(self.binding(environment, name) != binding for name, binding in unit.environment.items())
+
+    def binding(self, environment, name):
+        return (name in environment.bindings, environment.bindings.get(name))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Checks a single top-level statement in the given global environment
+    def check_unit(self, key, node, uses, environment):
+        unit = AnalysisUnit(key, node, uses)
+        unit.environment = {name: self.binding(environment, name) for name in uses | set(self.defined_names(node))}
+
+        analyzer = SemanticAnalyzer([node])
+        analyzer.expression_types = self.expression_types
+        analyzer.symbol_table.restore(environment)
+
+        # Errors are normally printed or raised; collect both as the unit's diagnostics
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                analyzer.visit(node)
+            except SemanticError as e:
+                print(f"Error: {e}")
+        unit.diagnostics = [line for line in output.getvalue().splitlines() if line]
+
+        # Remember what the statement added to the global scope so it can be replayed without re-checking
+        after = analyzer.symbol_table.snapshot().bindings
+        for name in self.defined_names(node):
+            if name in after and (name not in environment.bindings or environment.bindings[name] is not after[name]):
+                unit.bindings.append((name, after[name]))
+        return unit
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Gives every top-level statement a key that survives edits elsewhere in the program:
+    # the statement kind, the name it defines (if any) and its occurrence count
+    def unit_keys(self, ast):
+        keys = []
+        seen = {}
+        for node in ast:
+            names = self.defined_names(node)
+            base = (node[0], names[0] if names else None)
+            seen[base] = seen.get(base, 0) + 1
+            keys.append(base + (seen[base],))
+        return keys
+
+    def is_definition(self, node):
+        return isinstance(node, tuple) and node[0] in DEFINING_NODES
+
+    # Names a top-level statement adds to the global scope
+    def defined_names(self, node):
+        if not self.is_definition(node):
+            return []
+        return [node[2] if node[0] == "DECLARATION" else node[1]]
+
+    # Every identifier a statement refers to: variables, assignment targets and called functions
+    def identifiers_used(self, node):
+        names = set()
+        for child in iter_nodes(node):
+            if child[0] in ("IDENTIFIER", "VARIABLE") and isinstance(child[1], str):
+                names.add(child[1])
+            elif child[0] in ("ASSIGNMENT", "FUNCTION_CALL") and isinstance(child[1], str):
+                names.add(child[1])
+        return frozenset(names)
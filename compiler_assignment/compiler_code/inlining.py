@@ -0,0 +1,249 @@
+# Import all definitions from the constant folding code
+from constant_folding import *
+from visitor import iter_nodes
+
+###########################################################################################################################################
+
+# Statements that contain other statements; the expressions of any other statement are evaluated once, in
+# order, where the statement stands, so a call in them can run just before the statement instead
+COMPOUND_TAGS = ("BLOCK", "IF", "ELSE", "WHILE", "FOR", "FUNCTION_DEF")
+
+# Operators whose right operand is not always evaluated
+SHORT_CIRCUIT_TAGS = ("LOGICAL_AND", "LOGICAL_OPERATOR")
+
+###########################################################################################################################################
+
+# Calls being replaced within one statement
+class InlineState:
+    def __init__(self):
+        # Statements that compute the inlined calls, to be placed before the statement
+        self.prefix = []
+        # Whether everything evaluated so far in the statement is free of side effects, so that a call
+        # evaluated next may move ahead of it
+        self.movable = True
+
+###########################################################################################################################################
+
+# Replaces calls of small functions with a copy of their body. Parameters become variables initialised with
+# the arguments, every local gets a name of its own in each copy, and the returned expression is stored in a
+# result variable that takes the place of the call. A function is inlined when its body is small, it can
+# never call itself, it only uses its parameters and locals, and it returns once, at its end. The whole
+# program may grow by at most growth_limit times its original size; definitions of functions that were
+# inlined at every call site are removed.
+class FunctionInliner:
+    def __init__(self, ast, expression_types=None, size_limit=40, growth_limit=1.5):
+        # The abstract syntax tree, after semantic analysis
+        self.ast = ast
+        # Types recorded during semantic analysis; copied nodes get the type of the node they copy
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Largest function body, in AST nodes, that is inlined
+        self.size_limit = size_limit
+        # Largest size the program may grow to through inlining, as a multiple of its original size
+        self.growth_limit = growth_limit
+        # Definitions of the functions that may be inlined, with the size of their bodies
+        self.candidates = {}
+        self.sizes = {}
+        # AST nodes inlining may still add before the program reaches its growth limit
+        self.budget = 0
+        # Number of calls replaced so far; also numbers the copies so that their names are unique
+        self.inlined = 0
+        # Functions inlined at one call site at least
+        self.inlined_functions = set()
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the program with calls of small functions replaced by their bodies
+    def inline(self):
+        size = sum(1 for _ in iter_nodes(self.ast))
+        self.budget = int(size * (self.growth_limit - 1))
+        self.find_candidates()
+        program = self.inline_statements(self.ast)
+
+        # A function no call is left for is no longer needed
+        called = {node[1] for node in iter_nodes(program) if node[0] == "FUNCTION_CALL"}
+        unused = self.inlined_functions - called
+        return [node for node in program if not (node[0] == "FUNCTION_DEF" and node[1] in unused)]
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Functions defined once, at the top level, that satisfy the conditions for inlining
+    def find_candidates(self):
+        definitions = {}
+        for node in iter_nodes(self.ast):
+            if node[0] == "FUNCTION_DEF":
+                definitions.setdefault(node[1], []).append(node)
+        top_level = {node[1] for node in self.ast if node[0] == "FUNCTION_DEF"}
+
+        calls = {}
+        for name, nodes in definitions.items():
+            calls[name] = {child[1] for child in iter_nodes(nodes[0][4]) if child[0] == "FUNCTION_CALL"}
+
+        for name, nodes in definitions.items():
+            if len(nodes) != 1 or name not in top_level or self.is_recursive(name, calls):
+                continue
+            size = sum(1 for _ in iter_nodes(nodes[0][4]))
+            if size <= self.size_limit and self.is_inlinable(nodes[0]):
+                self.candidates[name] = nodes[0]
+                self.sizes[name] = size
+
+    # Whether a function can end up calling itself, directly or through other functions
+    def is_recursive(self, name, calls):
+        seen = set()
+        stack = list(calls.get(name, ()))
+        while stack:
+            callee = stack.pop()
+            if callee == name:
+                return True
+            if callee not in seen:
+                seen.add(callee)
+                stack.extend(calls.get(callee, ()))
+        return False
+
+    def is_inlinable(self, node):
+        _, name, params, return_type, body = node
+        if return_type is None or any(not isinstance(param, tuple) for param in params):
+            return False
+        if body[0] != "BLOCK" or not body[1] or body[1][-1][0] != "RETURN" or body[1][-1][1] is None:
+            return False
+
+        # The only return is the last statement, and nothing is defined inside the body
+        if any(child[0] in ("RETURN", "FUNCTION_DEF") for child in iter_nodes(body[1][:-1])):
+            return False
+
+        # Every variable used is a parameter or a local, so the copy means the same wherever it is placed
+        local_names = {param_name for param_name, _ in params}
+        local_names.update(child[2] for child in iter_nodes(body) if child[0] == "DECLARATION")
+        for child in iter_nodes(body):
+            if child[0] in ("IDENTIFIER", "ASSIGNMENT") and child[1] not in local_names:
+                return False
+        return True
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Records the type of the node being replaced for its replacement, so later passes still find it
+    def replace(self, node, new_node):
+        data_type = self.expression_types.lookup(node)
+        if data_type is not None:
+            self.expression_types.record(new_node, data_type)
+        return new_node
+
+    def inline_statements(self, statements):
+        result = []
+        for statement in statements:
+            prefix, statement = self.inline_statement(statement)
+            result.extend(prefix)
+            if statement is not None:
+                result.append(statement)
+        return result
+
+    # Returns the statements computing the calls inlined in a statement, and the statement itself (None if
+    # nothing of it is left)
+    def inline_statement(self, node):
+        tag = node[0]
+        if tag == "BLOCK":
+            return [], ("BLOCK", self.inline_statements(node[1]))
+        if tag == "ELSE":
+            return [], ("ELSE", self.inline_statement(node[1])[1])
+        if tag == "IF":
+            state = InlineState()
+            condition = self.expression(node[1], state)
+            branches = tuple(self.inline_statement(branch)[1] for branch in node[2:])
+            return state.prefix, ("IF", condition) + branches
+        if tag == "WHILE":
+            # The condition is evaluated before every iteration, so calls in it stay where they are
+            return [], ("WHILE", node[1], self.inline_statement(node[2])[1])
+        if tag == "FOR":
+            # The initialisation runs once, before the loop; the condition and update run on every iteration
+            _, declaration, condition, update, body = node
+            prefix, declaration = self.inline_statement(declaration)
+            body = self.inline_statements(body) if isinstance(body, list) else self.inline_statement(body)[1]
+            return prefix, ("FOR", declaration, condition, update, body)
+        if tag == "FUNCTION_DEF":
+            _, name, params, return_type, body = node
+            return [], ("FUNCTION_DEF", name, params, return_type, self.inline_statement(body)[1])
+
+        state = InlineState()
+        statement = self.expression(node, state)
+        # A call made only for its effects leaves nothing behind once its body has been inlined
+        if tag == "FUNCTION_CALL" and statement[0] == "IDENTIFIER":
+            statement = None
+        return state.prefix, statement
+
+    # Visits the parts of a statement in evaluation order, replacing calls that may be inlined
+    def expression(self, node, state):
+        if isinstance(node, list):
+            children = [self.expression(child, state) for child in node]
+            return node if all(new is old for new, old in zip(children, node)) else children
+        if not isinstance(node, tuple):
+            return node
+
+        if node[0] in SHORT_CIRCUIT_TAGS:
+            # The right operand may not be evaluated at all, so nothing in it moves ahead of the statement
+            left = self.expression(node[1], state)
+            movable = state.movable
+            state.movable = False
+            right = self.expression(node[2], state)
+            state.movable = movable and self.is_pure(right)
+            children = [left, right, *node[3:]]
+        else:
+            children = [self.expression(child, state) for child in node[1:]]
+
+        if any(new is not old for new, old in zip(children, node[1:])):
+            node = self.replace(node, (node[0], *children))
+        if node[0] == "FUNCTION_CALL":
+            inlined = self.inline_call(node, state)
+            if inlined is not None:
+                return inlined
+        if node[0] in IMPURE_TAGS:
+            state.movable = False
+        return node
+
+    def is_pure(self, node):
+        return all(child[0] not in IMPURE_TAGS for child in iter_nodes(node))
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Puts a copy of the called function's body in the statement's prefix and returns the variable holding
+    # its result, or returns None if the call is not inlined
+    def inline_call(self, node, state):
+        _, name, arguments = node
+        definition = self.candidates.get(name)
+        if definition is None or not state.movable or self.sizes[name] > self.budget:
+            return None
+        self.budget -= self.sizes[name]
+        self.inlined += 1
+        self.inlined_functions.add(name)
+        copy = self.inlined
+
+        # Parameters and locals are renamed with a '.' in their names, which source identifiers cannot contain
+        _, _, params, return_type, body = definition
+        renames = {param_name: f"{name}.{param_name}.{copy}" for param_name, _ in params}
+        for child in iter_nodes(body):
+            if child[0] == "DECLARATION":
+                renames[child[2]] = f"{name}.{child[2]}.{copy}"
+
+        statements = [("DECLARATION", param_type, renames[param_name], argument)
+                      for (param_name, param_type), argument in zip(params, arguments)]
+        statements += [self.rename(statement, renames) for statement in body[1][:-1]]
+        result = f"{name}.{copy}"
+        statements.append(("DECLARATION", return_type, result, self.rename(body[1][-1][1], renames)))
+
+        # The copied body may call other functions that can be inlined in turn
+        state.prefix.extend(self.inline_statements(statements))
+        return self.replace(node, ("IDENTIFIER", result))
+
+    # Copies a statement or expression of the function body, giving its variables the names of this copy
+    def rename(self, node, renames):
+        if isinstance(node, list):
+            return [self.rename(child, renames) for child in node]
+        if not isinstance(node, tuple):
+            return node
+        if node[0] == "IDENTIFIER":
+            new_node = ("IDENTIFIER", renames[node[1]])
+        elif node[0] == "ASSIGNMENT":
+            new_node = ("ASSIGNMENT", renames[node[1]], self.rename(node[2], renames))
+        elif node[0] == "DECLARATION":
+            new_node = ("DECLARATION", node[1], renames[node[2]], self.rename(node[3], renames))
+        else:
+            new_node = (node[0], *[self.rename(child, renames) for child in node[1:]])
+        return self.replace(node, new_node)
@@ -0,0 +1,202 @@
+# Import all definitions from the semantic analyser code
+from semantic_analyser import *
+
+###########################################################################################################################################
+
+# Nodes whose visit method only visits all of their operands, in order, before checking anything. Their
+# operands can be evaluated ahead of time, bottom-up, without changing the order diagnostics come out in.
+OPERAND_FIRST_NODES = frozenset([
+    "PLUS", "MINUS", "MUL", "DIV", "MOD", "NEGATIVE", "BINARY_EXPRESSION",
+    "LESS_THAN", "GREATER_THAN", "LESS_THAN_EQUAL", "GREATER_THAN_EQUAL", "EQUAL", "NOT_EQUAL",
+    "LOGICAL_AND", "LOGICAL_OPERATOR", "RELATIONAL_OPERATOR", "EQUALITY_OPERATOR",
+    "PRINT", "DELAY", "WIDTH", "HEIGHT", "RANDI_STATEMENT", "PIXEL_STATEMENT", "PIXELR_STATEMENT", "RETURN",
+])
+
+# Expressions described by a steps_<TAG> method, whose visit method runs once the steps are done to give
+# the node its type
+STEPPED_EXPRESSIONS = frozenset(["FUNCTION_CALL"])
+
+# Kinds of entries on the work stack
+VISIT = 0      # evaluate a node
+FINISH = 1     # run the visit method of a node whose operands were already evaluated
+ACTION = 2     # run a pre- or post-visit action of a compound statement
+
+###########################################################################################################################################
+
+# Semantic analysis driven by an explicit work stack instead of Python recursion. Expressions are evaluated
+# bottom-up and compound statements are broken into pre-visit actions, their children and post-visit actions,
+# so nesting depth costs work stack entries rather than interpreter frames. Diagnostics and recorded types
+# are the same as SemanticAnalyzer's.
+class IterativeSemanticAnalyzer(SemanticAnalyzer):
+    def __init__(self, ast):
+        super().__init__(ast)
+        # Types of operands evaluated ahead of their parent, consumed when the parent's visit method asks for them
+        self.results = {}
+        # Largest number of entries the work stack held, for comparison with the depth of the program
+        self.max_stack_size = 0
+        # Each compound statement is described by a steps_<TAG> method returning its work stack entries
+        self.dispatch_steps = {name[len("steps_"):]: getattr(type(self), name) for name in dir(type(self)) if name.startswith("steps_")}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def visit(self, node):
+        # Operands evaluated ahead of time are handed straight back to the visit method asking for them
+        if type(node) is tuple and id(node) in self.results:
+            return self.results.pop(id(node))
+        try:
+            return self.run(node)
+        except SemanticError:
+            self.results.clear()
+            raise
+
+    # Processes the work stack until the given node has been evaluated, returning its type
+    def run(self, node):
+        stack = [(VISIT, node, True)]
+        result = None
+
+        while stack:
+            if len(stack) > self.max_stack_size:
+                self.max_stack_size = len(stack)
+            kind, item, keep = stack.pop()
+
+            if kind == ACTION:
+                item()
+                continue
+
+            if kind == VISIT and type(item) is tuple:
+                steps = self.dispatch_steps.get(item[0])
+                if steps is not None:
+                    # Compound node: its actions and children, in the order its visit method would run them.
+                    # An expression's visit method then finds its operands' types waiting.
+                    if item[0] in STEPPED_EXPRESSIONS:
+                        stack.append((FINISH, item, keep))
+                    stack.extend(reversed(steps(self, item)))
+                    continue
+                if item[0] in OPERAND_FIRST_NODES:
+                    # Evaluate every operand first; the visit method then finds their types waiting
+                    stack.append((FINISH, item, keep))
+                    for child in reversed(self.operands(item)):
+                        stack.append((VISIT, child, True))
+                    continue
+
+            # Leaf or statement that needs its own ordering: its visit method runs now, and anything it
+            # visits that was not evaluated ahead of time gets a work stack of its own
+            data_type = SemanticAnalyzer.visit(self, item)
+            if item is node and not stack:
+                result = data_type
+            elif keep and type(item) is tuple:
+                self.results[id(item)] = data_type
+        return result
+
+    # The nodes an operand-first node visits, in the order it visits them
+    def operands(self, node):
+        operands = []
+        for child in node[1:]:
+            if type(child) is tuple:
+                operands.append(child)
+            elif type(child) is list:
+                operands.extend(child)
+        return operands
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    def action(self, function, *args):
+        return (ACTION, lambda: function(*args), False)
+
+    def statement(self, node):
+        # Statements are evaluated for their checks only; their value is not kept
+        return (VISIT, node, False)
+
+    def steps_BLOCK(self, node):
+        return [
+            self.action(self.capture_scope, node),
+            self.action(self.symbol_table.push_scope),
+            *[self.statement(statement) for statement in node[1]],
+            self.action(self.symbol_table.pop_scope),
+        ]
+
+    def steps_STATEMENT_BLOCK(self, node):
+        return [
+            self.action(self.capture_scope, node),
+            self.action(self.symbol_table.enter_scope),
+            *[self.statement(statement) for statement in node[1]],
+            self.action(self.symbol_table.exit_scope),
+        ]
+
+    def steps_WHILE(self, node):
+        condition, block = node[1], node[2]
+        return [
+            self.statement(condition),
+            self.action(self.symbol_table.push_scope),
+            self.statement(block),
+            self.action(self.symbol_table.pop_scope),
+        ]
+
+    def steps_IF(self, node):
+        if len(node) == 4:
+            _, condition, true_block, else_node = node
+        elif len(node) == 3:
+            _, condition, true_block = node
+            else_node = None
+        else:
+            raise ValueError("Invalid IF node structure")
+
+        steps = [
+            self.statement(condition),
+            self.action(self.symbol_table.enter_scope),
+            self.statement(true_block),
+            self.action(self.symbol_table.exit_scope),
+        ]
+        if else_node:
+            steps += [
+                self.action(self.symbol_table.enter_scope),
+                self.statement(else_node),
+                self.action(self.symbol_table.exit_scope),
+            ]
+        return steps
+
+    def steps_ELSE(self, node):
+        _, else_block = node
+        return [self.statement(else_block)]
+
+    def steps_FUNCTION_DEF(self, node):
+        _, name, params, return_type, block = node
+        return [
+            self.action(self.declare_function, node),
+            self.action(self.symbol_table.enter_scope),
+            self.action(self.add_parameters, params),
+            self.statement(block),
+            self.action(self.symbol_table.exit_scope),
+        ]
+
+    def add_parameters(self, params):
+        for param_name, param_type in params:
+            self.symbol_table.add(param_name, param_type)
+
+    def steps_FOR(self, node):
+        _, declaration_node, condition_node, update_node, block_node = node
+        return [
+            self.action(self.symbol_table.enter_scope),
+            self.statement(declaration_node),
+            self.statement(condition_node),
+            self.statement(update_node),
+            self.action(self.symbol_table.enter_scope),
+            *[self.statement(block_stmt) for block_stmt in block_node[1]],
+            self.action(self.symbol_table.exit_scope),
+            self.action(self.symbol_table.exit_scope),
+        ]
+
+    # Arguments are evaluated in order, each checked against its parameter before the next is evaluated,
+    # after the function and the number of arguments have been checked, as visit_FUNCTION_CALL does
+    def steps_FUNCTION_CALL(self, node):
+        _, name, arguments = node
+        steps = [self.action(self.call_signature, node)]
+        for index, argument in enumerate(arguments):
+            steps += [(VISIT, argument, True), self.action(self.check_evaluated_argument, node, index)]
+        return steps
+
+    def check_evaluated_argument(self, node, index):
+        _, name, arguments = node
+        params, _ = self.call_signature(node)
+        # The argument's type stays waiting for visit_FUNCTION_CALL, which checks it again without error
+        self.check_argument(name, params[index], self.results[id(arguments[index])])
@@ -234,11 +234,11 @@ class Parser:
         # Parse any additional comparison operators in the condition
         while self.match("EQUALITY_OPERATOR") or self.match("RELATIONAL_OPERATOR"):
             # Store the operator and parse the right side of the comparison
-            op = self.previous().token_type
+            op = self.previous()
             right = self.parse_logical_or()
 
             # Combine the left and right sides of the comparison with the operator
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         # Return the fully-parsed condition
         return left
@@ -252,11 +252,11 @@ class Parser:
         # Parse subsequent right operands while the current token is a logical OR operator
         while self.match("LOGICAL_OR"):
             # Get the operator and parse the next operand
-            op = self.previous().token_type
+            op = self.previous()
             right = self.parse_logical_and()
             
             # Combine the left and right operands with the logical OR operator
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         # Return the resulting expression
         return left
@@ -270,11 +270,11 @@ class Parser:
         # Parse subsequent right operands while the current token is a logical AND operator
         while self.match("LOGICAL_AND"):
             # Get the operator and parse the next operand
-            op = self.previous().token_type
+            op = self.previous()
             right = self.parse_comparison()
 
             # Combine the left and right operands with the logical AND operator
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         # Return the resulting expression
         return left
@@ -286,9 +286,9 @@ class Parser:
 
         # Keep parsing and combining terms as long as there are operators
         while self.match("PLUS") or self.match("MINUS") or self.match("MUL") or self.match("DIV") or self.match("MOD") or self.match("EQUALITY_OPERATOR") or self.match("RELATIONAL_OPERATOR") or self.match("LOGICAL_OPERATOR"):
-            op = self.previous().token_type
+            op = self.previous()
             right = self.parse_term()
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         return left
 
@@ -299,9 +299,9 @@ class Parser:
 
         # Keep parsing and combining factors as long as there are operators
         while self.match("EQUALITY_OPERATOR") or self.match("RELATIONAL_OPERATOR") or self.match("LOGICAL_OPERATOR"):
-            op = self.previous().token_type
+            op = self.previous()
             right = self.parse_factor()
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         return left
     
@@ -405,13 +405,13 @@ class Parser:
         # Continue parsing the right side of the comparison as long as there are more comparison operators
         while self.match("EQUALITY_OPERATOR") or self.match("RELATIONAL_OPERATOR"):
             # Get the comparison operator
-            op = self.previous().token_type
+            op = self.previous()
             
             # Parse the right side of the comparison
             right = self.parse_expression()
             
             # Combine the left and right sides of the comparison with the operator
-            left = (op, left, right)
+            left = self.binary_node(op, left, right)
 
         # Return the comparison expression
         return left
@@ -542,6 +542,14 @@ class Parser:
 
         return ("FOR", initialization, condition, update, body)
 
+###########################################################################################################################################
+
+    def binary_node(self, operator, left, right):
+        # Comparison and logical tokens cover several operators, so their nodes also keep the lexeme (e.g. '<=')
+        if operator.token_type in ("EQUALITY_OPERATOR", "RELATIONAL_OPERATOR", "LOGICAL_OPERATOR"):
+            return (operator.token_type, left, right, operator.lexeme)
+        return (operator.token_type, left, right)
+
 ###########################################################################################################################################
 
     def match(self, token_type):
@@ -583,34 +591,36 @@ class ParserError(Exception):
 
 # Usage:
 
-# Specify the name of the file
-filename = 'input.txt'
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    # Specify the name of the file
+    filename = 'input.txt'
 
-# Open the file and read the contents into a string
-with open(filename, 'r') as file:
-    source_code = file.read()
-    
-# Attempt to tokenize and parse the source code
-try:
-    # Tokenize the source code
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
-
-    # Parse the tokens into an abstract syntax tree
-    parser = Parser(tokens)
-    parsed_program = parser.parse()
-
-    # Print the parsed program
-    print("\n" + "-"*100)
-    print("\nParsed program:\n")
-    print(parsed_program)
-
-# Catch and report lexer errors
-except LexerError as e:
-    print(f"Error: {e}")
-
-# Catch and report parser errors
-except ParserError as e:
-    print(f"Error: {e}")
-
-print("\n" + "-"*100)
\ No newline at end of file
+    # Open the file and read the contents into a string
+    with open(filename, 'r') as file:
+        source_code = file.read()
+
+    # Attempt to tokenize and parse the source code
+    try:
+        # Tokenize the source code
+        lexer = Lexer(source_code)
+        tokens = lexer.tokenize()
+
+        # Parse the tokens into an abstract syntax tree
+        parser = Parser(tokens)
+        parsed_program = parser.parse()
+
+        # Print the parsed program
+        print("\n" + "-"*100)
+        print("\nParsed program:\n")
+        print(parsed_program)
+
+    # Catch and report lexer errors
+    except LexerError as e:
+        print(f"Error: {e}")
+
+    # Catch and report parser errors
+    except ParserError as e:
+        print(f"Error: {e}")
+
+    print("\n" + "-"*100)
\ No newline at end of file
@@ -0,0 +1,113 @@
+# Pattern-based peephole optimizer for generated PixIR. Each rule looks at a short window of consecutive
+# instructions and either leaves it alone or gives a cheaper sequence that leaves the stack, memory and
+# control flow in the same state; the rules are applied over the whole program until none of them matches.
+
+###########################################################################################################################################
+
+def is_label(instruction):
+    return instruction.startswith(".")
+
+def operand(instruction, opcode):
+    # Returns the operand of an instruction with the given opcode, or None for any other instruction
+    prefix = opcode + " "
+    return instruction[len(prefix):] if instruction.startswith(prefix) else None
+
+# Instructions after which execution never falls through to the next one
+UNCONDITIONAL_EXITS = ("jmp", "ret")
+
+###########################################################################################################################################
+
+class PeepholeOptimizer:
+    def __init__(self, code):
+        # The instructions to optimize, one per entry, labels included
+        self.code = list(code)
+        # Number of times each rule fired
+        self.applied = {}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Store then reload the same slot: keep a copy of the value instead of reading it back
+    #   push k / push 0 / st / push k / push 0 / ld  ->  dup / push k / push 0 / st
+    def store_then_load(self, window):
+        slot, frame, store, slot_again, frame_again, load = window
+        if store == "st" and load == "ld" and slot == slot_again and frame == frame_again \
+                and operand(slot, "push") is not None and operand(frame, "push") is not None:
+            return ["dup", slot, frame, store]
+        return None
+
+    # Load the same slot twice in a row: the second load is a copy of the first
+    #   push k / push 0 / ld / push k / push 0 / ld  ->  push k / push 0 / ld / dup
+    def load_then_load(self, window):
+        if window[:3] == window[3:] and window[2] == "ld" \
+                and operand(window[0], "push") is not None and operand(window[1], "push") is not None:
+            return window[:3] + ["dup"]
+        return None
+
+    # A value pushed or copied only to be dropped again
+    #   push x / drop  ->  (nothing)        dup / drop  ->  (nothing)
+    def push_then_drop(self, window):
+        first, second = window
+        if second == "drop" and (first == "dup" or operand(first, "push") is not None):
+            return []
+        return None
+
+    # A jump to a label that follows it directly; a conditional jump still has to pop its condition
+    #   jmp .L / .L  ->  .L                 cjmp .L / .L  ->  drop / .L
+    def jump_to_next(self, window):
+        jump, label = window
+        if not is_label(label) or self.label_count.get(label, 0) != 1:
+            return None
+        if operand(jump, "jmp") == label:
+            return [label]
+        if operand(jump, "cjmp") == label:
+            return ["drop", label]
+        return None
+
+    # Code between an unconditional jump or return and the next label can never run
+    #   jmp .L / x  ->  jmp .L              ret / x  ->  ret
+    def unreachable_after_exit(self, window):
+        exit_instruction, following = window
+        if exit_instruction.split(" ")[0] in UNCONDITIONAL_EXITS and not is_label(following):
+            return [exit_instruction]
+        return None
+
+    # Rewrite rules, each with the number of consecutive instructions it looks at
+    RULES = [
+        (6, store_then_load),
+        (6, load_then_load),
+        (2, push_then_drop),
+        (2, jump_to_next),
+        (2, unreachable_after_exit),
+    ]
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Applies the rules until the code stops changing and returns the optimized instructions
+    def optimize(self):
+        changed = True
+        while changed:
+            changed = False
+            # Label rules are only safe for labels defined once; the count is refreshed every pass
+            self.label_count = {}
+            for instruction in self.code:
+                if is_label(instruction):
+                    self.label_count[instruction] = self.label_count.get(instruction, 0) + 1
+
+            index = 0
+            while index < len(self.code):
+                for size, rule in self.RULES:
+                    window = self.code[index:index + size]
+                    if len(window) == size:
+                        replacement = rule(self, window)
+                        if replacement is not None:
+                            break
+                else:
+                    index += 1
+                    continue
+
+                self.applied[rule.__name__] = self.applied.get(rule.__name__, 0) + 1
+                self.code[index:index + size] = replacement
+                changed = True
+                # Step back so a rule can match across the instructions just rewritten
+                index = max(0, index - 5)
+        return self.code
@@ -0,0 +1,187 @@
+# Import all definitions from the constant folding code
+from constant_folding import *
+
+###########################################################################################################################################
+
+# Statements that contain other statements, whose statement lists are coalesced separately
+COMPOUND_TAGS = ("BLOCK", "IF", "ELSE", "WHILE", "FOR", "FUNCTION_DEF")
+
+# Raised when a statement's pixel writes cannot all be worked out at compile time
+class NotConstant(Exception):
+    pass
+
+###########################################################################################################################################
+
+# Replaces runs of pixel writes with as few rectangles as possible. A run is a sequence of consecutive
+# statements that only write pixels at positions and in colours known at compile time: __pixel statements
+# with constant arguments, and for loops with constant bounds whose bodies hold nothing else, which are
+# unrolled. Nothing can look at the display in the middle of a run, so only the colour each pixel ends up
+# with matters; the pixels of each colour are covered by disjoint rectangles, drawn by one __pixelr each.
+class PixelCoalescer:
+    def __init__(self, ast, expression_types=None, unroll_limit=4096, loop_coverage=4):
+        # The abstract syntax tree, normally after constant folding and propagation
+        self.ast = ast
+        # Types recorded during semantic analysis; the literals of the new statements are added to it
+        self.expression_types = expression_types if expression_types is not None else TypeAnnotations()
+        # Most pixel writes a run may gather, which also bounds the iterations of an unrolled loop
+        self.unroll_limit = unroll_limit
+        # Fewest pixel writes each rectangle must stand for, on average, for a run with loops to be replaced
+        self.loop_coverage = loop_coverage
+        # Number of pixel statements and loops replaced, and of statements put in their place
+        self.statistics = {"replaced": 0, "rectangles": 0}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the program with its runs of pixel writes replaced by rectangles
+    def coalesce(self):
+        return self.statements(self.ast)
+
+    def statements(self, statements):
+        result = []
+        run = []
+        writes = []
+        for statement in statements:
+            statement_writes = self.pixel_writes(statement)
+            if statement_writes is not None and len(writes) + len(statement_writes) <= self.unroll_limit:
+                run.append(statement)
+                writes += statement_writes
+                continue
+            result += self.replace_run(run, writes)
+            run, writes = [], []
+            if statement_writes is not None:
+                run, writes = [statement], statement_writes
+            else:
+                result.append(self.statement(statement))
+        return result + self.replace_run(run, writes)
+
+    # Coalesces the statement lists inside a compound statement
+    def statement(self, node):
+        tag = node[0]
+        if tag == "BLOCK":
+            return ("BLOCK", self.statements(node[1]))
+        if tag in COMPOUND_TAGS:
+            return (tag, *[self.statement(child) if isinstance(child, tuple) and child[0] in COMPOUND_TAGS
+                           else child for child in node[1:]])
+        return node
+
+    # The statements drawing a run's writes, if there are fewer of them than the run's own statements or, for
+    # a run with loops, far fewer of them than the writes the loops make; otherwise the run is kept as it is
+    def replace_run(self, run, writes):
+        rectangles = self.rectangles(writes)
+        has_loops = any(statement[0] == "FOR" for statement in run)
+        if len(rectangles) >= len(run) and not (has_loops and len(rectangles) * self.loop_coverage <= len(writes)):
+            return [self.statement(statement) for statement in run]
+        self.statistics["replaced"] += len(run)
+        self.statistics["rectangles"] += len(rectangles)
+        return [self.draw(*rectangle) for rectangle in rectangles]
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # The (x, y, colour) writes a statement makes, in order, or None if they are not all known
+    def pixel_writes(self, node):
+        writes = []
+        try:
+            self.run_statement(node, {}, writes)
+        except NotConstant:
+            return None
+        return writes
+
+    def run_statement(self, node, variables, writes):
+        if node[0] == "PIXEL_STATEMENT":
+            x, y, colour = (self.value(argument, variables) for argument in node[1])
+            if type(x) is not int or type(y) is not int or type(colour) is not str:
+                raise NotConstant()
+            writes.append((x, y, colour))
+        elif node[0] == "FOR":
+            self.run_loop(node, variables, writes)
+        else:
+            raise NotConstant()
+        if len(writes) > self.unroll_limit:
+            raise NotConstant()
+
+    # Unrolls a for loop whose counter is declared by the loop, so that it is not visible after it
+    def run_loop(self, node, variables, writes):
+        _, initialization, condition, update, body = node
+        if initialization[0] != "DECLARATION" or update[0] != "ASSIGNMENT" or update[1] != initialization[2]:
+            raise NotConstant()
+        statements = body[1] if isinstance(body, tuple) else body
+        counter = initialization[2]
+        variables = dict(variables)
+        variables[counter] = self.value(initialization[3], variables)
+
+        iterations = 0
+        while self.value(condition, variables):
+            iterations += 1
+            if iterations > self.unroll_limit:
+                raise NotConstant()
+            for statement in statements:
+                self.run_statement(statement, variables, writes)
+            variables[counter] = self.value(update[2], variables)
+
+    # Compile-time value of an expression made of literals, loop counters and integer arithmetic
+    def value(self, node, variables):
+        tag = node[0]
+        if tag in ("INTEGER_LITERAL", "BOOLEAN_LITERAL"):
+            return node[1]
+        if tag == "COLOR_LITERAL":
+            return node[1].lower()
+        if tag == "IDENTIFIER" and node[1] in variables:
+            return variables[node[1]]
+        if tag == "NEGATIVE":
+            return -self.integer(node[1], variables)
+        if tag in ("PLUS", "MINUS", "MUL"):
+            left, right = self.integer(node[1], variables), self.integer(node[2], variables)
+            return left + right if tag == "PLUS" else left - right if tag == "MINUS" else left * right
+        if tag in ("RELATIONAL_OPERATOR", "EQUALITY_OPERATOR") and node[3] in ConstantFolder.COMPARISONS:
+            return ConstantFolder.COMPARISONS[node[3]](self.value(node[1], variables), self.value(node[2], variables))
+        raise NotConstant()
+
+    def integer(self, node, variables):
+        value = self.value(node, variables)
+        if type(value) is not int:
+            raise NotConstant()
+        return value
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Disjoint (x, y, width, height, colour) rectangles covering every written pixel in the colour written
+    # to it last. Each rectangle starts at the first uncovered pixel of its colour in row order and is made
+    # as wide, and then as tall, as the pixels of that colour allow.
+    def rectangles(self, writes):
+        final = {}
+        for x, y, colour in writes:
+            final.pop((x, y), None)
+            final[(x, y)] = colour
+
+        remaining = {}
+        for position, colour in final.items():
+            remaining.setdefault(colour, set()).add(position)
+
+        rectangles = []
+        for colour, pixels in remaining.items():
+            for x, y in sorted(pixels, key=lambda position: (position[1], position[0])):
+                if (x, y) not in pixels:
+                    continue
+                width = 1
+                while (x + width, y) in pixels:
+                    width += 1
+                height = 1
+                while all((column, y + height) in pixels for column in range(x, x + width)):
+                    height += 1
+                for row in range(y, y + height):
+                    for column in range(x, x + width):
+                        pixels.discard((column, row))
+                rectangles.append((x, y, width, height, colour))
+        return rectangles
+
+    # The statement drawing one rectangle: a __pixel for a single pixel, a __pixelr for anything larger
+    def draw(self, x, y, width, height, colour):
+        colour_node = self.literal("COLOR_LITERAL", colour, COLOUR)
+        if width == height == 1:
+            return ("PIXEL_STATEMENT", [self.literal("INTEGER_LITERAL", x, INT), self.literal("INTEGER_LITERAL", y, INT), colour_node])
+        return ("PIXELR_STATEMENT", [self.literal("INTEGER_LITERAL", value, INT) for value in (x, y, width, height)] + [colour_node])
+
+    def literal(self, tag, value, data_type):
+        node = (tag, value)
+        self.expression_types.record(node, data_type)
+        return node
@@ -1,111 +1,288 @@
 # Import all definitions from the lexer and parser code
 from lexer import *
 from parser_ import *
+from hamt import PersistentMap
+from visitor import ASTVisitor, VisitorError, iter_nodes
+from types_ import *
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+import io
+import os
 
 ###########################################################################################################################################
 
-class SemanticError(Exception):
+class SemanticError(VisitorError):
     pass
 
 ###########################################################################################################################################
 
+# Turns any spelling of a type name into its interned type; function signatures are stored as they are
+def resolve_type(data_type):
+    if isinstance(data_type, str):
+        resolved = type_named(data_type)
+        if resolved is None:
+            raise SemanticError(f"Unknown type '{data_type}'.")
+        return resolved
+    return data_type
+
+###########################################################################################################################################
+
+class PersistentSymbolTable:
+    def __init__(self, bindings=None, parent=None):
+        # Each version is one immutable scope plus a link to the enclosing version
+        self.bindings = bindings if bindings is not None else PersistentMap()
+        self.parent = parent
+
+    # Returns a new version with an empty innermost scope
+    def enter_scope(self):
+        return PersistentSymbolTable(PersistentMap(), self)
+
+    # Returns the version that was current before the innermost scope was entered
+    def exit_scope(self):
+        if self.parent is None:
+            raise SemanticError("Cannot exit the global scope.")
+        return self.parent
+
+    # Returns a new version with the variable added to the innermost scope
+    def add(self, name, data_type):
+        if name in self.bindings:
+            raise SemanticError(f"Variable '{name}' is already declared in the current scope.")
+        return PersistentSymbolTable(self.bindings.set(name, data_type), self.parent)
+
+    # Looks up a variable, starting from the innermost scope
+    def lookup(self, name):
+        scope = self
+        while scope is not None:
+            if name in scope.bindings:
+                return scope.bindings[name]
+            scope = scope.parent
+        return None
+
+    # Returns a new version with the data type of a variable updated in the scope that declares it
+    def update(self, name, data_type):
+        if name in self.bindings:
+            return PersistentSymbolTable(self.bindings.set(name, data_type), self.parent)
+        if self.parent is None:
+            raise SemanticError(f"Variable '{name}' not found in any scope.")
+        return PersistentSymbolTable(self.bindings, self.parent.update(name, data_type))
+
+###########################################################################################################################################
+
 class SymbolTable:
     def __init__(self):
-        self.scopes = [{}]
+        # The current version of the table; older versions stay valid as snapshots
+        self.current = PersistentSymbolTable()
     
     # Enters a new scope
     def enter_scope(self):
-        self.scopes.append({})
+        self.current = self.current.enter_scope()
 
     # Exits the current scope
     def exit_scope(self):
-        self.scopes.pop()
+        self.current = self.current.exit_scope()
         
     # Adds a new scope (redundant with enter_scope)
     def push_scope(self):
-        self.scopes.append({})
+        self.enter_scope()
 
     # Removes the current scope (redundant with exit_scope)
     def pop_scope(self):
-        self.scopes.pop()
+        self.exit_scope()
 
     # Adds a new variable to the current scope
     def add(self, name, data_type):
-        if name in self.scopes[-1]:
-            raise SemanticError(f"Variable '{name}' is already declared in the current scope.")
-        self.scopes[-1][name] = data_type
+        self.current = self.current.add(name, resolve_type(data_type))
 
     # Looks up a variable in the symbol table
     def lookup(self, name):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                return scope[name]
-        return None
+        return self.current.lookup(name)
 
     # Updates the data type of a variable
     def update(self, name, data_type):
-        for scope in reversed(self.scopes):
-            if name in scope:
-                scope[name] = data_type
-                return
-        raise SemanticError(f"Variable '{name}' not found in any scope.")
-    
-    # Returns the data type of an expression
-    def get_type(self, expr):
-        if expr[0] == 'IDENTIFIER':
-            return self.lookup(expr[1])
-        elif expr[0] == 'INTEGER_LITERAL':
-            return 'int'
-        elif expr[0] == 'FLOAT_LITERAL':
-            return 'float'
-        elif expr[0] == 'STRING_LITERAL':
-            return 'string'
-        elif expr[0] == 'COLOR_LITERAL':
-            return 'colour'
-        else:
-            return None
+        self.current = self.current.update(name, resolve_type(data_type))
+
+    # Captures the environment at this point without copying any scope
+    def snapshot(self):
+        return self.current
+
+    # Makes a previously captured snapshot the current environment
+    def restore(self, snapshot):
+        self.current = snapshot
     
 ###########################################################################################################################################
 
-class SemanticAnalyzer:
+class TypeAnnotations:
+    def __init__(self):
+        # Maps id(node) to (node, type); keeping the node alive stops its id from being reused
+        self.types = {}
+
+    # Records the resolved type of an expression node
+    def record(self, node, data_type):
+        self.types[id(node)] = (node, data_type)
+
+    # Returns the recorded type of an expression node, or None if it was never typed
+    def lookup(self, node):
+        entry = self.types.get(id(node))
+        return entry[1] if entry is not None else None
+
+    # Drops the recorded type of a node that is no longer part of the program
+    def forget(self, node):
+        self.types.pop(id(node), None)
+
+    def __contains__(self, node):
+        return id(node) in self.types
+
+    def __len__(self):
+        return len(self.types)
+
+###########################################################################################################################################
+
+class SemanticAnalyzer(ASTVisitor):
     def __init__(self, ast):
         # Initialize the SemanticAnalyzer with the given abstract syntax tree (AST).
         self.ast = ast
         
         # Create a new symbol table for semantic analysis.
         self.symbol_table = SymbolTable()
+
+        # Environment captured on entry to each BLOCK and FUNCTION_DEF node, keyed by node identity
+        self.scope_snapshots = {}
+
+        # Resolved type of every expression node, shared with the code generator
+        self.expression_types = TypeAnnotations()
     
     #---------------------------------------------------------------------------------------------------------------------------------------
 
     def visit(self, node):
-        # If the node is a tuple, use the first element to determine the method name to be called
-        if isinstance(node, tuple):
-            method_name = f'visit_{node[0]}'
-            # Get the appropriate method and call it, using generic_visit as a fallback
-            visitor = getattr(self, method_name, self.generic_visit)
-            return visitor(node)
-        else:
-            # If the node is not a tuple, it is not supported
-            raise SemanticError(f"Unsupported node type '{type(node).__name__}'.")
+        data_type = super().visit(node)
+        # Expression visits return their type; keep it so no later pass has to re-derive it
+        if data_type is not None:
+            self.expression_types.record(node, data_type)
+        return data_type
+
+    # Returns the type recorded for an expression node during analysis
+    def type_of(self, node):
+        return self.expression_types.lookup(node)
+
+    # Checks the whole program. With more than one worker, top-level statements and function signatures are
+    # checked in order first and the function bodies are then checked in parallel across a process pool.
+    # Programs whose bodies are too small to repay starting the pool, or machines with a single CPU, are
+    # checked sequentially whatever the number of workers.
+    def analyze(self, workers=None):
+        if workers is not None and workers > 1 and not worth_parallel_checking(self.ast):
+            workers = None
+        if workers is None or workers < 2:
+            for node in self.ast:
+                self.visit(node)
+            return
+        self.analyze_in_parallel(workers)
+
+    # Checks the program with its function bodies deferred to a process pool, then replays everything in
+    # source order: what each statement and body printed, the types and scope snapshots each body recorded,
+    # and the first error, after which nothing is printed or kept, exactly as a sequential run would do
+    def analyze_in_parallel(self, workers):
+        outputs = []
+        deferred_bodies = []
+        first_error = None
+
+        for position, node in enumerate(self.ast):
+            # What a statement prints is held back, as bodies declared before it must be printed first
+            output = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(output):
+                    if isinstance(node, tuple) and node[0] == "FUNCTION_DEF":
+                        # Bodies only see globals declared before them, so pair each with the environment at this point
+                        self.declare_function(node)
+                        deferred_bodies.append((position, node, self.symbol_table.snapshot()))
+                    else:
+                        self.visit(node)
+            except SemanticError as e:
+                # Checking stops at the first error, exactly as a sequential run would
+                first_error = e
+            outputs.append(output.getvalue())
+            if first_error is not None:
+                break
+
+        results = check_function_bodies(deferred_bodies, workers)
+        bodies = {position: (node, snapshot, result) for (position, node, snapshot), result in zip(deferred_bodies, results)}
+        types = self.expression_types.types
+        for position, output in enumerate(outputs):
+            print(output, end="")
+            if position not in bodies:
+                continue
+            node, snapshot, (error, body_output, type_ids, other_types, scopes) = bodies[position]
+            print(body_output, end="")
+            # Adopt the types and scope snapshots the worker recorded, keyed by the nodes of this process
+            for index, child in enumerate(iter_nodes(node)):
+                type_id = type_ids[index]
+                if type_id != UNTYPED:
+                    types[id(child)] = (child, ALL_TYPES[type_id])
+                elif index in other_types:
+                    types[id(child)] = (child, other_types[index])
+                if index in scopes:
+                    self.scope_snapshots[id(child)] = (child, scopes[index])
+            if error is not None:
+                # Statements after the failing body were checked here, but a sequential run never reaches them
+                self.forget_statements(position + 1, len(outputs))
+                self.symbol_table.restore(snapshot)
+                raise SemanticError(error)
+
+        if first_error is not None:
+            raise first_error
+
+    # Drops the types and scope snapshots recorded for the top-level statements in [start, end), apart from
+    # nodes that are shared with the statements before them
+    def forget_statements(self, start, end):
+        kept = {id(child) for node in self.ast[:start] for child in iter_nodes(node)}
+        for node in self.ast[start:end]:
+            for child in iter_nodes(node):
+                if id(child) not in kept:
+                    self.expression_types.forget(child)
+                    self.scope_snapshots.pop(id(child), None)
+
+    # If the node is not a tuple, it is not supported
+    def unsupported_node(self, node):
+        raise SemanticError(f"Unsupported node type '{type(node).__name__}'.")
 
     # Raises a SemanticError indicating that no method has been implemented for the node type
     def generic_visit(self, node):
         raise SemanticError(f"No visit method implemented for node type '{node[0]}'.")
+
+    # Records the environment a scoped node is checked in, so it can be re-checked later on its own
+    def capture_scope(self, node):
+        self.scope_snapshots[id(node)] = (node, self.symbol_table.snapshot())
+
+    # Re-checks a previously visited BLOCK or FUNCTION_DEF node without replaying the rest of the program
+    def recheck(self, node):
+        if id(node) not in self.scope_snapshots:
+            raise SemanticError(f"No scope snapshot recorded for node type '{node[0]}'.")
+        _, snapshot = self.scope_snapshots[id(node)]
+
+        # Check the node in its captured environment, then put the current environment back
+        current = self.symbol_table.snapshot()
+        self.symbol_table.restore(snapshot)
+        try:
+            return self.visit(node)
+        finally:
+            self.symbol_table.restore(current)
     
     # Visits a declaration node and adds the variable to the symbol table
     def visit_DECLARATION(self, node):
         # Get the data type, name, and expression from the node
         _, data_type, name, expression = node
+        declared_type = resolve_type(data_type)
 
         try:
             # Add the variable to the symbol table
-            self.symbol_table.add(name, data_type)
+            self.symbol_table.add(name, declared_type)
         except SemanticError as e:
             # If the variable is already declared, raise an error
             print(f"Error: {e}")
 
-        # Visit the expression
-        self.visit(expression)
+        # Visit the expression and check it can be stored in the variable
+        expr_type = self.visit(expression)
+        if not is_assignable(expr_type, declared_type):
+            raise SemanticError(f"Type mismatch in declaration of variable '{name}': {declared_type} vs {expr_type}.")
 
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -117,9 +294,9 @@ class SemanticAnalyzer:
         if data_type is None:
             raise SemanticError(f"Variable '{name}' not declared.")
 
-        # Check if the expression type matches the declared type of the variable
+        # Check if the expression type matches (or promotes to) the declared type of the variable
         expr_type = self.visit(expression)
-        if data_type != expr_type:
+        if not is_assignable(expr_type, data_type):
             raise SemanticError(f"Type mismatch in assignment to variable '{name}'.")
 
     #---------------------------------------------------------------------------------------------------------------------------------------
@@ -127,13 +304,13 @@ class SemanticAnalyzer:
     def visit_LITERAL(self, node):
         _, value = node
         
-        # Determine the type of the literal node and return it
-        if isinstance(value, int):
-            return 'int'
+        # Determine the type of the literal node and return it (bool first, as it is a subclass of int)
+        if isinstance(value, bool):
+            return BOOL
+        elif isinstance(value, int):
+            return INT
         elif isinstance(value, float):
-            return 'float'
-        elif isinstance(value, bool):
-            return 'bool'
+            return FLOAT
         else:
             raise SemanticError(f"Unsupported literal type '{type(value).__name__}'.")
     
@@ -144,12 +321,23 @@ class SemanticAnalyzer:
         left_type = self.visit(node[1])
         right_type = self.visit(node[2])
         
-        # Check if the operands are of type 'int'
-        if left_type != 'int' or right_type != 'int':
-            raise SemanticError("Operands of '+' operator must be of type 'int'.")
-        
-        # Return the resulting type
-        return 'int'
+        # Return the type both numeric operands promote to
+        return self.numeric_result("+", left_type, right_type)
+
+    def visit_MINUS(self, node):
+        # Get the types of the left and right operands of the '-' operator
+        left_type = self.visit(node[1])
+        right_type = self.visit(node[2])
+
+        # Return the type both numeric operands promote to
+        return self.numeric_result("-", left_type, right_type)
+
+    # Checks that both operands of an arithmetic operator are numeric and returns the promoted type
+    def numeric_result(self, operator, left_type, right_type):
+        result_type = join(left_type, right_type)
+        if result_type is None or not result_type.is_numeric:
+            raise SemanticError(f"Operands of '{operator}' operator must be numeric, got {left_type} and {right_type}.")
+        return result_type
 
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -159,12 +347,8 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check if the operands are of the same type
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-
-        # Return the resulting type
-        return left_type
+        # Return the type both numeric operands promote to
+        return self.numeric_result("*", left_type, right_type)
 
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -183,13 +367,13 @@ class SemanticAnalyzer:
         # Extract the value from the literal node
         _, value = node
         
-        # Determine the type of the literal based on its Python type
-        if isinstance(value, int):
-            return 'int'
+        # Determine the type of the literal node and return it (bool first, as it is a subclass of int)
+        if isinstance(value, bool):
+            return BOOL
+        elif isinstance(value, int):
+            return INT
         elif isinstance(value, float):
-            return 'float'
-        elif isinstance(value, bool):
-            return 'bool'
+            return FLOAT
         else:
             raise SemanticError(f"Unsupported literal type '{type(value).__name__}'.")
         
@@ -214,6 +398,7 @@ class SemanticAnalyzer:
     def visit_STATEMENT_BLOCK(self, node):
         # Extract the list of statements from the node
         _, statements = node
+        self.capture_scope(node)
         
         # Enter a new scope in the symbol table
         self.symbol_table.enter_scope()
@@ -233,12 +418,13 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check for type mismatch
-        if left_type != right_type:
+        # Check for type mismatch, allowing numeric promotion
+        result_type = join(left_type, right_type)
+        if result_type is None:
             raise SemanticError("Type mismatch in binary expression.")
 
-        # Return the type of the left expression (as all valid expressions must have the same type)
-        return left_type
+        # Return the common type of both expressions
+        return result_type
         
     #---------------------------------------------------------------------------------------------------------------------------------------
         
@@ -247,12 +433,12 @@ class SemanticAnalyzer:
         _, expr = node
         expr_type = self.visit(expr)
 
-        # Check that expression is of type 'int'
-        if expr_type != 'int':
-            raise SemanticError("Operand of '-' operator must be of type 'int'.")
+        # Check that expression is numeric
+        if not isinstance(expr_type, PArLType) or not expr_type.is_numeric:
+            raise SemanticError("Operand of '-' operator must be numeric.")
 
-        # Return 'int' as the type of the negative expression will always be 'int'
-        return 'int'
+        # Negation keeps the type of its operand
+        return expr_type
         
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -262,12 +448,11 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check that both left and right expressions are of type 'float'
-        if left_type != 'float' or right_type != 'float':
-            raise SemanticError("Operands of '/' operator must be of type 'float'.")
+        # Check that both left and right expressions are numeric
+        self.numeric_result("/", left_type, right_type)
 
-        # Return 'float' as the type of the expression will always be 'float'
-        return 'float'
+        # Return 'float' as division always promotes its operands to float
+        return FLOAT
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -277,11 +462,11 @@ class SemanticAnalyzer:
         right_type = self.visit(right)
 
         # Check if operands are of type 'int'
-        if left_type != 'int' or right_type != 'int':
+        if left_type is not INT or right_type is not INT:
             raise SemanticError("Operands of '%' operator must be of type 'int'.")
         
         # Return the resulting type of the operation
-        return 'int'
+        return INT
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -290,14 +475,8 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check if the operands have the same type and if it's numeric
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-        if left_type not in ['int', 'float']:
-            raise SemanticError("Operands of '<' operator must be of numeric type.")
-        
-        # Return the resulting type of the operation
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('<', left_type, right_type)
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -306,14 +485,8 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check if the operands have the same type and if it's numeric
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-        if left_type not in ['int', 'float']:
-            raise SemanticError("Operands of '>' operator must be of numeric type.")
-        
-        # Return the resulting type of the operation
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('>', left_type, right_type)
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -322,15 +495,8 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # check for type compatibility
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-
-        # check if both operands are numeric
-        if left_type not in ['int', 'float']:
-            raise SemanticError("Operands of '<=' operator must be of numeric type.")
-        
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('<=', left_type, right_type)
 
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -339,49 +505,28 @@ class SemanticAnalyzer:
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # check for type compatibility
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-
-        # check if both operands are numeric
-        if left_type not in ['int', 'float']:
-            raise SemanticError("Operands of '>=' operator must be of numeric type.")
-        
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('>=', left_type, right_type)
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_EQUAL(self, node):
-        # Extract the left and right expressions
         _, left, right = node
-        
-        # Get the types of the left and right expressions
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check for a type mismatch between the left and right expressions
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-        
-        # Return the boolean type
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('==', left_type, right_type)
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_NOT_EQUAL(self, node):
-        # Extract the left and right expressions
         _, left, right = node
-        
-        # Get the types of the left and right expressions
         left_type = self.visit(left)
         right_type = self.visit(right)
 
-        # Check for a type mismatch between the left and right expressions
-        if left_type != right_type:
-            raise SemanticError("Type mismatch in binary expression.")
-        
-        # Return the boolean type
-        return 'bool'
+        # Check the operands can be compared and return the resulting type of the operation
+        return self.comparison_result('!=', left_type, right_type)
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -394,36 +539,51 @@ class SemanticAnalyzer:
         right_type = self.visit(right)
 
         # Check that the left and right expressions are both of type bool
-        if left_type != 'bool' or right_type != 'bool':
+        if left_type is not BOOL or right_type is not BOOL:
             raise SemanticError("Operands of '&&' operator must be of type 'bool'.")
         
         # Return the boolean type
-        return 'bool'
+        return BOOL
+
+    def visit_LOGICAL_OPERATOR(self, node):
+        # Extract the left and right expressions and the operator ('and' / 'or')
+        _, left, right, operator = node
+
+        # Get the types of the left and right expressions
+        left_type = self.visit(left)
+        right_type = self.visit(right)
+
+        # Check that the left and right expressions are both of type bool
+        if left_type is not BOOL or right_type is not BOOL:
+            raise SemanticError(f"Operands of '{operator}' operator must be of type 'bool'.")
+
+        # Return the boolean type
+        return BOOL
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_FLOAT_LITERAL(self, node):
-        return 'float'
+        return FLOAT
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_BOOLEAN_LITERAL(self, node):
-        return 'bool'
+        return BOOL
 
     #---------------------------------------------------------------------------------------------------------------------------------------
    
     def visit_INTEGER_LITERAL(self, node):
-        return 'int' 
+        return INT
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_COLOR_LITERAL(self, node):
-        return 'color'
+        return COLOUR
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_STRING_LITERAL(self, node):
-        return 'str'
+        return STRING
     
     #---------------------------------------------------------------------------------------------------------------------------------------
     
@@ -441,7 +601,7 @@ class SemanticAnalyzer:
         _, delay_time = node
 
         # ensure the delay time is an integer
-        if not isinstance(delay_time[1], int):
+        if self.visit(delay_time) is not INT:
             raise SemanticError(f"Delay time must be an integer.")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
@@ -451,7 +611,7 @@ class SemanticAnalyzer:
         # visit the expression to determine its type
         expr_type = self.visit(expression)
         # check if the type is 'int'
-        if expr_type != 'int':
+        if expr_type is not INT:
             # if not, raise a semantic error
             raise SemanticError("Argument of 'WIDTH' instruction must be of type 'int'.")
 
@@ -460,45 +620,45 @@ class SemanticAnalyzer:
         # visit the expression to determine its type
         expr_type = self.visit(expression)
         # check if the type is 'int'
-        if expr_type != 'int':
+        if expr_type is not INT:
             # if not, raise a semantic error
             raise SemanticError("Argument of 'HEIGHT' instruction must be of type 'int'.")
         
     #---------------------------------------------------------------------------------------------------------------------------------------
         
     def visit_READ_STATEMENT(self, node):
-        # get the list of variables to be read
-        variables = node[1]
-        # check if each variable is declared in the symbol table
-        for var in variables:
-            if self.symbol_table.lookup(var[1]) is None:
-                raise SemanticError(f"Variable '{var[1]}' not declared.")
+        # get the coordinates of the pixel to be read
+        coordinates = node[1]
+        # check each coordinate is an integer expression
+        for coordinate in coordinates:
+            if self.visit(coordinate) is not INT:
+                raise SemanticError("Coordinates of '__read' must be of type 'int'.")
+        # reading a pixel gives its colour
+        return COLOUR
 
 #---------------------------------------------------------------------------------------------------------------------------------------
 
     def visit_RANDI_STATEMENT(self, node):
-        _, variable = node
-        # check if the variable is declared in the symbol table
-        if self.symbol_table.lookup(variable[1]) is None:
-            raise SemanticError(f"Variable '{variable[1]}' not declared.")
+        _, bound = node
+        # check the upper bound is an integer expression
+        if self.visit(bound) is not INT:
+            raise SemanticError("Argument of '__randi' must be of type 'int'.")
+        # the random value is an integer
+        return INT
         
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_PIXEL_STATEMENT(self, node):
-        for expr in node[1]:
-            self.visit(expr)
         # Ensure that the arguments passed to PIXEL_STATEMENT are of correct type
-        args = [self.symbol_table.get_type(expr) for expr in node[1]]
-        if len(args) == 3 and args != ['int', 'int', 'int']:
-            raise SemanticError(f"Incompatible argument types for PIXEL_STATEMENT: {args}, expected: ['int', 'int', 'int']")
+        args = [self.visit(expr) for expr in node[1]]
+        if args != [INT, INT, COLOUR]:
+            raise SemanticError(f"Incompatible argument types for PIXEL_STATEMENT: {args}, expected: [int, int, colour]")
         
     def visit_PIXELR_STATEMENT(self, node):
-        for expr in node[1]:
-            self.visit(expr)
-        # Ensure that the arguments passed to PIXEL_STATEMENT are of correct type
-        args = [self.symbol_table.get_type(expr) for expr in node[1]]
-        if args != ['int', 'int', 'int', 'int', 'colour']:
-            raise SemanticError(f"Incompatible argument types for PIXEL_STATEMENT: {args}, expected: ['int', 'int', 'int', 'int', 'colour']")
+        # Ensure that the arguments passed to PIXELR_STATEMENT are of correct type
+        args = [self.visit(expr) for expr in node[1]]
+        if args != [INT, INT, INT, INT, COLOUR]:
+            raise SemanticError(f"Incompatible argument types for PIXELR_STATEMENT: {args}, expected: [int, int, int, int, colour]")
 
     #---------------------------------------------------------------------------------------------------------------------------------------
 
@@ -517,19 +677,37 @@ class SemanticAnalyzer:
     #---------------------------------------------------------------------------------------------------------------------------------------
             
     def visit_RELATIONAL_OPERATOR(self, node):
-        # Extract the left and right operands from the node
-        left_operand = node[1][0]
-        right_operand = node[1][1]
-        # Retrieve the data types of the operands from the symbol table
-        left_type = self.symbol_table.get_type(left_operand)
-        right_type = self.symbol_table.get_type(right_operand)
-        # Check if the types of the operands match
-        if left_type != right_type:
-            raise SemanticError(f"Type mismatch in relational operator '{node[0]}': {left_type} vs {right_type}")
+        # Extract the left and right operands and the operator from the node
+        _, left_operand, right_operand, operator = node
+        # Resolve the operand types and check they can be compared
+        left_type = self.visit(left_operand)
+        right_type = self.visit(right_operand)
+        return self.comparison_result(operator, left_type, right_type)
+
+    def visit_EQUALITY_OPERATOR(self, node):
+        # Extract the left and right operands and the operator from the node
+        _, left_operand, right_operand, operator = node
+        # Resolve the operand types and check they can be compared
+        left_type = self.visit(left_operand)
+        right_type = self.visit(right_operand)
+        return self.comparison_result(operator, left_type, right_type)
+
+    # Checks the operand types of a comparison and returns its (boolean) type
+    def comparison_result(self, operator, left_type, right_type):
+        common_type = join(left_type, right_type)
+        # Operands must share a type, after promoting int to float
+        if common_type is None:
+            raise SemanticError(f"Type mismatch in relational operator '{operator}': {left_type} vs {right_type}")
+        # Only numbers can be ordered
+        if operator in ("<", ">", "<=", ">=") and not common_type.is_numeric:
+            raise SemanticError(f"Operands of '{operator}' operator must be of numeric type.")
+        return BOOL
             
     #---------------------------------------------------------------------------------------------------------------------------------------        
 
     def visit_BLOCK(self, node):
+        self.capture_scope(node)
+
         # Enter a new scope for the block
         self.symbol_table.push_scope()
         # Visit the statements in the block
@@ -566,13 +744,29 @@ class SemanticAnalyzer:
             self.visit(else_node)
             self.symbol_table.exit_scope()
     
+    def visit_ELSE(self, node):
+        # The else branch of an IF node; its scope is entered by visit_IF
+        _, else_block = node
+        self.visit(else_block)
+
     #---------------------------------------------------------------------------------------------------------------------------------------
     
     def visit_FUNCTION_DEF(self, node):
+        # Make the signature visible, then check the body
+        self.declare_function(node)
+        self.check_function_body(node)
+
+    # Adds a function's signature to the current scope, without looking at its body
+    def declare_function(self, node):
         _, name, params, return_type, block = node
+        self.capture_scope(node)
 
         # Add the function to the symbol table with its name, parameters, and return type
-        self.symbol_table.add(name, (params, return_type))
+        self.symbol_table.add(name, (params, resolve_type(return_type)))
+
+    # Checks a function's body; it only depends on the environment the function was declared in
+    def check_function_body(self, node):
+        _, name, params, return_type, block = node
 
         # Enter a new scope
         self.symbol_table.enter_scope()
@@ -588,7 +782,40 @@ class SemanticAnalyzer:
         self.symbol_table.exit_scope()
         
     #---------------------------------------------------------------------------------------------------------------------------------------
-        
+
+    def visit_FUNCTION_CALL(self, node):
+        _, name, arguments = node
+        params, return_type = self.call_signature(node)
+
+        # Check each argument can be passed as its parameter
+        for argument, param in zip(arguments, params):
+            self.check_argument(name, param, self.visit(argument))
+
+        return return_type
+
+    # Returns the (parameters, return type) signature of the called function, once the call is known to
+    # give it the right number of arguments
+    def call_signature(self, node):
+        _, name, arguments = node
+
+        # Functions are stored in the symbol table as (parameters, return type)
+        signature = self.symbol_table.lookup(name)
+        if not isinstance(signature, tuple):
+            raise SemanticError(f"Function '{name}' not declared.")
+        params, return_type = signature
+
+        if len(arguments) != len(params):
+            raise SemanticError(f"Function '{name}' expects {len(params)} argument(s) but got {len(arguments)}.")
+        return params, return_type
+
+    # Checks a value of the argument's type can be passed as the parameter of the named function
+    def check_argument(self, name, param, argument_type):
+        param_name, param_type = param
+        if not is_assignable(argument_type, resolve_type(param_type)):
+            raise SemanticError(f"Type mismatch in argument '{param_name}' of function '{name}': {resolve_type(param_type)} vs {argument_type}.")
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
     def visit_RETURN(self, node):
         # extract the expression to be returned from the node
         _, expression = node
@@ -601,10 +828,9 @@ class SemanticAnalyzer:
     def visit_FOR(self, node):
         _, declaration_node, condition_node, update_node, block_node = node
 
-        # Visit the declaration node and add the variable to the symbol table
+        # The loop variable is declared in a scope of its own around the loop
+        self.symbol_table.enter_scope()
         self.visit(declaration_node)
-        var_name = declaration_node[2]
-        self.symbol_table.add(var_name, 'int')
 
         # Visit the condition and update nodes
         self.visit(condition_node)
@@ -613,57 +839,160 @@ class SemanticAnalyzer:
         # Enter a new scope for the block
         self.symbol_table.enter_scope()
 
-        # Visit the block nodes
-        for block_stmt in block_node:
+        # Visit the statements of the block
+        for block_stmt in block_node[1]:
             self.visit(block_stmt)
 
-        # Exit the scope for the block
+        # Exit the scopes of the block and of the loop variable
+        self.symbol_table.exit_scope()
         self.symbol_table.exit_scope()
 
     #---------------------------------------------------------------------------------------------------------------------------------------
     
 ###########################################################################################################################################
 
-# Usage:
+# Fewest nodes the function bodies of a program must have between them for a process pool to pay off
+PARALLEL_THRESHOLD = 20000
 
-# Specify the name of the file
-filename = 'input.txt'
+# Number of batches each worker is given; more than one evens out bodies of different sizes
+BATCHES_PER_WORKER = 2
 
-# Open the file and read its contents into a string
-with open(filename, 'r') as file:
-    source_code = file.read()
+# Marks a node with no recorded type in a worker's type table
+UNTYPED = 255
 
-try:
-    # Tokenize the source code
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()
+# Whether checking the program's function bodies in parallel can be faster than checking them in order
+def worth_parallel_checking(ast):
+    if (os.cpu_count() or 1) < 2:
+        return False
+    nodes = 0
+    for node in ast:
+        if isinstance(node, tuple) and node[0] == "FUNCTION_DEF":
+            # Stop counting as soon as the threshold is reached
+            for _ in iter_nodes(node[4]):
+                nodes += 1
+                if nodes >= PARALLEL_THRESHOLD:
+                    return True
+    return False
+
+# Checks each deferred function body, in a process pool when there is more than one. The bodies are
+# handed to each worker once, when it starts, which costs nothing where workers are forked; tasks then
+# only name their bodies, in batches of consecutive functions of about the same total size, so that each
+# task carries several of them and the environments they share are pickled once per batch.
+def check_function_bodies(deferred_bodies, workers, batches=None):
+    if len(deferred_bodies) < 2:
+        return [check_function_body_in_worker((node, snapshot)) for _, node, snapshot in deferred_bodies]
+    if batches is None:
+        batches = workers * BATCHES_PER_WORKER
+    nodes = [node for _, node, _ in deferred_bodies]
+    tasks = [[(index, deferred_bodies[index][2]) for index in batch] for batch in split_batches(nodes, batches)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=receive_function_bodies, initargs=(nodes,)) as executor:
+        # map() hands results back in submission order, whichever worker finishes first
+        results = []
+        for batch_results in executor.map(check_function_batch, tasks):
+            results += batch_results
+        return results
+
+# Splits the indices of the function nodes, in order, into at most the given number of runs with about
+# as many top-level statements in their bodies each
+def split_batches(nodes, batches):
+    sizes = [len(node[4][1]) + 1 for node in nodes]
+    target = sum(sizes) / max(1, min(batches, len(nodes)))
+    split = [[]]
+    size = 0
+    for index, node_size in enumerate(sizes):
+        if split[-1] and size + node_size / 2 > target * len(split):
+            split.append([])
+        split[-1].append(index)
+        size += node_size
+    return split
+
+# Function bodies of the program being checked, in the worker process
+worker_function_bodies = []
+
+# Runs in each worker process as it starts
+def receive_function_bodies(nodes):
+    global worker_function_bodies
+    worker_function_bodies = nodes
+
+# Runs in a worker process: checks each body of a batch, given by index, in its declaration environment
+def check_function_batch(task):
+    return [check_function_body_in_worker((worker_function_bodies[index], snapshot)) for index, snapshot in task]
+
+# Checks one body and returns the first error, anything printed, and a compact table of the types
+# recorded for its nodes: the type_id of each node in pre-order (UNTYPED if none), plus a dictionary
+# from pre-order index to any type that is not an interned PArL type, such as a function signature.
+# Last comes the scope snapshot captured for each block of the body, by pre-order index.
+def check_function_body_in_worker(payload):
+    node, snapshot = payload
+    analyzer = SemanticAnalyzer([node])
+    analyzer.symbol_table.restore(snapshot)
+
+    error = None
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            analyzer.check_function_body(node)
+        except SemanticError as e:
+            error = str(e)
+
+    type_ids = bytearray()
+    other_types = {}
+    scopes = {}
+    for index, child in enumerate(iter_nodes(node)):
+        if id(child) in analyzer.scope_snapshots:
+            scopes[index] = analyzer.scope_snapshots[id(child)][1]
+        data_type = analyzer.type_of(child)
+        if isinstance(data_type, PArLType):
+            type_ids.append(data_type.type_id)
+        else:
+            type_ids.append(UNTYPED)
+            if data_type is not None:
+                other_types[index] = data_type
+    return error, output.getvalue(), bytes(type_ids), other_types, scopes
 
-    # Parse the tokens to generate an AST
-    parser = Parser(tokens)
-    ast = parser.parse()
+###########################################################################################################################################
 
-    # Print the AST for debugging purposes
-    print("\n" + "-"*100+"\n\nAST: \n")
-    print(ast)
-    print()
+# Usage:
 
-    # Perform semantic analysis on the AST
-    semantic_analyzer = SemanticAnalyzer(ast)
-    for node in ast:
-        semantic_analyzer.visit(node)
-    
-    # If no errors occurred during semantic analysis, print success message
-    print("\nSemantic analysis completed successfully!")
-
-except LexerError as e:
-    # Catch Lexer errors and print the error message
-    print(f"Error: {e}")
-except ParserError as e:
-    # Catch Parser errors and print the error message
-    print(f"Error: {e}")
-except SemanticError as e:
-    # Catch Semantic errors and print the error message
-    print(f"Error: {e}")
-    
-# Print a separator line
-print("\n" + "-"*100)
\ No newline at end of file
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    # Specify the name of the file
+    filename = 'input.txt'
+
+    # Open the file and read its contents into a string
+    with open(filename, 'r') as file:
+        source_code = file.read()
+
+    try:
+        # Tokenize the source code
+        lexer = Lexer(source_code)
+        tokens = lexer.tokenize()
+
+        # Parse the tokens to generate an AST
+        parser = Parser(tokens)
+        ast = parser.parse()
+
+        # Print the AST for debugging purposes
+        print("\n" + "-"*100+"\n\nAST: \n")
+        print(ast)
+        print()
+
+        # Perform semantic analysis on the AST
+        semantic_analyzer = SemanticAnalyzer(ast)
+        semantic_analyzer.analyze()
+
+        # If no errors occurred during semantic analysis, print success message
+        print("\nSemantic analysis completed successfully!")
+
+    except LexerError as e:
+        # Catch Lexer errors and print the error message
+        print(f"Error: {e}")
+    except ParserError as e:
+        # Catch Parser errors and print the error message
+        print(f"Error: {e}")
+    except SemanticError as e:
+        # Catch Semantic errors and print the error message
+        print(f"Error: {e}")
+
+    # Print a separator line
+    print("\n" + "-"*100)
\ No newline at end of file
@@ -0,0 +1,189 @@
+# Frame slot allocation for generated PixIR. The code generator gives every declared variable its own
+# virtual slot ("$0", "$1", ...); this pass computes which virtual slots are live at each instruction, lets
+# variables whose lifetimes never overlap share a frame slot, and allocates the whole frame once on entry.
+# It runs once per frame: the program's, and then each function's, whose parameters arrive in its first
+# slots and which reaches the program's variables through the slots the program's allocation gave them.
+
+###########################################################################################################################################
+
+# Prefix of the placeholder operands the code generator uses for virtual slots
+VIRTUAL_SLOT_PREFIX = "$"
+
+def virtual_slot(instruction):
+    # Returns the virtual slot pushed by an instruction such as 'push $3', or None
+    if instruction.startswith("push " + VIRTUAL_SLOT_PREFIX):
+        return int(instruction[len("push " + VIRTUAL_SLOT_PREFIX):])
+    return None
+
+###########################################################################################################################################
+
+class SlotAllocator:
+    def __init__(self, code, reuse=True, parameters=(), outer=None, shared=(), entry=None):
+        # The instructions of one frame, with virtual slot operands
+        self.code = list(code)
+        # Whether slots of variables with disjoint lifetimes may be shared
+        self.reuse = reuse
+        # Virtual slots of the parameters ('$k'), which 'call' places in the first frame slots, in order
+        self.parameters = [int(slot[len(VIRTUAL_SLOT_PREFIX):]) for slot in parameters]
+        # Frame slots already given to the virtual slots of the program's frame, for code reaching it
+        self.outer = outer if outer is not None else {}
+        # Virtual slots that code in other frames uses; they are live everywhere
+        self.shared = set(shared)
+        # Label a function's code starts with, which only calls reach; every other label may be jumped back to
+        self.entry = entry
+        # Frame slot given to each virtual slot
+        self.slots = {}
+        # Number of frame slots allocated on entry
+        self.frame_size = 0
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Returns the code with every virtual slot replaced by a frame slot and the frame allocated up front
+    def allocate(self):
+        virtual_slots = sorted({slot for slot in map(virtual_slot, self.code) if slot is not None and slot not in self.outer})
+        fixed = {slot: index for index, slot in enumerate(self.parameters)}
+        if self.reuse:
+            self.slots = self.colour(virtual_slots, self.interference(), fixed)
+        else:
+            self.slots = dict(fixed)
+            for slot in virtual_slots:
+                self.slots.setdefault(slot, len(self.slots))
+        self.frame_size = max(self.slots.values(), default=len(fixed) - 1) + 1
+
+        # The frame is allocated once, on entry: after the entry label, but before any label a jump may come
+        # back to, such as the start of a loop or the target of a tail call. The parameters are already in it.
+        code = []
+        index = 0
+        if self.entry is not None and self.code and self.code[0] == self.entry:
+            code.append(self.entry)
+            index = 1
+        if self.frame_size > len(fixed):
+            code += [f"push {self.frame_size - len(fixed)}", "alloc"]
+        for instruction in self.code[index:]:
+            slot = virtual_slot(instruction)
+            if slot is not None:
+                instruction = f"push {self.outer[slot] if slot in self.outer else self.slots[slot]}"
+            code.append(instruction)
+        return code
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Each access is 'push $k', 'push 0' and then 'st' (a store) or 'ld' (a load). Returns the index of the
+    # instruction that performs it, the slot read and the slot written.
+    def access(self, index):
+        slot = virtual_slot(self.code[index])
+        if slot is None or slot in self.outer:
+            return None, None, None
+        if index + 2 < len(self.code) and self.code[index + 2] == "st":
+            return index + 2, None, slot
+        if index + 2 < len(self.code) and self.code[index + 2] == "ld":
+            return index + 2, slot, None
+        # Any other use of the slot number keeps it live, as if it were read there
+        return index, slot, None
+
+    # Instructions control can reach directly after each instruction
+    def successors(self):
+        labels = {}
+        for index, instruction in enumerate(self.code):
+            if instruction.startswith("."):
+                labels.setdefault(instruction, []).append(index)
+
+        successors = []
+        for index, instruction in enumerate(self.code):
+            opcode, _, target = instruction.partition(" ")
+            following = [index + 1] if index + 1 < len(self.code) else []
+            # A label defined more than once could be any of its definitions, so all of them are successors
+            if opcode == "jmp":
+                successors.append(labels.get(target, []))
+            elif opcode == "cjmp":
+                successors.append(following + labels.get(target, []))
+            elif opcode == "ret":
+                successors.append([])
+            else:
+                successors.append(following)
+        return successors
+
+    # Live slots after each instruction, as bit sets, found by iterating backwards to a fixed point
+    def liveness(self):
+        count = len(self.code)
+        successors = self.successors()
+        uses = [0] * count
+        definitions = [0] * count
+        for index in range(count):
+            position, read, written = self.access(index)
+            if read is not None:
+                uses[position] |= 1 << read
+            if written is not None:
+                definitions[position] |= 1 << written
+
+        predecessors = [[] for _ in range(count)]
+        for index, targets in enumerate(successors):
+            for target in targets:
+                predecessors[target].append(index)
+
+        live_in = [0] * count
+        live_out = [0] * count
+        worklist = list(range(count))
+        queued = [True] * count
+        while worklist:
+            index = worklist.pop()
+            queued[index] = False
+            out = 0
+            for target in successors[index]:
+                out |= live_in[target]
+            live_out[index] = out
+            new_in = uses[index] | (out & ~definitions[index])
+            if new_in != live_in[index]:
+                live_in[index] = new_in
+                for predecessor in predecessors[index]:
+                    if not queued[predecessor]:
+                        queued[predecessor] = True
+                        worklist.append(predecessor)
+        return live_in, live_out, definitions
+
+    # Pairs of virtual slots that are live at the same time and so need different frame slots
+    def interference(self):
+        live_in, live_out, definitions = self.liveness()
+        edges = {}
+
+        def connect(slot, others):
+            while others:
+                lowest = others & -others
+                other = lowest.bit_length() - 1
+                if other != slot:
+                    edges.setdefault(slot, set()).add(other)
+                    edges.setdefault(other, set()).add(slot)
+                others ^= lowest
+
+        # A store conflicts with everything still live after it; slots live on entry all conflict
+        for index, defined in enumerate(definitions):
+            if defined:
+                connect(defined.bit_length() - 1, live_out[index] | defined)
+        if live_in:
+            entry = live_in[0]
+            while entry:
+                lowest = entry & -entry
+                connect(lowest.bit_length() - 1, live_in[0])
+                entry ^= lowest
+
+        # A slot other frames use may be read or written during any call, so it conflicts with every other slot
+        slots = {slot for slot in map(virtual_slot, self.code) if slot is not None and slot not in self.outer}
+        for slot in self.shared & slots:
+            for other in slots - {slot}:
+                edges.setdefault(slot, set()).add(other)
+                edges.setdefault(other, set()).add(slot)
+        return edges
+
+    # Greedy colouring in order of first appearance: each slot takes the lowest frame slot its neighbours left
+    # free. Slots given in fixed (the parameters) keep the frame slots they are given.
+    def colour(self, virtual_slots, edges, fixed=None):
+        slots = dict(fixed or {})
+        for slot in virtual_slots:
+            if slot in slots:
+                continue
+            taken = {slots[other] for other in edges.get(slot, ()) if other in slots}
+            frame_slot = 0
+            while frame_slot in taken:
+                frame_slot += 1
+            slots[slot] = frame_slot
+        return slots
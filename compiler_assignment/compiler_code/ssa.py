@@ -0,0 +1,1050 @@
+# SSA form over the basic-block graph. Each block's stack code is turned into values, variable slots are
+# renamed so every value is defined once (with phi nodes where control flow joins after WHILE and IF), a
+# few optimizations run on the values, and the graph is turned back into stack-based PixIR. The program and
+# every function are converted separately. The program's variables that functions reach stay in their slots,
+# and a call is an effect that may read and change them.
+from cfg import Jump, Branch, Return
+import math
+
+###########################################################################################################################################
+
+# Stack effect of every instruction the SSA form understands: (values popped, values pushed, has side effects).
+# Pure instructions can be moved, shared or removed; the others stay where they are, in order.
+INSTRUCTIONS = {
+    "add": (2, 1, False), "sub": (2, 1, False), "mul": (2, 1, False), "div": (2, 1, False), "mod": (2, 1, False),
+    "lt": (2, 1, False), "le": (2, 1, False), "gt": (2, 1, False), "ge": (2, 1, False),
+    "eq": (2, 1, False), "neq": (2, 1, False), "and": (2, 1, False), "or": (2, 1, False), "not": (1, 1, False),
+    "print": (1, 0, True), "delay": (1, 0, True), "pixel": (3, 0, True), "pixelr": (5, 0, True),
+    "irnd": (1, 1, True), "read": (2, 1, True), "width": (0, 1, False), "height": (0, 1, False),
+}
+
+# Integers are only folded while they stay exactly representable as a double, which is what the PAD computes with
+MAX_EXACT_INT = 2 ** 53
+
+# Compile-time version of the instructions sparse conditional constant propagation may evaluate
+FOLDABLE = {
+    "add": lambda left, right: left + right,
+    "sub": lambda left, right: left - right,
+    "mul": lambda left, right: left * right,
+    "lt": lambda left, right: int(left < right),
+    "le": lambda left, right: int(left <= right),
+    "gt": lambda left, right: int(left > right),
+    "ge": lambda left, right: int(left >= right),
+    "eq": lambda left, right: int(left == right),
+    "neq": lambda left, right: int(left != right),
+}
+
+# Comparisons whose outcome does not change when both operands are multiplied by the same positive number
+COMPARISON_OPCODES = ("lt", "le", "gt", "ge", "eq", "neq")
+
+# Instructions it takes to load or store a value kept in a slot (push slot / push 0 / ld or st), and to step
+# a variable kept in a slot by a constant on every iteration (load, push the step, add, store)
+ACCESS_COST = 3
+VARIABLE_COST = 2 * ACCESS_COST + 2
+
+# Raised when a block uses something the SSA form does not model; the graph is then left as it was
+class SSAUnsupported(Exception):
+    pass
+
+###########################################################################################################################################
+
+class Value:
+    # kind is 'const' (a pushed literal), 'incoming' (a slot's value on entry), 'phi', 'op' (pure instruction),
+    # 'effect' (instruction with side effects, including calls and the loads and stores of shared slots) or
+    # 'entry' (a variable read before the block defines it)
+    def __init__(self, kind, block, opcode=None, args=None, operand=None, level=0):
+        self.kind = kind
+        self.block = block
+        self.opcode = opcode
+        self.args = args if args is not None else []
+        # Literal text of a constant, or the variable slot of an incoming or entry value or of a load or store
+        self.operand = operand
+        # Frame level of the slot a load or store accesses
+        self.level = level
+        # Value this one was found equal to by copy propagation, value numbering or constant propagation
+        self.replacement = None
+
+    def __repr__(self):
+        return f"Value({self.kind}, {self.opcode or self.operand})"
+
+def resolve(value):
+    # Follows replacements to the value that stands for this one now
+    while value.replacement is not None:
+        value = value.replacement
+    return value
+
+# Number of values an instruction of the SSA form leaves on the stack
+def pushes(value):
+    if value.opcode in ("call", "ld"):
+        return 1
+    if value.opcode == "st":
+        return 0
+    return INSTRUCTIONS[value.opcode][1]
+
+def constant_value(text):
+    # The number a literal stands for, or None for colours, strings and labels
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+###########################################################################################################################################
+
+# SSA view of one basic block
+class SSABlock:
+    def __init__(self, block):
+        self.block = block
+        self.predecessors = []
+        self.phis = []
+        # Values in the order the original code computed them
+        self.statements = []
+        # Value of each variable slot at the end of the block, for the slots the block stores to
+        self.definitions = {}
+        # Value the terminator consumes: the condition of a Branch, or the result a function's Return leaves
+        self.condition = None
+
+# The variable accesses ('push $k' / 'push 0' / 'ld' or 'st') in a block's code, as (slot, 'ld' or 'st')
+def slot_accesses(code):
+    return [(code[index][5:], code[index + 2]) for index in range(len(code) - 2)
+            if code[index].startswith("push $") and code[index + 1] == "push 0" and code[index + 2] in ("ld", "st")]
+
+# Slots of the program's frame that function bodies reach, at frame level 1
+def shared_slots(cfg):
+    shared = set()
+    for block in cfg.blocks:
+        code = block.instructions
+        for index in range(len(code) - 2):
+            if code[index].startswith("push $") and code[index + 1] == "push 1" and code[index + 2] in ("ld", "st"):
+                shared.add(code[index][5:])
+    return shared
+
+###########################################################################################################################################
+
+# The blocks one root reaches, which are converted on their own: the program's code, or one function's
+class Region:
+    def __init__(self, cfg, root):
+        self.cfg = cfg
+        # Block control enters the region at
+        self.entry = root
+        # The region's blocks, in the graph's order
+        reachable = {id(block) for block in cfg.reachable([root])}
+        self.blocks = [block for block in cfg.blocks if id(block) in reachable]
+
+    def new_block(self, name):
+        block = self.cfg.new_block(name)
+        self.blocks.append(block)
+        return block
+
+###########################################################################################################################################
+
+class SSAOptimizer:
+    def __init__(self, cfg, new_slot):
+        # The graph to rewrite, with virtual variable slots ('$0', '$1', ...) as produced by the code generator
+        self.cfg = cfg
+        # Part of the graph being converted, and the SSA view of each of its blocks
+        self.region = None
+        # Hands out fresh virtual slots for phis and values that have to be kept across instructions
+        self.new_slot = new_slot
+        self.blocks = {}
+        # Slots of the program's frame that functions reach, and the slots of the part being converted that
+        # stay in memory rather than being renamed
+        self.shared = set()
+        self.memory_slots = set()
+        # Counts of what each pass did
+        self.statistics = {"phis": 0, "constants": 0, "copies": 0, "numbered": 0, "branches": 0, "hoisted": 0, "reduced": 0, "coalesced": 0}
+
+    # Converts the program and each function to SSA, optimizes them and converts them back. A part that uses
+    # anything the SSA form does not model is left as it was; returns whether every part was optimized.
+    def optimize(self):
+        self.shared = shared_slots(self.cfg)
+        regions = [Region(self.cfg, root) for root in self.cfg.roots]
+        optimized = True
+        for region in regions:
+            optimized = self.optimize_region(region) and optimized
+        self.cfg.blocks = [block for region in regions for block in region.blocks]
+        return optimized
+
+    def optimize_region(self, region):
+        self.region = region
+        self.blocks = {}
+        # Only the program has slots that other frames reach
+        self.memory_slots = self.shared if region.entry is self.cfg.entry else set()
+        try:
+            self.build()
+        except SSAUnsupported:
+            return False
+        self.propagate_copies()
+        self.propagate_constants()
+        self.propagate_copies()
+        self.number_values()
+        self.optimize_loops()
+        self.split_critical_edges()
+        self.translate()
+        return True
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    # Construction
+
+    def build(self):
+        for block in self.region.blocks:
+            self.blocks[id(block)] = SSABlock(block)
+        for block in self.region.blocks:
+            for successor in block.successors():
+                self.blocks[id(successor)].predecessors.append(block)
+        for block in self.region.blocks:
+            self.build_block(block)
+
+        # Variables read before their block defines them take the value reaching the block's entry
+        self.entry_values = {}
+        for ssa_block in self.blocks.values():
+            for value in ssa_block.statements:
+                for index, arg in enumerate(value.args):
+                    value.args[index] = self.reaching(arg)
+            if ssa_block.condition is not None:
+                ssa_block.condition = self.reaching(ssa_block.condition)
+            for slot, value in ssa_block.definitions.items():
+                ssa_block.definitions[slot] = self.reaching(value)
+        self.remove_trivial_phis()
+
+    # Runs a block's instructions on a symbolic stack, turning them into values
+    def build_block(self, block):
+        ssa_block = self.blocks[id(block)]
+        stack = []
+        code = block.instructions
+        index = 0
+
+        def pop():
+            if not stack:
+                raise SSAUnsupported("Stack value crosses a block boundary.")
+            return stack.pop()
+
+        while index < len(code):
+            instruction = code[index]
+            opcode, _, operand = instruction.partition(" ")
+            # Variable access: push $k / push 0 or 1 / st or ld
+            if opcode == "push" and operand.startswith("$") and code[index + 1:index + 2] in (["push 0"], ["push 1"]) \
+                    and code[index + 2:index + 3] in (["st"], ["ld"]):
+                level = int(code[index + 1][5:])
+                access = code[index + 2]
+                index += 3
+                if level == 0 and operand not in self.memory_slots:
+                    if access == "st":
+                        ssa_block.definitions[operand] = pop()
+                    elif operand in ssa_block.definitions:
+                        stack.append(ssa_block.definitions[operand])
+                    else:
+                        value = Value("entry", block, operand=operand)
+                        ssa_block.definitions[operand] = value
+                        stack.append(value)
+                    continue
+                # The program's variables that functions reach may change during any call, so they are read
+                # and written in their slots, where they are accessed, in order
+                value = Value("effect", block, opcode=access, args=[pop()] if access == "st" else [], operand=operand, level=level)
+                ssa_block.statements.append(value)
+                if access == "ld":
+                    stack.append(value)
+                continue
+
+            if opcode == "push" and not operand.startswith("$"):
+                # Literals, and the labels of called functions
+                stack.append(Value("const", block, operand=operand))
+            elif opcode == "call" and not operand:
+                label, count = pop(), pop()
+                if not label.operand or not label.operand.startswith(".") or count.kind != "const" or not count.operand.isdigit():
+                    raise SSAUnsupported("Call of an unknown function.")
+                # A call has effects and may read and change the shared slots, but the arguments are its only operands
+                value = Value("effect", block, opcode="call", args=[pop() for _ in range(int(count.operand))][::-1] + [count, label])
+                ssa_block.statements.append(value)
+                stack.append(value)
+            elif opcode == "dup" and not operand:
+                stack.append(pop())
+                stack.append(stack[-1])
+            elif opcode == "drop" and not operand:
+                pop()
+            elif opcode in INSTRUCTIONS and not operand:
+                pops, results, effect = INSTRUCTIONS[opcode]
+                args = [pop() for _ in range(pops)][::-1]
+                value = Value("effect" if effect else "op", block, opcode=opcode, args=args)
+                ssa_block.statements.append(value)
+                if results:
+                    stack.append(value)
+            else:
+                raise SSAUnsupported(f"Instruction '{instruction}' is not modelled.")
+            index += 1
+
+        if isinstance(block.terminator, Branch):
+            ssa_block.condition = pop()
+        elif isinstance(block.terminator, Return) and stack:
+            ssa_block.condition = pop()
+        elif block.terminator is None:
+            raise SSAUnsupported("Block without a terminator.")
+        if stack:
+            raise SSAUnsupported("Stack value crosses a block boundary.")
+
+    # The value a variable read before any local store refers to: the one reaching the block's entry
+    def reaching(self, value):
+        if value.kind != "entry":
+            return value
+        return self.value_at_entry(value.block, value.operand)
+
+    def value_at_entry(self, block, slot):
+        key = (id(block), slot)
+        if key in self.entry_values:
+            return self.entry_values[key]
+        ssa_block = self.blocks[id(block)]
+
+        if block is self.region.entry or not ssa_block.predecessors:
+            value = Value("incoming", block, operand=slot)
+        elif len(ssa_block.predecessors) == 1:
+            # Recorded before recursing, so a cycle of single-predecessor blocks ends in the phi of its header
+            value = Value("phi", block, operand=slot)
+            self.entry_values[key] = value
+            value.args = [self.value_at_exit(ssa_block.predecessors[0], slot)]
+            ssa_block.phis.append(value)
+            self.statistics["phis"] += 1
+            return value
+        else:
+            # Control flow joins here: one phi operand per predecessor, in predecessor order
+            value = Value("phi", block, operand=slot)
+            self.entry_values[key] = value
+            ssa_block.phis.append(value)
+            self.statistics["phis"] += 1
+            value.args = [self.value_at_exit(predecessor, slot) for predecessor in ssa_block.predecessors]
+            return value
+        self.entry_values[key] = value
+        return value
+
+    def value_at_exit(self, block, slot):
+        ssa_block = self.blocks[id(block)]
+        value = ssa_block.definitions.get(slot)
+        if value is None:
+            return self.value_at_entry(block, slot)
+        return self.reaching(value)
+
+    # A phi whose operands are all one value (or the phi itself) is just that value
+    def remove_trivial_phis(self):
+        changed = True
+        while changed:
+            changed = False
+            for ssa_block in self.blocks.values():
+                for phi in list(ssa_block.phis):
+                    if phi.replacement is not None:
+                        continue
+                    operands = {id(resolve(arg)): resolve(arg) for arg in phi.args if resolve(arg) is not phi}
+                    if len(operands) == 1:
+                        phi.replacement = next(iter(operands.values()))
+                        ssa_block.phis.remove(phi)
+                        self.statistics["copies"] += 1
+                        changed = True
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    # Optimizations
+
+    # Copy propagation: every use refers directly to the value it copies
+    def propagate_copies(self):
+        self.remove_trivial_phis()
+        for ssa_block in self.blocks.values():
+            for value in ssa_block.phis + ssa_block.statements:
+                value.args = [resolve(arg) for arg in value.args]
+            if ssa_block.condition is not None:
+                ssa_block.condition = resolve(ssa_block.condition)
+
+    # Sparse conditional constant propagation: values are only evaluated in blocks found to be executable, so
+    # constants are found through branches whose condition is itself constant
+    def propagate_constants(self):
+        TOP, BOTTOM = "top", "bottom"
+        lattice = {}
+
+        def state(value):
+            value = resolve(value)
+            if value.kind == "const":
+                number = constant_value(value.operand)
+                return number if number is not None else BOTTOM
+            # A function's parameters hold whatever the call passed
+            if value.kind == "incoming":
+                return BOTTOM
+            return lattice.get(id(value), TOP)
+
+        executable = {id(self.region.entry)}
+        executable_edges = set()
+        changed = True
+        while changed:
+            changed = False
+            for block in self.region.blocks:
+                if id(block) not in executable:
+                    continue
+                ssa_block = self.blocks[id(block)]
+                for value in ssa_block.phis + ssa_block.statements:
+                    new_state = self.evaluate(value, state, executable_edges, TOP, BOTTOM)
+                    if new_state != lattice.get(id(value), TOP) and lattice.get(id(value), TOP) != BOTTOM:
+                        lattice[id(value)] = new_state
+                        changed = True
+
+                # Follow only the edges the terminator can take
+                successors = block.successors()
+                if isinstance(block.terminator, Branch):
+                    condition = state(ssa_block.condition)
+                    if condition == TOP:
+                        successors = []
+                    elif condition != BOTTOM:
+                        successors = [block.terminator.if_true if condition else block.terminator.if_false]
+                for successor in successors:
+                    if (id(block), id(successor)) not in executable_edges:
+                        executable_edges.add((id(block), id(successor)))
+                        executable.add(id(successor))
+                        changed = True
+
+        # Values with a constant state become literals; branches on constants become jumps
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            for value in ssa_block.phis + [value for value in ssa_block.statements if value.kind == "op"]:
+                number = lattice.get(id(value), TOP)
+                if number not in (TOP, BOTTOM) and value.replacement is None:
+                    value.replacement = Value("const", block, operand=repr(number))
+                    self.statistics["constants"] += 1
+            if isinstance(block.terminator, Branch) and id(block) in executable:
+                condition = state(ssa_block.condition)
+                if condition not in (TOP, BOTTOM):
+                    target = block.terminator.if_true if condition else block.terminator.if_false
+                    block.terminator = Jump(target)
+                    ssa_block.condition = None
+                    self.statistics["branches"] += 1
+
+        # Blocks that can never run are dropped, together with the phi operands coming from them
+        self.region.blocks = [block for block in self.region.blocks if id(block) in executable]
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            kept = [index for index, predecessor in enumerate(ssa_block.predecessors)
+                    if id(predecessor) in executable and block in predecessor.successors()]
+            for phi in ssa_block.phis:
+                phi.args = [phi.args[index] for index in kept]
+            ssa_block.predecessors = [ssa_block.predecessors[index] for index in kept]
+
+    def evaluate(self, value, state, executable_edges, TOP, BOTTOM):
+        if value.kind == "phi":
+            # Meet over the operands on executable incoming edges
+            result = TOP
+            for predecessor, arg in zip(self.blocks[id(value.block)].predecessors, value.args):
+                if (id(predecessor), id(value.block)) not in executable_edges:
+                    continue
+                arg_state = state(arg)
+                if arg_state == TOP:
+                    continue
+                if result == TOP:
+                    result = arg_state
+                elif arg_state == BOTTOM or arg_state != result or type(arg_state) is not type(result):
+                    return BOTTOM
+            return result
+        if value.kind != "op":
+            return BOTTOM
+
+        states = [state(arg) for arg in value.args]
+        if BOTTOM in states:
+            return BOTTOM
+        if TOP in states:
+            return TOP
+        if value.opcode not in FOLDABLE:
+            return BOTTOM
+        result = FOLDABLE[value.opcode](*states)
+        if isinstance(result, int) and not -MAX_EXACT_INT <= result <= MAX_EXACT_INT:
+            return BOTTOM
+        if isinstance(result, float) and not math.isfinite(result):
+            return BOTTOM
+        return result
+
+    # Global value numbering: a pure instruction with the same operands as one in a dominating block (or
+    # earlier in the same block) reuses that value
+    def number_values(self):
+        dominator_children = self.dominator_tree()
+        stack = [(self.region.entry, {})]
+        while stack:
+            block, available = stack.pop()
+            available = dict(available)
+            ssa_block = self.blocks[id(block)]
+            for value in ssa_block.phis + ssa_block.statements:
+                value.args = [resolve(arg) for arg in value.args]
+                if value.kind != "op" or value.replacement is not None:
+                    continue
+                key = (value.opcode,) + tuple(self.value_key(arg) for arg in value.args)
+                if key in available:
+                    value.replacement = available[key]
+                    self.statistics["numbered"] += 1
+                else:
+                    available[key] = value
+            if ssa_block.condition is not None:
+                ssa_block.condition = resolve(ssa_block.condition)
+            for child in dominator_children.get(id(block), []):
+                stack.append((child, available))
+
+    def value_key(self, value):
+        # Constants are equal when their text is; every other value only equals itself
+        return ("const", value.operand) if value.kind == "const" else id(value)
+
+    # Children of each block in the dominator tree
+    def dominator_tree(self):
+        dominator = self.dominators()
+        children = {}
+        for block in self.reverse_postorder()[1:]:
+            if id(block) in dominator:
+                children.setdefault(id(dominator[id(block)]), []).append(block)
+        return children
+
+    # Immediate dominator of each block, by the iterative algorithm of Cooper, Harvey and Kennedy
+    def dominators(self):
+        order = self.reverse_postorder()
+        number = {id(block): index for index, block in enumerate(order)}
+        dominator = {id(self.region.entry): self.region.entry}
+
+        def intersect(left, right):
+            while left is not right:
+                while number[id(left)] > number[id(right)]:
+                    left = dominator[id(left)]
+                while number[id(right)] > number[id(left)]:
+                    right = dominator[id(right)]
+            return left
+
+        changed = True
+        while changed:
+            changed = False
+            for block in order[1:]:
+                candidates = [predecessor for predecessor in self.blocks[id(block)].predecessors
+                              if id(predecessor) in dominator]
+                if not candidates:
+                    continue
+                new_dominator = candidates[0]
+                for predecessor in candidates[1:]:
+                    new_dominator = intersect(predecessor, new_dominator)
+                if dominator.get(id(block)) is not new_dominator:
+                    dominator[id(block)] = new_dominator
+                    changed = True
+        return dominator
+
+    def dominates(self, dominator, block, other):
+        # Whether every path from the entry to other passes through block
+        while other is not block:
+            if other is self.region.entry or id(other) not in dominator:
+                return False
+            other = dominator[id(other)]
+        return True
+
+    def reverse_postorder(self):
+        visited = set()
+        postorder = []
+        stack = [(self.region.entry, iter(self.region.entry.successors()))]
+        visited.add(id(self.region.entry))
+        while stack:
+            block, successors = stack[-1]
+            for successor in successors:
+                if id(successor) not in visited:
+                    visited.add(id(successor))
+                    stack.append((successor, iter(successor.successors())))
+                    break
+            else:
+                postorder.append(block)
+                stack.pop()
+        return postorder[::-1]
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    # Loops
+
+    # Loop-invariant code motion and strength reduction, innermost loops first
+    def optimize_loops(self):
+        loops = self.find_loops()
+        for header, body in loops:
+            preheader = self.preheader(header, body)
+            # The preheader runs inside every loop enclosing this one
+            for _, other_body in loops:
+                if other_body is not body and id(header) in other_body:
+                    other_body.add(id(preheader))
+            self.move_invariants(body, preheader)
+            self.reduce_strength(header, body, preheader)
+
+    # Natural loops as (header, ids of the blocks in the loop), smallest first. Every edge to a block that
+    # dominates its source closes a loop made of the blocks that reach the source without passing the header.
+    def find_loops(self):
+        dominator = self.dominators()
+        headers = {}
+        bodies = {}
+        for block in self.region.blocks:
+            for successor in block.successors():
+                if not self.dominates(dominator, successor, block):
+                    continue
+                headers[id(successor)] = successor
+                body = bodies.setdefault(id(successor), {id(successor)})
+                stack = [block]
+                while stack:
+                    member = stack.pop()
+                    if id(member) not in body:
+                        body.add(id(member))
+                        stack.extend(self.blocks[id(member)].predecessors)
+        return sorted(((headers[key], body) for key, body in bodies.items()), key=lambda loop: len(loop[1]))
+
+    # The block every entry into the loop passes through just before the header. A single predecessor from
+    # outside the loop that only jumps to the header already is one; otherwise a new block is put in between.
+    def preheader(self, header, body):
+        header_block = self.blocks[id(header)]
+        outside = [index for index, predecessor in enumerate(header_block.predecessors) if id(predecessor) not in body]
+        inside = [index for index, predecessor in enumerate(header_block.predecessors) if id(predecessor) in body]
+        if len(outside) == 1:
+            predecessor = header_block.predecessors[outside[0]]
+            if isinstance(predecessor.terminator, Jump):
+                # Listed first among the header's predecessors, like a new preheader would be
+                order = outside + inside
+                header_block.predecessors = [header_block.predecessors[index] for index in order]
+                for phi in header_block.phis:
+                    phi.args = [phi.args[index] for index in order]
+                return predecessor
+
+        preheader = self.region.new_block("PREHEADER")
+        preheader.terminator = Jump(header)
+        ssa_preheader = SSABlock(preheader)
+        ssa_preheader.predecessors = [header_block.predecessors[index] for index in outside]
+        self.blocks[id(preheader)] = ssa_preheader
+        for predecessor in ssa_preheader.predecessors:
+            terminator = predecessor.terminator
+            for attribute in ("target", "if_false", "if_true"):
+                if getattr(terminator, attribute, None) is header:
+                    setattr(terminator, attribute, preheader)
+
+        # Header phis take the values from outside the loop through the preheader, merged there if they differ
+        for phi in header_block.phis:
+            incoming = [phi.args[index] for index in outside]
+            if len({id(arg) for arg in incoming}) == 1:
+                entering = incoming[0]
+            else:
+                entering = Value("phi", preheader, args=incoming, operand=phi.operand)
+                ssa_preheader.phis.append(entering)
+            phi.args = [entering] + [phi.args[index] for index in inside]
+        header_block.predecessors = [preheader] + [header_block.predecessors[index] for index in inside]
+        return preheader
+
+    # Pure values whose operands are all computed outside the loop are computed once, in the preheader.
+    # Division and remainder stay put, since the loop may not run at all and their divisor may be zero.
+    def move_invariants(self, body, preheader):
+        ssa_preheader = self.blocks[id(preheader)]
+        for block in self.reverse_postorder():
+            if id(block) not in body:
+                continue
+            ssa_block = self.blocks[id(block)]
+            for value in list(ssa_block.statements):
+                if value.kind != "op" or value.replacement is not None or value.opcode in ("div", "mod"):
+                    continue
+                if all(self.defined_outside(arg, body) for arg in value.args):
+                    ssa_block.statements.remove(value)
+                    value.block = preheader
+                    ssa_preheader.statements.append(value)
+                    self.statistics["hoisted"] += 1
+
+    def defined_outside(self, value, body):
+        value = resolve(value)
+        return value.kind == "const" or id(value.block) not in body
+
+    # Strength reduction: for an induction variable i stepped by a constant on every iteration, i * k is
+    # kept in a variable of its own that starts at start * k and is stepped by step * k. Comparisons of i, or
+    # of i stepped (as a rotated loop's exit test has it), with a constant then compare the new variable, or
+    # the new variable stepped, with the constant times k, so i itself may go away.
+    def reduce_strength(self, header, body, preheader):
+        header_block = self.blocks[id(header)]
+        if len(header_block.predecessors) != 2 or header_block.predecessors[0] is not preheader:
+            return
+
+        # Products of a header phi and an integer literal, grouped by phi and factor
+        candidates = {}
+        for block in self.reverse_postorder():
+            if id(block) not in body:
+                continue
+            for value in self.blocks[id(block)].statements:
+                if value.kind != "op" or value.opcode != "mul" or value.replacement is not None:
+                    continue
+                left, right = (resolve(arg) for arg in value.args)
+                induction, factor = (right, left) if left.kind == "const" else (left, right)
+                factor = constant_value(factor.operand) if factor.kind == "const" else None
+                if isinstance(factor, int) and factor > 0 and induction in header_block.phis:
+                    candidates.setdefault((id(induction), factor), (induction, factor, []))[2].append(value)
+
+        for induction, factor, products in candidates.values():
+            step = self.induction_step(induction, body)
+            if step is None:
+                continue
+            # Only worth it when the work saved per iteration exceeds the work of stepping the new variable
+            users = self.users()
+            comparisons = self.replaceable_comparisons(induction, factor, products, users)
+            saved = sum(self.product_cost(product, users) for product in products)
+            if comparisons is not None:
+                saved += VARIABLE_COST
+            if saved <= VARIABLE_COST:
+                continue
+
+            variable = self.reduced_variable(induction, factor, step, header, preheader)
+            for product in products:
+                product.replacement = variable
+                self.statistics["reduced"] += 1
+            for comparison, compared in comparisons or []:
+                reduced = variable if compared is induction else variable.args[1]
+                comparison.args = [reduced if resolve(arg) is compared else
+                                   Value("const", comparison.block, operand=repr(constant_value(resolve(arg).operand) * factor))
+                                   for arg in comparison.args]
+
+    # Values (and, for branch conditions and returned results, blocks) using each value
+    def users(self):
+        users = {}
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            for value in ssa_block.phis + ssa_block.statements:
+                if value.replacement is None:
+                    for arg in value.args:
+                        users.setdefault(id(resolve(arg)), []).append(value)
+            if ssa_block.condition is not None:
+                users.setdefault(id(resolve(ssa_block.condition)), []).append(block)
+        return users
+
+    # Instructions per iteration no longer needed once a product is read from the reduced variable instead:
+    # a product kept in a slot is neither computed nor stored, one computed where it is used is replaced by a load
+    def product_cost(self, product, users):
+        # Load the induction variable, push the factor, multiply
+        computed = ACCESS_COST + 2
+        product_users = users.get(id(product), [])
+        if len(product_users) > 1 or any(getattr(user, "block", user) is not product.block for user in product_users):
+            return computed + ACCESS_COST
+        return computed - ACCESS_COST
+
+    # The comparisons of an induction variable, or of its next value, with integer literals that can compare
+    # the reduced variable instead, as (comparison, value compared), if that leaves the induction variable
+    # with no other use; otherwise None
+    def replaceable_comparisons(self, induction, factor, products, users):
+        following = resolve(induction.args[1])
+        comparisons = []
+        for compared, skipped in ((induction, [following] + products), (following, [induction])):
+            for user in users.get(id(compared), []):
+                if any(user is other for other in skipped):
+                    continue
+                if not isinstance(user, Value) or user.opcode not in COMPARISON_OPCODES:
+                    return None
+                others = [resolve(arg) for arg in user.args if resolve(arg) is not compared]
+                if len(others) != 1 or others[0].kind != "const":
+                    return None
+                limit = constant_value(others[0].operand)
+                if not isinstance(limit, int) or abs(limit * factor) > MAX_EXACT_INT:
+                    return None
+                comparisons.append((user, compared))
+        return comparisons
+
+    # The constant an integer induction variable (a header phi) grows by on every iteration, or None
+    def induction_step(self, phi, body):
+        start, following = (resolve(arg) for arg in phi.args)
+        if following.kind != "op" or id(following.block) not in body or not self.is_integer(start):
+            return None
+        left, right = (resolve(arg) for arg in following.args)
+        if following.opcode == "add" and left is phi and right.kind == "const":
+            step = constant_value(right.operand)
+        elif following.opcode == "add" and right is phi and left.kind == "const":
+            step = constant_value(left.operand)
+        elif following.opcode == "sub" and left is phi and right.kind == "const":
+            step = constant_value(right.operand)
+            step = -step if step is not None else None
+        else:
+            return None
+        return step if isinstance(step, int) else None
+
+    # The reduced variable is stepped right after the induction variable, so that it is ready wherever the
+    # next value of the induction variable is, including comparisons ahead of the latch
+    def reduced_variable(self, induction, factor, step, header, preheader):
+        start, stepped = (resolve(arg) for arg in induction.args)
+        variable = Value("phi", header)
+        if start.kind == "const":
+            entering = Value("const", preheader, operand=repr(constant_value(start.operand) * factor))
+        else:
+            entering = Value("op", preheader, opcode="mul", args=[start, Value("const", preheader, operand=repr(factor))])
+            self.blocks[id(preheader)].statements.append(entering)
+        following = Value("op", stepped.block, opcode="add", args=[variable, Value("const", stepped.block, operand=repr(step * factor))])
+        statements = self.blocks[id(stepped.block)].statements
+        statements.insert(statements.index(stepped) + 1, following)
+        variable.args = [entering, following]
+        self.blocks[id(header)].phis.append(variable)
+        return variable
+
+    # Whether a value is always an integer: integer literals, random integers and the display size, and
+    # sums, differences and products of integers
+    def is_integer(self, value, visiting=None):
+        value = resolve(value)
+        visiting = visiting if visiting is not None else set()
+        if value.kind == "const":
+            return isinstance(constant_value(value.operand), int)
+        if value.kind == "phi":
+            if id(value) in visiting:
+                return True
+            visiting.add(id(value))
+            return all(self.is_integer(arg, visiting) for arg in value.args)
+        if value.opcode in ("irnd", "width", "height"):
+            return True
+        if value.opcode in ("add", "sub", "mul"):
+            return all(self.is_integer(arg, visiting) for arg in value.args)
+        return False
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+    # Translation back to stack code
+
+    # A branch into a block with phis gets a block of its own on that edge, so the copies for the phis
+    # only run when that edge is taken
+    def split_critical_edges(self):
+        for block in list(self.region.blocks):
+            terminator = block.terminator
+            if not isinstance(terminator, Branch):
+                continue
+            for attribute in ("if_false", "if_true"):
+                target = getattr(terminator, attribute)
+                target_block = self.blocks[id(target)]
+                if not target_block.phis:
+                    continue
+                edge = self.region.new_block("EDGE")
+                edge.terminator = Jump(target)
+                edge_block = SSABlock(edge)
+                edge_block.predecessors = [block]
+                self.blocks[id(edge)] = edge_block
+                setattr(terminator, attribute, edge)
+                target_block.predecessors = [edge if predecessor is block else predecessor
+                                             for predecessor in target_block.predecessors]
+                # A branch whose two edges both led here now leads through two separate edge blocks
+                if terminator.if_false is terminator.if_true:
+                    break
+
+    def translate(self):
+        # Values that still have to be computed: side effects, branch conditions, phi operands and what they use.
+        # Pure values nobody uses are left out, which can leave their operands unused too.
+        live = set()
+        uses = {}
+        use_blocks = {}
+        # What uses each value: another value, or the block whose terminator or phi copies use it
+        users = {}
+        worklist = []
+
+        def use(value, block, user):
+            value = resolve(value)
+            uses[id(value)] = uses.get(id(value), 0) + 1
+            use_blocks.setdefault(id(value), set()).add(id(block))
+            users.setdefault(id(value), []).append(user)
+            worklist.append(value)
+
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            for value in ssa_block.statements:
+                # Loading a shared slot has no effect of its own, so only loads whose value is used are kept
+                if value.kind == "effect" and value.opcode != "ld":
+                    worklist.append(value)
+            if ssa_block.condition is not None:
+                use(ssa_block.condition, block, block)
+        while worklist:
+            value = resolve(worklist.pop())
+            if id(value) in live:
+                continue
+            live.add(id(value))
+            if value.kind == "phi":
+                # A phi operand is used at the end of the predecessor it comes from
+                for predecessor, arg in zip(self.blocks[id(value.block)].predecessors, value.args):
+                    use(arg, predecessor, predecessor)
+            else:
+                for arg in value.args:
+                    use(arg, value.block, value)
+
+        # Values kept in a slot: phis, pure values used more than once or elsewhere, and results of side effects
+        # that cannot be computed where they are used
+        homes = {}
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            ssa_block.phis = [phi for phi in ssa_block.phis if id(phi) in live]
+            for value in ssa_block.phis:
+                homes[id(value)] = self.new_slot()
+            for value in ssa_block.statements:
+                if value.replacement is None and id(value) in live and value.kind == "op" \
+                        and (uses.get(id(value), 0) > 1 or use_blocks.get(id(value), {id(block)}) != {id(block)}):
+                    homes[id(value)] = self.new_slot()
+
+        # The code that computes a value used once: the statement whose code it ends up in, or the block whose
+        # terminator or phi copies use it
+        def consumer(value):
+            while True:
+                user = users[id(value)][0]
+                if not isinstance(user, Value) or user.kind != "op" or id(user) in homes:
+                    return user
+                value = user
+
+        # Effects in the order the code computing the given values runs them, if each is computed where it is used
+        def effect_order(values):
+            order = []
+            stack = [resolve(value) for value in reversed(values)]
+            while stack:
+                value = stack.pop()
+                if isinstance(value, tuple):
+                    order.append(value[1])
+                elif value.kind in ("op", "effect") and id(value) not in homes:
+                    if value.kind == "effect":
+                        stack.append(("done", id(value)))
+                    stack.extend(resolve(arg) for arg in reversed(value.args))
+            return order
+
+        # An effect whose value is used once, in code of its own block, is computed where it is used, as the
+        # original code did, if every effect between the two is too and still runs after it
+        inlined = {}
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            statements = ssa_block.statements
+            orders = {}
+            for index in range(len(statements) - 1, -1, -1):
+                value = statements[index]
+                if value.kind != "effect" or value.replacement is not None or id(value) not in live or not uses.get(id(value)):
+                    continue
+                user = consumer(value) if uses[id(value)] == 1 else None
+                if user is block:
+                    end = len(statements)
+                    roots = [ssa_block.condition] if ssa_block.condition is not None else \
+                        [phi.args[self.blocks[id(successor)].predecessors.index(block)]
+                         for successor in block.successors() for phi in self.blocks[id(successor)].phis]
+                elif isinstance(user, Value) and user.block is block:
+                    end = next(position for position, other in enumerate(statements) if other is user)
+                    roots = user.args
+                else:
+                    homes[id(value)] = self.new_slot()
+                    continue
+                if id(user) not in orders:
+                    orders[id(user)] = effect_order(roots)
+                order = orders[id(user)]
+                between = [other for other in statements[index + 1:end] if other.kind == "effect" and id(other) in live]
+                if id(value) in order and all(inlined.get(id(other)) is user and order.index(id(value)) < order.index(id(other))
+                                              for other in between):
+                    inlined[id(value)] = user
+                else:
+                    homes[id(value)] = self.new_slot()
+
+        # Instructions of an effect once its operands are on the stack
+        def instruction(value):
+            if value.opcode in ("ld", "st"):
+                return [f"push {value.operand}", f"push {value.level}", value.opcode]
+            return [value.opcode]
+
+        def emit(value, code):
+            value = resolve(value)
+            if value.kind == "const":
+                code.append(f"push {value.operand}")
+            elif value.kind == "incoming":
+                code += [f"push {value.operand}", "push 0", "ld"]
+            elif id(value) in homes:
+                code += [f"push {homes[id(value)]}", "push 0", "ld"]
+            else:
+                for arg in value.args:
+                    emit(arg, code)
+                code += instruction(value)
+
+        # Phi copies behave as if done at once: push every operand, then store them in reverse order. A phi
+        # whose operand already lives in its slot needs no copy.
+        def parallel_copy(pairs):
+            pairs = [(phi, arg) for phi, arg in pairs if homes.get(id(resolve(arg))) != homes[id(phi)]]
+            code = []
+            for _, arg in pairs:
+                emit(arg, code)
+            for phi, _ in reversed(pairs):
+                code += [f"push {homes[id(phi)]}", "push 0", "st"]
+            return code
+
+        bodies = {}
+        copies = {}
+        for block in self.region.blocks:
+            ssa_block = self.blocks[id(block)]
+            code = []
+            for value in ssa_block.statements:
+                if value.replacement is not None or id(value) not in live or id(value) in inlined:
+                    continue
+                if value.kind == "effect" or id(value) in homes:
+                    for arg in value.args:
+                        emit(arg, code)
+                    code += instruction(value)
+                    if id(value) in homes:
+                        code += [f"push {homes[id(value)]}", "push 0", "st"]
+                    elif pushes(value):
+                        code.append("drop")
+
+            pairs = []
+            if ssa_block.condition is not None:
+                emit(ssa_block.condition, code)
+            if isinstance(block.terminator, Jump):
+                successor_block = self.blocks[id(block.terminator.target)]
+                if successor_block.phis:
+                    position = successor_block.predecessors.index(block)
+                    pairs = [(phi, phi.args[position]) for phi in successor_block.phis]
+            bodies[id(block)] = code
+            copies[id(block)] = pairs
+            block.instructions = code + parallel_copy(pairs)
+
+        # Give phis and their operands one slot where they are never live at the same time; the copies between
+        # them then disappear, and so do the blocks that only held copies
+        renames = self.coalesce([(homes[id(phi)], homes.get(id(resolve(arg))))
+                                 for pairs in copies.values() for phi, arg in pairs])
+        if renames:
+            for key, slot in homes.items():
+                homes[key] = renames.get(slot, slot)
+            for block in self.region.blocks:
+                code = [f"push {renames.get(instruction[5:], instruction[5:])}" if instruction.startswith("push $") else instruction
+                        for instruction in bodies[id(block)]]
+                block.instructions = code + parallel_copy(copies[id(block)])
+
+    # Merges the slots of copy-related pairs whose live ranges do not overlap; returns the new slot of each
+    # slot that was merged into another
+    def coalesce(self, pairs):
+        edges = self.interference()
+        representative = {}
+
+        def find(slot):
+            while slot in representative:
+                slot = representative[slot]
+            return slot
+
+        for first, second in pairs:
+            if second is None:
+                continue
+            first, second = find(first), find(second)
+            if first == second or any(find(other) == second for other in edges.get(first, ())):
+                continue
+            representative[second] = first
+            edges.setdefault(first, set()).update(edges.get(second, ()))
+            self.statistics["coalesced"] += 1
+        return {slot: find(slot) for slot in representative}
+
+    # Pairs of slots live at the same time: a store conflicts with every other slot live after it
+    def interference(self):
+        accesses = {}
+        for block in self.region.blocks:
+            read, written = set(), set()
+            for slot, access in slot_accesses(block.instructions):
+                if access == "ld" and slot not in written:
+                    read.add(slot)
+                elif access == "st":
+                    written.add(slot)
+            accesses[id(block)] = (read, written)
+
+        live_in = {id(block): set() for block in self.region.blocks}
+        changed = True
+        while changed:
+            changed = False
+            for block in reversed(self.region.blocks):
+                out = set().union(*[live_in[id(successor)] for successor in block.successors()])
+                read, written = accesses[id(block)]
+                new_in = read | (out - written)
+                if new_in != live_in[id(block)]:
+                    live_in[id(block)] = new_in
+                    changed = True
+
+        edges = {}
+        for block in self.region.blocks:
+            live = set().union(*[live_in[id(successor)] for successor in block.successors()])
+            for slot, access in reversed(slot_accesses(block.instructions)):
+                if access == "st":
+                    for other in live - {slot}:
+                        edges.setdefault(slot, set()).add(other)
+                        edges.setdefault(other, set()).add(slot)
+                    live.discard(slot)
+                else:
+                    live.add(slot)
+        return edges
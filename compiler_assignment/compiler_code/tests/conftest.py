@@ -0,0 +1,6 @@
+# The compiler's modules import each other by their plain names, so the tests import them the same way
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
@@ -0,0 +1,71 @@
+# Compiles test programs through the passes of the code generator's usage script, with any of them left out, and
+# runs the result on the test machine, so each pass can be checked against the program compiled without it
+from semantic_analyser import SemanticAnalyzer
+from inlining import FunctionInliner
+from constant_folding import ConstantFolder
+from constant_propagation import ConstantPropagator
+from pixel_coalescing import PixelCoalescer
+from frame_optimization import FrameOptimizer
+from code_generation import PixIRCodeGenerator
+from pixir_machine import PixIRMachine
+
+###########################################################################################################################################
+
+# The AST passes, in the order the usage script runs them
+AST_PASSES = {
+    "inline": lambda ast, types: FunctionInliner(ast, types).inline(),
+    "fold": lambda ast, types: ConstantFolder(ast, types).fold(),
+    "propagate": lambda ast, types: ConstantPropagator(ast, types).propagate(),
+    "coalesce": lambda ast, types: PixelCoalescer(ast, types).coalesce(),
+    "frames": lambda ast, types: FrameOptimizer(ast, types).optimize(),
+}
+
+###########################################################################################################################################
+
+# Compiles the program with the given AST passes, and with or without the generator's own optimizations, and
+# returns the generator and the program it emitted
+def compile_program(ast, passes=(), optimize=False):
+    analyzer = SemanticAnalyzer(ast)
+    analyzer.analyze()
+    for name, run_pass in AST_PASSES.items():
+        if name in passes:
+            ast = run_pass(ast, analyzer.expression_types)
+    generator = PixIRCodeGenerator(ast, analyzer.expression_types, optimize=optimize)
+    return generator, generator.generate()
+
+# Runs the compiled program and returns the machine, whose events and statistics the tests compare
+def run(ast, passes=(), optimize=False):
+    machine = PixIRMachine(compile_program(ast, passes, optimize)[1])
+    machine.run()
+    return machine
+
+# Number of instructions in the generated code, leaving out label definitions
+def instruction_count(generator):
+    return sum(1 for line in generator.code if not line.startswith("."))
+
+# What a program's events let someone watching the display see: what is printed, and the display each delay
+# shows along with how long it shows it. Delays showing the same display one after another count as one
+# delay of their total length, and the display left at the end counts as shown.
+def observed(events):
+    display = {}
+    seen = []
+    drawn = True
+    for event in events:
+        if event[0] == "pixel":
+            _, x, y, colour = event
+            display[(x, y)] = colour
+            drawn = True
+        elif event[0] == "pixelr":
+            _, x, y, width, height, colour = event
+            for row in range(y, y + height):
+                for column in range(x, x + width):
+                    display[(column, row)] = colour
+            drawn = True
+        elif event[0] == "delay" and not drawn and seen and seen[-1][0] == "shown":
+            seen[-1] = ("shown", seen[-1][1], seen[-1][2] + event[1])
+        elif event[0] == "delay":
+            seen.append(("shown", dict(display), event[1]))
+            drawn = False
+        else:
+            seen.append(event)
+    return seen + [("shown", display, None)]
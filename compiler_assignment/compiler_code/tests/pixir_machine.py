@@ -0,0 +1,130 @@
+# Small PixIR machine for the tests: runs generated code and records what it prints and draws, and how its
+# frames grow, without a PAD display.
+import random
+from constant_pool import read_program
+
+###########################################################################################################################################
+
+class MachineError(Exception):
+    pass
+
+# Instructions taking two operands off the stack, with the value each leaves in their place
+BINARY_OPERATIONS = {
+    "add": lambda a, b: a + b, "sub": lambda a, b: a - b, "mul": lambda a, b: a * b,
+    "div": lambda a, b: a / b, "mod": lambda a, b: a % b,
+    "max": max, "min": min,
+    "lt": lambda a, b: int(a < b), "le": lambda a, b: int(a <= b),
+    "gt": lambda a, b: int(a > b), "ge": lambda a, b: int(a >= b),
+    "eq": lambda a, b: int(a == b), "neq": lambda a, b: int(a != b),
+    "and": lambda a, b: int(bool(a) and bool(b)), "or": lambda a, b: int(bool(a) or bool(b)),
+}
+
+###########################################################################################################################################
+
+class PixIRMachine:
+    def __init__(self, code, max_steps=1000000, seed=0):
+        # The PixIR instructions and label definitions, one per line, with the constants in place of references
+        _, self.code = read_program(code)
+        # Instructions run before giving up on a program that does not stop
+        self.max_steps = max_steps
+        # Random numbers come from a seeded generator, so runs of the same program draw the same numbers
+        self.random = random.Random(seed)
+        # Everything printed, drawn and waited for, in order
+        self.events = []
+        # Number of 'alloc' instructions run, the largest any frame has grown to, the number of instructions
+        # run and how many times each opcode was
+        self.statistics = {"allocs": 0, "largest frame": 0, "instructions": 0, "opcodes": {}}
+        # Index of the line each label is defined on
+        self.labels = {line: index for index, line in enumerate(self.code) if line.startswith(".")}
+
+    #---------------------------------------------------------------------------------------------------------------------------------------
+
+    # Runs the program to its end and returns its events
+    def run(self):
+        stack = []
+        frames = [[]]
+        returns = []
+        counter = 0
+        steps = 0
+        while counter < len(self.code):
+            steps += 1
+            if steps > self.max_steps:
+                raise MachineError("The program did not stop.")
+            instruction = self.code[counter]
+            counter += 1
+            if instruction.startswith("."):
+                continue
+            opcode, _, operand = instruction.partition(" ")
+            self.statistics["instructions"] += 1
+            self.statistics["opcodes"][opcode] = self.statistics["opcodes"].get(opcode, 0) + 1
+
+            if opcode == "push":
+                stack.append(self.operand(operand))
+            elif opcode == "alloc":
+                frames[-1].extend([None] * stack.pop())
+                self.statistics["allocs"] += 1
+                self.statistics["largest frame"] = max(self.statistics["largest frame"], len(frames[-1]))
+            elif opcode in ("st", "ld"):
+                level, slot = stack.pop(), stack.pop()
+                frame = frames[-1] if level == 0 else frames[0]
+                if slot >= len(frame):
+                    raise MachineError(f"Slot {slot} is outside the frame.")
+                if opcode == "st":
+                    frame[slot] = stack.pop()
+                else:
+                    stack.append(frame[slot])
+            elif opcode == "call":
+                label, count = stack.pop(), stack.pop()
+                arguments = stack[len(stack) - count:]
+                del stack[len(stack) - count:]
+                returns.append(counter)
+                frames.append(arguments)
+                counter = self.jump(label)
+            elif opcode == "ret":
+                if not returns:
+                    break
+                counter = returns.pop()
+                frames.pop()
+            elif opcode in BINARY_OPERATIONS:
+                right, left = stack.pop(), stack.pop()
+                stack.append(BINARY_OPERATIONS[opcode](left, right))
+            elif opcode == "not":
+                stack.append(int(not stack.pop()))
+            elif opcode == "dup":
+                stack.append(stack[-1])
+            elif opcode == "drop":
+                stack.pop()
+            elif opcode == "jmp":
+                counter = self.jump(operand)
+            elif opcode == "cjmp":
+                # Jumps when the condition is false
+                if not stack.pop():
+                    counter = self.jump(operand)
+            elif opcode in ("print", "delay"):
+                self.events.append((opcode, stack.pop()))
+            elif opcode == "pixel":
+                colour, y, x = stack.pop(), stack.pop(), stack.pop()
+                self.events.append(("pixel", x, y, colour))
+            elif opcode == "pixelr":
+                arguments = [stack.pop() for _ in range(5)]
+                self.events.append(("pixelr", *reversed(arguments)))
+            elif opcode == "irnd":
+                stack.append(self.random.randrange(stack.pop()))
+            elif opcode in ("width", "height"):
+                stack.append(36 if opcode == "width" else 24)
+            else:
+                raise MachineError(f"Unknown instruction '{instruction}'.")
+        return self.events
+
+    def operand(self, operand):
+        if operand.startswith(("#", '"', ".")):
+            return operand
+        try:
+            return int(operand)
+        except ValueError:
+            return float(operand)
+
+    def jump(self, label):
+        if label not in self.labels:
+            raise MachineError(f"Undefined label '{label}'.")
+        return self.labels[label]
@@ -0,0 +1,55 @@
+# Disassembling assembled PixIR must give back exactly the lines it was assembled from
+import pytest
+from bytecode import assemble, disassemble, BytecodeError, MAGIC
+from semantic_analyser import SemanticAnalyzer
+from code_generation import PixIRCodeGenerator
+
+###########################################################################################################################################
+
+def test_labels_sharing_an_offset_keep_their_names():
+    code = [
+        ".main",
+        "push 3",
+        ".loop",
+        ".check",
+        "push 1",
+        "sub",
+        "dup",
+        "cjmp .done",
+        "jmp .check",
+        "push .loop",
+        "drop",
+        "jmp .loop",
+        ".done",
+        ".end",
+        "push #ff0000",
+        "push 1.5",
+        "cjmp .end",
+        "halt",
+    ]
+    assert disassemble(assemble(code)) == code
+
+def test_generated_program_round_trips():
+    # Unoptimized, a for loop ending an if block leaves the loop's exit and the end of the if on the same
+    # instruction, and both are jumped to
+    program = [
+        ("DECLARATION", "TYPE_INT", "n", ("RANDI_STATEMENT", ("INTEGER_LITERAL", 6))),
+        ("IF", ("RELATIONAL_OPERATOR", ("IDENTIFIER", "n"), ("INTEGER_LITERAL", 3), ">="), ("BLOCK", [
+            ("FOR", ("DECLARATION", "TYPE_INT", "i", ("INTEGER_LITERAL", 0)),
+             ("RELATIONAL_OPERATOR", ("IDENTIFIER", "i"), ("IDENTIFIER", "n"), "<"),
+             ("ASSIGNMENT", "i", ("PLUS", ("IDENTIFIER", "i"), ("INTEGER_LITERAL", 1))),
+             ("BLOCK", [("PIXEL_STATEMENT", [("IDENTIFIER", "i"), ("INTEGER_LITERAL", 0), ("COLOR_LITERAL", "#00ff00")])])),
+        ])),
+    ]
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    generator = PixIRCodeGenerator(program, analyzer.expression_types, optimize=False)
+    text = generator.generate()
+    assert any(line.startswith(".") and following.startswith(".") for line, following in zip(generator.code, generator.code[1:]))
+    assert disassemble(assemble(text)) == generator.code
+
+def test_rejects_other_data():
+    with pytest.raises(BytecodeError):
+        disassemble(b"PIXIR")
+    with pytest.raises(BytecodeError):
+        disassemble(MAGIC + bytes([1]))
@@ -0,0 +1,132 @@
+# Cleaning up the block graph must leave programs printing and drawing exactly what they did, and every label
+# the generated code defines must be unique
+import pytest
+from cfg import ControlFlowGraph, Jump, Branch, Return
+from slot_allocation import SlotAllocator
+from pixir_machine import PixIRMachine
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+# Runs the graph, cleaned up or only laid out, and returns the machine and the lines it ran
+def run_graph(cfg, optimize):
+    if optimize:
+        cfg.optimize()
+    else:
+        cfg.remove_unreachable()
+        cfg.layout()
+    code = cfg.emit()
+    machine = PixIRMachine(SlotAllocator(code).allocate())
+    machine.run()
+    return machine, code
+
+# if (irnd 2 < 1) { print 1 } else { print 2 }, where both arms reach the end through empty blocks, and the
+# end block is only ever reached by jumping. A block nothing jumps to prints 3.
+def branches_through_empty_blocks():
+    cfg = ControlFlowGraph()
+    then_block, else_block = cfg.new_block("THEN"), cfg.new_block("ELSE")
+    then_exit, else_exit, end = cfg.new_block("THEN_EXIT"), cfg.new_block("ELSE_EXIT"), cfg.new_block("END")
+    unreachable = cfg.new_block("UNREACHABLE")
+    cfg.entry.instructions = ["push 2", "irnd", "push 1", "lt"]
+    cfg.entry.terminator = Branch(else_block, then_block)
+    then_block.instructions = ["push 1", "print"]
+    then_block.terminator = Jump(then_exit)
+    else_block.instructions = ["push 2", "print"]
+    else_block.terminator = Jump(else_exit)
+    then_exit.terminator = Jump(end)
+    else_exit.terminator = Jump(end)
+    end.instructions = ["push 4", "print"]
+    end.terminator = Return()
+    unreachable.instructions = ["push 3", "print"]
+    unreachable.terminator = Jump(end)
+    return cfg
+
+###########################################################################################################################################
+
+def test_labels_are_unique():
+    cfg = ControlFlowGraph()
+    labels = [cfg.new_block("WHILE_START").label for _ in range(3)]
+    assert len(set(labels)) == 3
+    assert cfg.new_block("main", numbered=False).label == ".main"
+
+def test_cleanup_runs_as_the_laid_out_graph():
+    unoptimized, _ = run_graph(branches_through_empty_blocks(), optimize=False)
+    optimized, _ = run_graph(branches_through_empty_blocks(), optimize=True)
+    assert optimized.events == unoptimized.events
+    assert ("print", 3) not in optimized.events
+    assert optimized.statistics["instructions"] <= unoptimized.statistics["instructions"]
+
+def test_unreachable_blocks_are_removed():
+    cfg = branches_through_empty_blocks()
+    assert cfg.remove_unreachable() == 1
+    assert "push 3" not in cfg.emit()
+
+def test_jumps_are_threaded_through_empty_blocks():
+    cfg = branches_through_empty_blocks()
+    cfg.remove_unreachable()
+    then_block, else_block, end = cfg.blocks[1], cfg.blocks[2], cfg.blocks[5]
+    assert cfg.thread_jumps() == 2
+    assert then_block.terminator.target is end and else_block.terminator.target is end
+
+def test_branch_whose_arms_meet_pops_its_condition():
+    cfg = ControlFlowGraph()
+    left, right, end = cfg.new_block("LEFT"), cfg.new_block("RIGHT"), cfg.new_block("END")
+    cfg.entry.instructions = ["push 5", "push 2", "irnd"]
+    cfg.entry.terminator = Branch(left, right)
+    left.terminator = Jump(end)
+    right.terminator = Jump(end)
+    end.instructions = ["print"]
+    end.terminator = Return()
+    optimized, code = run_graph(cfg, optimize=True)
+    assert optimized.events == [("print", 5)]
+    assert code == ["push 5", "push 2", "irnd", "drop", "print", "ret"]
+
+def test_straight_line_blocks_are_merged_and_need_no_labels():
+    cfg = ControlFlowGraph()
+    middle, end = cfg.new_block("MIDDLE"), cfg.new_block("END")
+    cfg.entry.instructions = ["push 1", "print"]
+    cfg.entry.terminator = Jump(middle)
+    middle.instructions = ["push 2", "print"]
+    middle.terminator = Jump(end)
+    end.terminator = Return()
+    assert cfg.merge_blocks() == 2
+    assert cfg.emit() == ["push 1", "print", "push 2", "print", "ret"]
+
+###########################################################################################################################################
+
+def counter_loop(name, body):
+    return ("FOR", ("DECLARATION", "TYPE_INT", name, integer(0)),
+            ("RELATIONAL_OPERATOR", identifier(name), integer(2), "<"),
+            ("ASSIGNMENT", name, ("PLUS", identifier(name), integer(1))),
+            ("BLOCK", body))
+
+# The same loops and ifs, nested and one after another, each wanting the same label names
+REPEATED_SHAPES = [
+    ("DECLARATION", "TYPE_INT", "x", ("RANDI_STATEMENT", integer(3))),
+    counter_loop("i", [
+        ("IF", ("RELATIONAL_OPERATOR", identifier("x"), integer(1), ">"), ("BLOCK", [("PRINT", identifier("i"))])),
+        counter_loop("j", [("PRINT", identifier("j"))]),
+    ]),
+    counter_loop("k", [
+        ("IF", ("RELATIONAL_OPERATOR", identifier("x"), integer(1), ">"), ("BLOCK", [("PRINT", identifier("k"))]),
+         ("ELSE", ("BLOCK", [("PRINT", identifier("x"))]))),
+    ]),
+]
+
+@pytest.mark.parametrize("optimize", [False, True])
+def test_generated_labels_are_defined_once(optimize):
+    generator, _ = compile_program(REPEATED_SHAPES, optimize=optimize)
+    labels = [line for line in generator.code if line.startswith(".")]
+    assert len(labels) == len(set(labels))
+    # Every jump goes to a label that is there
+    targets = {line.split(" ")[1] for line in generator.code if line.startswith(("jmp ", "cjmp "))}
+    assert targets <= set(labels)
+
+def test_generated_graph_runs_the_same_optimized():
+    assert run(REPEATED_SHAPES, optimize=True).events == run(REPEATED_SHAPES).events
@@ -0,0 +1,96 @@
+# Folded programs must print and draw exactly what the same programs do without folding, and statements with
+# nothing to fold keep their original nodes
+import pytest
+from constant_folding import ConstantFolder
+from semantic_analyser import SemanticAnalyzer
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def random_below(limit):
+    return ("RANDI_STATEMENT", integer(limit))
+
+PROGRAMS = {
+    "arithmetic on literals": [
+        ("PRINT", ("PLUS", ("MUL", integer(3), integer(4)), ("MUL", ("FLOAT_LITERAL", 0.5), integer(7)))),
+        ("DECLARATION", "TYPE_INT", "x", ("PLUS", integer(2), ("MUL", integer(2), integer(3)))),
+        ("PRINT", ("MUL", identifier("x"), ("PLUS", integer(1), integer(1)))),
+    ],
+    "identities keep variables and their side effects": [
+        ("DECLARATION", "TYPE_INT", "x", random_below(10)),
+        ("PRINT", ("PLUS", identifier("x"), integer(0))),
+        ("PRINT", ("MUL", integer(1), identifier("x"))),
+        ("PRINT", ("MUL", identifier("x"), integer(0))),
+        # The random number is still drawn, so the numbers drawn after it stay the same
+        ("PRINT", ("MUL", random_below(10), integer(0))),
+        ("PRINT", random_below(100)),
+    ],
+    "comparisons and logical operators": [
+        ("DECLARATION", "TYPE_BOOL", "b", ("RELATIONAL_OPERATOR", random_below(2), integer(1), "<")),
+        ("IF", ("LOGICAL_OPERATOR", ("RELATIONAL_OPERATOR", integer(2), integer(3), "<"), identifier("b"), "and"),
+         ("BLOCK", [("PRINT", integer(1))]), ("ELSE", ("BLOCK", [("PRINT", integer(0))]))),
+        ("IF", ("LOGICAL_OPERATOR", ("BOOLEAN_LITERAL", False), ("RELATIONAL_OPERATOR", random_below(2), integer(0), "=="), "or"),
+         ("BLOCK", [("PRINT", integer(2))])),
+        ("PRINT", random_below(100)),
+        ("PRINT", ("EQUALITY_OPERATOR", ("COLOR_LITERAL", "#FF0000"), ("COLOR_LITERAL", "#ff0000"), "==")),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_folded_program_runs_as_unfolded(name):
+    program = PROGRAMS[name]
+    expected = run(program).events
+    assert run(program, passes=("fold",)).events == expected
+    assert run(program, passes=("fold",), optimize=True).events == expected
+
+def fold(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    folder = ConstantFolder(program, analyzer.expression_types)
+    return folder.fold(), folder.folded
+
+def test_literals_are_computed():
+    folded, count = fold([
+        ("PRINT", ("MINUS", integer(10), integer(7))),
+        ("PRINT", ("DIV", integer(7), integer(2))),
+        ("PRINT", ("MOD", integer(17), integer(5))),
+        ("PRINT", ("NEGATIVE", ("PLUS", integer(2), integer(2)))),
+        # Python and the PAD disagree on the sign of this remainder, so it is left to run time
+        ("PRINT", ("MOD", ("NEGATIVE", integer(7)), integer(3))),
+    ])
+    assert folded == [
+        ("PRINT", integer(3)),
+        ("PRINT", ("FLOAT_LITERAL", 3.5)),
+        ("PRINT", integer(2)),
+        ("PRINT", integer(-4)),
+        ("PRINT", ("MOD", integer(-7), integer(3))),
+    ]
+    assert count == 6
+
+###########################################################################################################################################
+
+def test_unchanged_statements_keep_their_nodes():
+    # while (i < 3) { print i; i = i + 1; } has nothing to fold, so the loop and the lists inside it stay the same
+    loop = ("WHILE", ("RELATIONAL_OPERATOR", identifier("i"), integer(3), "<"), ("BLOCK", [
+        ("PRINT", identifier("i")),
+        ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+    ]))
+    program = [("DECLARATION", "TYPE_INT", "i", integer(0)), loop]
+    folded, _ = fold(program)
+    assert folded[1] is loop
+    assert folded[1][2][1] is loop[2][1]
+
+def test_changed_list_gets_new_parents():
+    block = ("BLOCK", [("PRINT", identifier("i")), ("PRINT", ("PLUS", integer(1), integer(1)))])
+    program = [("DECLARATION", "TYPE_INT", "i", integer(0)), ("IF", ("BOOLEAN_LITERAL", True), block)]
+    folded, _ = fold(program)
+    assert folded[0] is program[0]
+    new_block = folded[1][2]
+    assert new_block is not block and new_block[1][0] is block[1][0]
+    assert new_block[1][1] == ("PRINT", integer(2))
@@ -0,0 +1,55 @@
+# Emitted programs list their colour, float and string literals once, in the header, and refer to them by index
+from semantic_analyser import SemanticAnalyzer
+from code_generation import PixIRCodeGenerator
+from constant_pool import read_program, is_pooled
+from bytecode import assemble, disassemble
+from pixir_machine import PixIRMachine
+
+###########################################################################################################################################
+
+def colour(value):
+    return ("COLOR_LITERAL", value)
+
+# Draws the same colours and prints the same float several times
+PROGRAM = [
+    ("DECLARATION", "TYPE_FLOAT", "scale", ("FLOAT_LITERAL", 1.5)),
+    ("PRINT", ("FLOAT_LITERAL", 1.5)),
+    ("PIXEL_STATEMENT", [("INTEGER_LITERAL", 1), ("INTEGER_LITERAL", 2), colour("#FF0000")]),
+    ("PIXEL_STATEMENT", [("INTEGER_LITERAL", 3), ("INTEGER_LITERAL", 4), colour("#ff0000")]),
+    ("PIXEL_STATEMENT", [("INTEGER_LITERAL", 5), ("INTEGER_LITERAL", 6), colour("#00ff00")]),
+    ("PRINT", ("IDENTIFIER", "scale")),
+    ("PIXEL_STATEMENT", [("INTEGER_LITERAL", 7), ("INTEGER_LITERAL", 8), colour("#00FF00")]),
+]
+
+def generate():
+    analyzer = SemanticAnalyzer(PROGRAM)
+    analyzer.analyze()
+    generator = PixIRCodeGenerator(PROGRAM, analyzer.expression_types, optimize=False)
+    return generator, generator.generate()
+
+###########################################################################################################################################
+
+def test_header_lists_each_constant_once():
+    generator, text = generate()
+    lines = text.split("\n")
+    assert lines[:4] == ["constants 3", "0 1.5", "1 #ff0000", "2 #00ff00"]
+    # Every instruction refers to the constants by index
+    code = lines[4:]
+    assert not any(line.startswith("push ") and is_pooled(line[len("push "):]) for line in code)
+    assert code.count("push @1") == 2 and code.count("push @2") == 2
+
+def test_emitted_program_reads_back_into_the_generated_code():
+    generator, text = generate()
+    pool, code = read_program(text)
+    assert pool.entries == generator.constant_pool.entries
+    assert code == generator.code
+    assert disassemble(assemble(text)) == generator.code
+
+def test_emitted_program_runs():
+    _, text = generate()
+    assert PixIRMachine(text).run() == [
+        ("print", 1.5),
+        ("pixel", 1, 2, "#ff0000"), ("pixel", 3, 4, "#ff0000"), ("pixel", 5, 6, "#00ff00"),
+        ("print", 1.5),
+        ("pixel", 7, 8, "#00ff00"),
+    ]
@@ -0,0 +1,66 @@
+# Propagated programs must print and draw exactly what the same programs do without propagation
+import pytest
+from constant_propagation import ConstantPropagator
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def increment(name):
+    return ("ASSIGNMENT", name, ("PLUS", identifier(name), integer(1)))
+
+def below(name, limit):
+    return ("RELATIONAL_OPERATOR", identifier(name), integer(limit), "<")
+
+# for (let i: int = 0; ...) declares its own counter
+DECLARED_COUNTER = [
+    ("FOR", ("DECLARATION", "TYPE_INT", "i", integer(0)), below("i", 3), increment("i"),
+     ("BLOCK", [("PRINT", identifier("i"))])),
+]
+
+# for (i = 0; ...) counts with a variable declared, and known to be constant, before the loop; its value
+# after the loop is whatever the loop left in it
+ASSIGNED_COUNTER = [
+    ("DECLARATION", "TYPE_INT", "i", integer(7)),
+    ("PRINT", identifier("i")),
+    ("FOR", ("ASSIGNMENT", "i", integer(0)), below("i", 3), increment("i"),
+     ("BLOCK", [("PRINT", identifier("i"))])),
+    ("PRINT", identifier("i")),
+]
+
+# The counter is only ever stored to by the loop itself, which must keep its declaration
+UNREAD_COUNTER = [
+    ("DECLARATION", "TYPE_INT", "i", integer(7)),
+    ("DECLARATION", "TYPE_INT", "n", integer(0)),
+    ("FOR", ("ASSIGNMENT", "i", integer(0)), below("n", 2), ("ASSIGNMENT", "n", ("PLUS", identifier("n"), integer(1))),
+     ("BLOCK", [("DELAY", integer(5))])),
+    ("PRINT", identifier("n")),
+]
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("program", [DECLARED_COUNTER, ASSIGNED_COUNTER, UNREAD_COUNTER])
+def test_for_loops_run_as_without_propagation(program):
+    expected = run(program, passes=("fold",)).events
+    assert run(program, passes=("fold", "propagate")).events == expected
+    assert run(program, passes=("fold", "propagate"), optimize=True).events == expected
+
+def test_assigned_counter_is_not_redeclared():
+    propagated = ConstantPropagator(ASSIGNED_COUNTER).propagate()
+    assert propagated[0] == ASSIGNED_COUNTER[0]
+    # Only the read before the loop is known, so only it becomes a literal
+    assert propagated[1] == ("PRINT", integer(7))
+    assert propagated[2][1] == ("ASSIGNMENT", "i", integer(0))
+    assert propagated[3] == ("PRINT", identifier("i"))
+    assert run(ASSIGNED_COUNTER, passes=("fold", "propagate")).events == [("print", 7), ("print", 0), ("print", 1), ("print", 2), ("print", 3)]
+
+def test_declaration_stored_to_by_the_loop_is_kept():
+    propagated = ConstantPropagator(UNREAD_COUNTER).propagate()
+    assert propagated[0] == UNREAD_COUNTER[0]
+    # Code generation would fail on a store to a variable that is no longer declared
+    compile_program(propagated)
@@ -0,0 +1,97 @@
+# A value computed again is only replaced by a load of the first result when nothing in between can have
+# changed it; programs print and draw exactly what they did
+import itertools
+import pytest
+from cfg import ControlFlowGraph, Return
+from cse import CommonSubexpressionEliminator
+from slot_allocation import SlotAllocator
+from pixir_machine import PixIRMachine
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def store(slot):
+    return [f"push {slot}", "push 0", "st"]
+
+def load(slot):
+    return [f"push {slot}", "push 0", "ld"]
+
+# Runs straight-line code, with or without the eliminator, and returns the machine and the number of
+# computations replaced
+def run_block(instructions, eliminate):
+    cfg = ControlFlowGraph()
+    cfg.entry.instructions = list(instructions)
+    cfg.entry.terminator = Return()
+    eliminated = 0
+    if eliminate:
+        slots = itertools.count(100)
+        eliminated = CommonSubexpressionEliminator(cfg, lambda: "$%d" % next(slots)).eliminate()
+    machine = PixIRMachine(SlotAllocator(cfg.emit()).allocate())
+    machine.run()
+    return machine, eliminated
+
+def compare(instructions):
+    unoptimized, _ = run_block(instructions, eliminate=False)
+    optimized, eliminated = run_block(instructions, eliminate=True)
+    assert optimized.events == unoptimized.events
+    return optimized, unoptimized, eliminated
+
+# x = irnd 10; y = irnd 10
+SETUP = ["push 10", "irnd"] + store("$0") + ["push 10", "irnd"] + store("$1")
+# x * y + 1
+PRODUCT = load("$0") + load("$1") + ["mul", "push 1", "add"]
+
+###########################################################################################################################################
+
+def test_repeated_expression_is_computed_once():
+    optimized, unoptimized, eliminated = compare(SETUP + PRODUCT + ["print"] + PRODUCT + ["print"] + PRODUCT + ["print"])
+    assert eliminated == 2
+    assert optimized.statistics["opcodes"]["mul"] == 1
+    assert optimized.statistics["instructions"] < unoptimized.statistics["instructions"]
+
+def test_store_in_between_is_respected():
+    # print x * y + 1; x = x + 1; print x * y + 1
+    code = SETUP + PRODUCT + ["print"] + load("$0") + ["push 1", "add"] + store("$0") + PRODUCT + ["print"]
+    optimized, _, eliminated = compare(code)
+    assert eliminated == 0
+    assert optimized.statistics["opcodes"]["mul"] == 2
+
+def test_call_in_between_is_respected():
+    # A function changes x, the program's $0, through 'push $0 / push 1 / ld' and 'st'
+    code = SETUP + PRODUCT + ["print", "push 0", "push .bump", "call", "drop"] + PRODUCT + ["print", "ret",
+            ".bump", "push $0", "push 1", "ld", "push 1", "add", "push $0", "push 1", "st", "push 0"]
+    optimized, _, eliminated = compare(code)
+    assert eliminated == 0
+
+def test_random_numbers_are_not_merged():
+    code = ["push 5", "irnd", "push 2", "mul", "print", "push 5", "irnd", "push 2", "mul", "print"]
+    optimized, _, eliminated = compare(code)
+    assert eliminated == 0
+    assert optimized.statistics["opcodes"]["irnd"] == 2
+
+def test_short_expression_is_not_worth_a_temporary():
+    # Loading x again costs as much as a load from a temporary
+    optimized, unoptimized, eliminated = compare(SETUP + load("$0") + ["print"] + load("$0") + ["print"])
+    assert eliminated == 0
+
+###########################################################################################################################################
+
+PROGRAMS = {
+    "repeated products": [
+        ("DECLARATION", "TYPE_INT", "x", ("RANDI_STATEMENT", integer(10))),
+        ("DECLARATION", "TYPE_INT", "y", ("RANDI_STATEMENT", integer(10))),
+        ("PIXEL_STATEMENT", [("MUL", identifier("x"), identifier("y")), ("MUL", identifier("x"), identifier("y")), ("COLOR_LITERAL", "#ff0000")]),
+        ("ASSIGNMENT", "x", ("PLUS", identifier("x"), integer(1))),
+        ("PRINT", ("PLUS", ("MUL", identifier("x"), identifier("y")), ("MUL", identifier("x"), identifier("y")))),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_program_runs_as_unoptimized(name):
+    assert run(PROGRAMS[name], optimize=True).events == run(PROGRAMS[name]).events
@@ -0,0 +1,130 @@
+# Dead-code elimination may only remove what nothing observes: programs print and draw exactly what they did,
+# and stores read on a later iteration or from another frame stay
+import pytest
+from cfg import ControlFlowGraph, Jump, Branch, Return
+from dead_code import DeadCodeEliminator
+from slot_allocation import SlotAllocator
+from pixir_machine import PixIRMachine
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def store(slot):
+    return [f"push {slot}", "push 0", "st"]
+
+def load(slot):
+    return [f"push {slot}", "push 0", "ld"]
+
+# Runs the graph with or without dead-code elimination, and returns the machine and what was removed
+def run_graph(cfg, eliminate):
+    removed = DeadCodeEliminator(cfg).eliminate() if eliminate else None
+    cfg.remove_unreachable()
+    cfg.layout()
+    machine = PixIRMachine(SlotAllocator(cfg.emit()).allocate())
+    machine.run()
+    return machine, removed
+
+def straight_line(instructions):
+    cfg = ControlFlowGraph()
+    cfg.entry.instructions = instructions
+    cfg.entry.terminator = Return()
+    return cfg
+
+def compare(build):
+    unoptimized, _ = run_graph(build(), eliminate=False)
+    optimized, removed = run_graph(build(), eliminate=True)
+    assert optimized.events == unoptimized.events
+    assert optimized.statistics["instructions"] < unoptimized.statistics["instructions"]
+    return optimized, removed
+
+###########################################################################################################################################
+
+def test_constant_branch_becomes_a_jump():
+    def build():
+        cfg = ControlFlowGraph()
+        then_block, else_block, end = cfg.new_block("THEN"), cfg.new_block("ELSE"), cfg.new_block("END")
+        cfg.entry.instructions = ["push 0"]
+        cfg.entry.terminator = Branch(else_block, then_block)
+        then_block.instructions = ["push 1", "print"]
+        then_block.terminator = Jump(end)
+        else_block.instructions = ["push 2", "print"]
+        else_block.terminator = Jump(end)
+        end.terminator = Return()
+        return cfg
+    optimized, removed = compare(build)
+    assert optimized.events == [("print", 2)]
+    assert removed["branches"] == 1
+
+def test_overwritten_and_read_back_stores_go():
+    # x = 1; x = 2; y = x; print y
+    def build():
+        return straight_line(["push 1"] + store("$0") + ["push 2"] + store("$0") + load("$0") + store("$1") + load("$1") + ["print"])
+    optimized, removed = compare(build)
+    assert optimized.events == [("print", 2)]
+    assert removed["stores"] >= 2
+
+def test_unused_values_go_unless_they_have_side_effects():
+    def build():
+        return straight_line(["push 1", "push 2", "add", "drop", "push 3", "irnd", "drop", "push 4", "irnd", "print"])
+    optimized, removed = compare(build)
+    assert removed["expressions"] == 1
+    # The first random number is still drawn, so the one printed is the same
+    assert optimized.statistics["opcodes"]["irnd"] == 2
+
+def test_store_read_on_the_next_iteration_stays():
+    # i = 0; while (i < 3) { print i; i = i + 1; }, where the store at the end of the body is only read by the
+    # loop head
+    cfg = ControlFlowGraph()
+    header, body, end = cfg.new_block("WHILE_START"), cfg.new_block("WHILE_BODY"), cfg.new_block("WHILE_END")
+    cfg.entry.instructions = ["push 0"] + store("$0")
+    cfg.entry.terminator = Jump(header)
+    header.instructions = load("$0") + ["push 3", "lt"]
+    header.terminator = Branch(end, body)
+    body.instructions = load("$0") + ["print"] + load("$0") + ["push 1", "add"] + store("$0")
+    body.terminator = Jump(header)
+    end.terminator = Return()
+    optimized, removed = run_graph(cfg, eliminate=True)
+    assert optimized.events == [("print", 0), ("print", 1), ("print", 2)]
+    assert removed["stores"] == 0
+
+def test_store_read_from_another_frame_stays():
+    # The program stores 5 in its slot $0 and calls a function that prints it through 'push $0 / push 1 / ld'
+    cfg = ControlFlowGraph()
+    function = cfg.new_block("show", numbered=False)
+    cfg.roots.append(function)
+    cfg.entry.instructions = ["push 5"] + store("$0") + ["push 0", "push .show", "call", "drop"]
+    cfg.entry.terminator = Return()
+    function.instructions = ["push $0", "push 1", "ld", "print", "push 0"]
+    function.terminator = Return()
+    optimized, removed = run_graph(cfg, eliminate=True)
+    assert optimized.events == [("print", 5)]
+    assert removed["stores"] == 0
+
+###########################################################################################################################################
+
+PROGRAMS = {
+    "dead branches and stores": [
+        ("DECLARATION", "TYPE_INT", "x", integer(1)),
+        ("ASSIGNMENT", "x", ("RANDI_STATEMENT", integer(10))),
+        ("IF", ("BOOLEAN_LITERAL", False), ("BLOCK", [("PRINT", identifier("x"))]),
+         ("ELSE", ("BLOCK", [("PRINT", ("PLUS", identifier("x"), integer(1)))]))),
+        ("DECLARATION", "TYPE_INT", "unused", ("PLUS", identifier("x"), identifier("x"))),
+    ],
+    "loop counter read only by its condition": [
+        ("DECLARATION", "TYPE_INT", "n", integer(0)),
+        ("WHILE", ("RELATIONAL_OPERATOR", identifier("n"), integer(3), "<"), ("BLOCK", [
+            ("DELAY", integer(10)),
+            ("ASSIGNMENT", "n", ("PLUS", identifier("n"), integer(1))),
+        ])),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_program_runs_as_unoptimized(name):
+    assert run(PROGRAMS[name], optimize=True).events == run(PROGRAMS[name]).events
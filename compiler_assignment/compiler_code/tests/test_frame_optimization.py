@@ -0,0 +1,116 @@
+# Dropping pixel writes drawn over later in the same frame, and merging delays that follow each other, must
+# leave every frame showing exactly what it did
+import pytest
+from frame_optimization import FrameOptimizer
+from semantic_analyser import SemanticAnalyzer
+from pipeline import run, observed
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def pixel(x, y, value):
+    return ("PIXEL_STATEMENT", [integer(x), integer(y), ("COLOR_LITERAL", value)])
+
+def rectangle(x, y, width, height, value):
+    return ("PIXELR_STATEMENT", [integer(x), integer(y), integer(width), integer(height), ("COLOR_LITERAL", value)])
+
+def delay(length):
+    return ("DELAY", length if isinstance(length, tuple) else integer(length))
+
+# fun show() -> int { __delay 5; return 0; }, a call that shows the frame drawn so far
+SHOW = ("FUNCTION_DEF", "show", [], "TYPE_INT", ("BLOCK", [delay(5), ("RETURN", integer(0))]))
+
+PROGRAMS = {
+    "overdrawn pixel before a delay": [
+        pixel(1, 1, "#ff0000"), pixel(1, 1, "#00ff00"), delay(10), pixel(2, 2, "#0000ff"),
+    ],
+    "pixel shown by a delay": [
+        pixel(1, 1, "#ff0000"), delay(10), pixel(1, 1, "#00ff00"),
+    ],
+    "pixel shown by a call": [
+        SHOW,
+        pixel(1, 1, "#ff0000"),
+        ("DECLARATION", "TYPE_INT", "x", ("FUNCTION_CALL", "show", [])),
+        pixel(1, 1, "#00ff00"),
+    ],
+    "pixel before a compound statement": [
+        pixel(1, 1, "#ff0000"),
+        ("IF", ("RELATIONAL_OPERATOR", ("RANDI_STATEMENT", integer(2)), integer(1), "<"), ("BLOCK", [delay(3)])),
+        pixel(1, 1, "#00ff00"),
+    ],
+    "pixels covered by a later rectangle": [
+        pixel(0, 0, "#ff0000"), pixel(3, 1, "#ff0000"), pixel(4, 1, "#ff0000"),
+        rectangle(0, 0, 4, 2, "#00ff00"),
+    ],
+    "adjacent delays": [
+        pixel(0, 0, "#ff0000"), delay(10), delay(20), delay(0), pixel(0, 0, "#00ff00"), delay(5),
+    ],
+    "delays kept apart": [
+        ("DECLARATION", "TYPE_INT", "n", ("RANDI_STATEMENT", integer(5))),
+        delay(10), delay(identifier("n")), delay(10), ("PRINT", integer(1)), delay(10),
+    ],
+    "frames in a loop body": [
+        ("FOR", ("DECLARATION", "TYPE_INT", "i", integer(0)),
+         ("RELATIONAL_OPERATOR", identifier("i"), integer(3), "<"),
+         ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+         ("BLOCK", [pixel(0, 0, "#ff0000"), pixel(0, 0, "#00ff00"), delay(1), delay(2)])),
+    ],
+}
+
+def optimize(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    optimizer = FrameOptimizer(program, analyzer.expression_types)
+    return optimizer.optimize(), optimizer.statistics
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_program_shows_the_same_frames(name):
+    program = PROGRAMS[name]
+    expected = observed(run(program).events)
+    assert observed(run(program, passes=("frames",)).events) == expected
+    assert observed(run(program, passes=("coalesce", "frames")).events) == expected
+    assert observed(run(program, passes=("fold", "propagate", "coalesce", "frames"), optimize=True).events) == expected
+
+def test_overdrawn_pixel_is_dropped():
+    optimized, statistics = optimize(PROGRAMS["overdrawn pixel before a delay"])
+    assert optimized == PROGRAMS["overdrawn pixel before a delay"][1:]
+    assert statistics["writes dropped"] == 1
+    assert run(optimized).statistics["opcodes"]["pixel"] == 2
+
+@pytest.mark.parametrize("name", ["pixel shown by a delay", "pixel shown by a call", "pixel before a compound statement"])
+def test_pixel_seen_before_it_is_drawn_over_is_kept(name):
+    optimized, statistics = optimize(PROGRAMS[name])
+    assert optimized == PROGRAMS[name]
+    assert statistics["writes dropped"] == 0
+
+def test_pixels_covered_by_a_later_rectangle_are_dropped():
+    optimized, statistics = optimize(PROGRAMS["pixels covered by a later rectangle"])
+    # (4, 1) lies just outside the rectangle
+    assert optimized == [pixel(4, 1, "#ff0000"), rectangle(0, 0, 4, 2, "#00ff00")]
+    assert statistics["writes dropped"] == 2
+
+def test_adjacent_delays_are_merged():
+    optimized, statistics = optimize(PROGRAMS["adjacent delays"])
+    assert optimized == [pixel(0, 0, "#ff0000"), delay(30), pixel(0, 0, "#00ff00"), delay(5)]
+    assert statistics["delays merged"] == 2
+    assert run(optimized).events == [("pixel", 0, 0, "#ff0000"), ("delay", 30), ("pixel", 0, 0, "#00ff00"), ("delay", 5)]
+
+def test_delays_of_unknown_length_or_apart_are_kept():
+    optimized, statistics = optimize(PROGRAMS["delays kept apart"])
+    assert optimized == PROGRAMS["delays kept apart"]
+    assert statistics["delays merged"] == 0
+
+def test_loop_body_is_optimized_as_a_frame_of_its_own():
+    optimized, statistics = optimize(PROGRAMS["frames in a loop body"])
+    assert optimized[0][4] == ("BLOCK", [pixel(0, 0, "#00ff00"), delay(3)])
+    assert statistics == {"writes dropped": 1, "delays merged": 1}
+    # One delay and one pixel for each of the three iterations, where there were two of each
+    opcodes = run(optimized).statistics["opcodes"]
+    assert opcodes["delay"] == 3 and opcodes["pixel"] == 3
@@ -0,0 +1,104 @@
+# Every call runs in a frame of its own, so a callee never overwrites its caller's locals, while the
+# program's variables stay reachable from any function, however deeply calls are nested
+import pytest
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def call(name, *arguments):
+    return ("FUNCTION_CALL", name, list(arguments))
+
+def plus(left, right):
+    return ("PLUS", left, right)
+
+def function(name, parameters, body, return_type="TYPE_INT"):
+    return ("FUNCTION_DEF", name, [(parameter, "TYPE_INT") for parameter in parameters], return_type, ("BLOCK", body))
+
+def counter_loop(name, limit, body):
+    return ("FOR", ("DECLARATION", "TYPE_INT", name, integer(0)),
+            ("RELATIONAL_OPERATOR", identifier(name), integer(limit), "<"),
+            ("ASSIGNMENT", name, plus(identifier(name), integer(1))),
+            ("BLOCK", body))
+
+# fun read(x: int) -> int { return x + g; }, which reads the program's g
+READ = function("read", ["x"], [("RETURN", plus(identifier("x"), identifier("g")))])
+
+# fun outer(y: int) -> int { let z: int = y * 2; return read(z) + z; }, which only reaches g through read
+OUTER = function("outer", ["y"], [
+    ("DECLARATION", "TYPE_INT", "z", ("MUL", identifier("y"), integer(2))),
+    ("RETURN", plus(call("read", identifier("z")), identifier("z"))),
+])
+
+# fun bump() -> int { g = g + 1; }, which changes g and runs off its end
+BUMP = function("bump", [], [("ASSIGNMENT", "g", plus(identifier("g"), integer(1)))])
+
+# fun fib(n: int) -> int { if (n < 2) { return n; } let a: int = fib(n + -1); return a + fib(n + -2); }
+FIB = function("fib", ["n"], [
+    ("IF", ("RELATIONAL_OPERATOR", identifier("n"), integer(2), "<"), ("BLOCK", [("RETURN", identifier("n"))])),
+    ("DECLARATION", "TYPE_INT", "a", call("fib", plus(identifier("n"), integer(-1)))),
+    ("RETURN", plus(identifier("a"), call("fib", plus(identifier("n"), integer(-2))))),
+])
+
+PROGRAMS = {
+    "function calling a function that reads a program variable": [
+        ("DECLARATION", "TYPE_INT", "g", integer(5)),
+        READ, OUTER,
+        ("PRINT", call("outer", integer(3))),
+        ("ASSIGNMENT", "g", integer(100)),
+        ("PRINT", call("outer", integer(3))),
+    ],
+    "function changing a program variable": [
+        ("DECLARATION", "TYPE_INT", "g", integer(1)),
+        READ, BUMP,
+        call("bump"),
+        ("PRINT", call("bump")),
+        ("PRINT", call("read", identifier("g"))),
+    ],
+    "recursion keeping a local across a call": [FIB, ("PRINT", call("fib", integer(10)))],
+    "calls inside loops in functions": [
+        ("DECLARATION", "TYPE_INT", "g", integer(0)),
+        READ,
+        function("total", ["n"], [
+            ("DECLARATION", "TYPE_INT", "sum", integer(0)),
+            counter_loop("i", 4, [("ASSIGNMENT", "sum", plus(identifier("sum"), call("read", identifier("i"))))]),
+            ("RETURN", identifier("sum")),
+        ]),
+        counter_loop("i", 3, [("ASSIGNMENT", "g", identifier("i")), ("PRINT", call("total", identifier("i")))]),
+    ],
+}
+
+EXPECTED = {
+    "function calling a function that reads a program variable": [("print", 17), ("print", 112)],
+    "function changing a program variable": [("print", 0), ("print", 6)],
+    "recursion keeping a local across a call": [("print", 55)],
+    "calls inside loops in functions": [("print", 6), ("print", 10), ("print", 14)],
+}
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_program_prints_what_its_calls_compute(name):
+    program = PROGRAMS[name]
+    assert run(program).events == EXPECTED[name]
+    assert run(program, optimize=True).events == EXPECTED[name]
+    assert run(program, passes=("fold", "propagate"), optimize=True).events == EXPECTED[name]
+
+def test_program_variables_are_reached_a_frame_level_up():
+    generator, _ = compile_program(PROGRAMS["function calling a function that reads a program variable"])
+    code = "\n".join(generator.code)
+    read, outer = code[code.index("\n.read\n"):code.index("\n.outer\n")], code[code.index("\n.outer\n"):]
+    # read loads g from the program's frame; outer keeps z in a frame of its own and never touches g
+    assert "push 0\npush 1\nld" in read
+    assert "push 1\nld" not in outer and "alloc" in outer
+
+def test_each_call_gets_a_frame_of_its_own():
+    machine = run(PROGRAMS["recursion keeping a local across a call"])
+    # One frame for each call of fib, none bigger than fib's parameter and local
+    assert machine.statistics["allocs"] == machine.statistics["opcodes"]["call"] == 177
+    assert machine.statistics["largest frame"] == 2
@@ -0,0 +1,96 @@
+# After any sequence of edits, incremental analysis must report exactly what a fresh analysis of the same
+# program reports, and record the same types
+import copy
+import random
+from incremental_analyser import IncrementalSemanticAnalyzer
+from visitor import iter_nodes
+
+###########################################################################################################################################
+
+NAMES = ["a", "b", "c", "t1", "t2"]
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+# A small expression over the global names, which may not be declared, or may be functions
+def expression(rng, depth=2):
+    choice = rng.random()
+    if depth == 0 or choice < 0.3:
+        return integer(rng.randint(0, 9)) if rng.random() < 0.4 else identifier(rng.choice(NAMES))
+    if choice < 0.5:
+        return ("FUNCTION_CALL", rng.choice(NAMES), [expression(rng, depth - 1) for _ in range(rng.randint(0, 2))])
+    return ("PLUS", expression(rng, depth - 1), expression(rng, depth - 1))
+
+def statement(rng):
+    choice = rng.random()
+    if choice < 0.35:
+        data_type = rng.choice(["int", "int", "float"])
+        return ("DECLARATION", data_type, rng.choice(NAMES), expression(rng))
+    if choice < 0.55:
+        return ("FUNCTION_DEF", rng.choice(NAMES), [("p", "int")], "int", ("BLOCK", [("RETURN", expression(rng))]))
+    if choice < 0.75:
+        return ("IF", ("EQUALITY_OPERATOR", expression(rng), integer(0), "=="), ("BLOCK", [("PRINT", expression(rng))]))
+    return ("PRINT", expression(rng))
+
+# Applies one random edit: a changed, inserted, deleted, swapped or moved statement
+def edit(rng, program):
+    program = list(program)
+    choice = rng.random()
+    if choice < 0.25 and program:
+        program[rng.randrange(len(program))] = statement(rng)
+    elif choice < 0.45 or not program:
+        program.insert(rng.randint(0, len(program)), statement(rng))
+    elif choice < 0.6:
+        del program[rng.randrange(len(program))]
+    elif choice < 0.8 and len(program) > 1:
+        index = rng.randrange(len(program) - 1)
+        program[index], program[index + 1] = program[index + 1], program[index]
+    else:
+        moved = program.pop(rng.randrange(len(program)))
+        program.insert(rng.randint(0, len(program)), moved)
+    return program
+
+def types(analyzer):
+    return [analyzer.expression_types.lookup(node) for statement in analyzer.ast for node in iter_nodes(statement)]
+
+def assert_matches_fresh(analyzer, diagnostics, program):
+    fresh = IncrementalSemanticAnalyzer()
+    assert diagnostics == fresh.analyze(program)
+    assert analyzer.ast == program
+    assert types(analyzer) == types(fresh)
+
+###########################################################################################################################################
+
+def test_moving_a_function_past_its_caller_reports_the_missing_declaration():
+    call = ("IF", ("EQUALITY_OPERATOR", ("FUNCTION_CALL", "t2", [integer(1)]), integer(0), "=="), ("BLOCK", []))
+    function = ("FUNCTION_DEF", "t2", [("p", "int")], "int", ("BLOCK", [("RETURN", identifier("p"))]))
+    analyzer = IncrementalSemanticAnalyzer()
+    assert analyzer.analyze([function, call]) == []
+
+    diagnostics = analyzer.analyze([call, function])
+    assert diagnostics == ["Error: Function 't2' not declared."]
+    assert_matches_fresh(analyzer, diagnostics, [call, function])
+
+def test_random_edits_match_a_fresh_analysis():
+    rng = random.Random(2024)
+    for _ in range(100):
+        program = [statement(rng) for _ in range(rng.randint(0, 8))]
+        analyzer = IncrementalSemanticAnalyzer()
+        analyzer.analyze(program)
+        for _ in range(10):
+            program = edit(rng, program)
+            if rng.random() < 0.3:
+                # Rebuild every node, as parsing the source again would
+                program = copy.deepcopy(program)
+            assert_matches_fresh(analyzer, analyzer.analyze(program), program)
+
+def test_unchanged_program_is_not_rechecked():
+    rng = random.Random(7)
+    program = [statement(rng) for _ in range(20)]
+    analyzer = IncrementalSemanticAnalyzer()
+    analyzer.analyze(program)
+    analyzer.analyze(list(program))
+    assert analyzer.rechecked == []
@@ -0,0 +1,119 @@
+# Inlined programs must print and draw exactly what the same programs do with their calls, including calls
+# that only run sometimes (on the right of 'and' and 'or') or many times (in loop conditions)
+import pytest
+from inlining import FunctionInliner
+from semantic_analyser import SemanticAnalyzer
+from visitor import iter_nodes
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def call(name, *arguments):
+    return ("FUNCTION_CALL", name, list(arguments))
+
+def less(left, right):
+    return ("RELATIONAL_OPERATOR", left, right, "<")
+
+# fun noisy(x: int) -> int { __print x; return x + 1; }, small enough to inline, with an effect of its own
+NOISY = ("FUNCTION_DEF", "noisy", [("x", "TYPE_INT")], "TYPE_INT", ("BLOCK", [
+    ("PRINT", identifier("x")),
+    ("RETURN", ("PLUS", identifier("x"), integer(1))),
+]))
+
+# fun twice(x: int) -> int { return x + x; }
+TWICE = ("FUNCTION_DEF", "twice", [("x", "TYPE_INT")], "TYPE_INT", ("BLOCK", [
+    ("RETURN", ("PLUS", identifier("x"), identifier("x"))),
+]))
+
+PROGRAMS = {
+    "calls in expressions": [
+        TWICE, NOISY,
+        ("PRINT", ("PLUS", call("twice", integer(3)), call("noisy", call("twice", integer(1))))),
+        ("DECLARATION", "TYPE_INT", "y", call("noisy", integer(7))),
+        ("PRINT", identifier("y")),
+    ],
+    "call on the right of and": [
+        NOISY,
+        ("DECLARATION", "TYPE_INT", "r", ("RANDI_STATEMENT", integer(2))),
+        ("IF", ("LOGICAL_OPERATOR", less(identifier("r"), integer(0)), less(integer(0), call("noisy", integer(5))), "and"),
+         ("BLOCK", [("PRINT", integer(100))])),
+        ("IF", ("LOGICAL_AND", less(call("noisy", integer(1)), integer(0)), less(call("noisy", integer(2)), integer(0))),
+         ("BLOCK", [("PRINT", integer(200))])),
+    ],
+    "call on the right of or": [
+        NOISY,
+        ("IF", ("LOGICAL_OPERATOR", less(integer(0), call("noisy", integer(3))), less(integer(0), call("noisy", integer(4))), "or"),
+         ("BLOCK", [("PRINT", integer(300))])),
+    ],
+    "call in a while condition": [
+        NOISY,
+        ("DECLARATION", "TYPE_INT", "i", integer(0)),
+        ("WHILE", less(call("noisy", identifier("i")), integer(4)), ("BLOCK", [
+            ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+        ])),
+        ("PRINT", identifier("i")),
+    ],
+    "calls in a for loop": [
+        NOISY, TWICE,
+        ("FOR", ("DECLARATION", "TYPE_INT", "i", call("noisy", integer(0))),
+         less(call("twice", identifier("i")), call("noisy", integer(6))),
+         ("ASSIGNMENT", "i", call("noisy", identifier("i"))),
+         ("BLOCK", [("PRINT", call("twice", identifier("i")))])),
+    ],
+}
+
+# Inlines with room for every call the rules allow, however much the small test programs grow
+def inline(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    inliner = FunctionInliner(program, analyzer.expression_types, growth_limit=10)
+    return inliner.inline(), inliner
+
+def calls(node, name):
+    return sum(1 for child in iter_nodes(node) if child[0] == "FUNCTION_CALL" and child[1] == name)
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_inlined_program_runs_as_with_calls(name):
+    program = PROGRAMS[name]
+    expected = run(program).events
+    assert run(program, passes=("inline",)).events == expected
+    assert run(inline(program)[0]).events == expected
+    assert run(program, passes=("inline", "fold", "propagate"), optimize=True).events == expected
+
+def test_calls_in_expressions_are_replaced():
+    inlined, inliner = inline(PROGRAMS["calls in expressions"])
+    assert inliner.inlined == 4
+    # Neither function is called any more, so neither is defined
+    assert not any(node[0] in ("FUNCTION_DEF", "FUNCTION_CALL") for node in iter_nodes(inlined))
+
+def test_call_that_may_not_run_is_kept():
+    inlined, inliner = inline(PROGRAMS["call on the right of and"])
+    first, second = [node for node in inlined if node[0] == "IF"]
+    # The right operands keep their calls; the left one of the second 'and' always runs, so it is inlined
+    assert calls(first[1][2], "noisy") == 1
+    assert calls(second[1][1], "noisy") == 0
+    assert calls(second[1][2], "noisy") == 1
+    assert inliner.inlined == 1
+    assert inlined[0] == NOISY
+
+def test_calls_in_loop_conditions_are_kept():
+    inlined, _ = inline(PROGRAMS["call in a while condition"])
+    loop = next(node for node in inlined if node[0] == "WHILE")
+    assert calls(loop[1], "noisy") == 1
+
+    inlined, _ = inline(PROGRAMS["calls in a for loop"])
+    loop = next(node for node in inlined if node[0] == "FOR")
+    _, declaration, condition, update, body = loop
+    # The initialisation runs once and is inlined ahead of the loop; the condition and update run every time
+    assert calls(declaration, "noisy") == 0
+    assert calls(condition, "twice") == 1 and calls(condition, "noisy") == 1
+    assert calls(update, "noisy") == 1
+    assert calls(body, "twice") == 0
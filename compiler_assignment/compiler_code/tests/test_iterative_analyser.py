@@ -0,0 +1,63 @@
+# The explicit-stack analyser must check programs far deeper than Python's recursion limit, and report
+# exactly what the recursive analyser reports on programs both can check
+import contextlib
+import io
+import pytest
+from semantic_analyser import SemanticAnalyzer, SemanticError
+from iterative_analyser import IterativeSemanticAnalyzer
+from types_ import INT
+
+###########################################################################################################################################
+
+DEPTH = 5000
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+# fun f(p: int) -> int { return p; }
+IDENTITY = ("FUNCTION_DEF", "f", [("p", "TYPE_INT")], "TYPE_INT", ("BLOCK", [("RETURN", ("IDENTIFIER", "p"))]))
+
+def analyze(analyzer_class, program):
+    analyzer = analyzer_class(program)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            analyzer.analyze()
+            error = None
+        except SemanticError as e:
+            error = str(e)
+    return analyzer, output.getvalue(), error
+
+###########################################################################################################################################
+
+def test_deep_expression():
+    expression = integer(0)
+    for index in range(DEPTH):
+        expression = ("PLUS", expression, integer(index))
+    analyzer, _, error = analyze(IterativeSemanticAnalyzer, [("DECLARATION", "TYPE_INT", "x", expression)])
+    assert error is None
+    assert analyzer.type_of(expression) is INT
+
+def test_deep_function_call():
+    # f(f(...f(1)...)), as an argument and as a statement of its own
+    expression = integer(1)
+    for _ in range(DEPTH):
+        expression = ("FUNCTION_CALL", "f", [expression])
+    analyzer, _, error = analyze(IterativeSemanticAnalyzer, [IDENTITY, ("PRINT", expression), expression])
+    assert error is None
+    assert analyzer.type_of(expression) is INT
+    assert analyzer.results == {}
+
+@pytest.mark.parametrize("call", [
+    ("FUNCTION_CALL", "g", [("IDENTIFIER", "missing")]),
+    ("FUNCTION_CALL", "f", [integer(1), ("IDENTIFIER", "missing")]),
+    ("FUNCTION_CALL", "f", [("BOOLEAN_LITERAL", True)]),
+    ("FUNCTION_CALL", "f", [("FUNCTION_CALL", "f", [("IDENTIFIER", "missing")])]),
+    ("FUNCTION_CALL", "f", [("FUNCTION_CALL", "f", [integer(2)])]),
+])
+def test_calls_report_what_the_recursive_analyser_reports(call):
+    program = [IDENTITY, ("PRINT", call)]
+    _, expected_output, expected_error = analyze(SemanticAnalyzer, program)
+    analyzer, output, error = analyze(IterativeSemanticAnalyzer, program)
+    assert (output, error) == (expected_output, expected_error)
+    assert analyzer.results == {}
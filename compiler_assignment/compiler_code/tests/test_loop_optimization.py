@@ -0,0 +1,99 @@
+# Loop-invariant code motion and strength reduction run on the program and on every function: the values they
+# move or replace are computed less often, and the program prints exactly what it does unoptimized
+import itertools
+import pytest
+from cfg import ControlFlowGraph, Jump, Branch, Return
+from ssa import SSAOptimizer
+from slot_allocation import SlotAllocator
+from pixir_machine import PixIRMachine
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def store(slot):
+    return [f"push {slot}", "push 0", "st"]
+
+def load(slot):
+    return [f"push {slot}", "push 0", "ld"]
+
+# i = 0; while (i < 10) { print __width * 2 + __height + i; i = i + 1; }. '__width' only appears in the AST as a statement,
+# so the loop is built as a graph, the way the code generator would lay it out.
+def width_loop():
+    cfg = ControlFlowGraph()
+    header, body, end = cfg.new_block("WHILE_START"), cfg.new_block("WHILE_BODY"), cfg.new_block("WHILE_END")
+    cfg.entry.instructions = ["push 0"] + store("$0")
+    cfg.entry.terminator = Jump(header)
+    header.instructions = load("$0") + ["push 10", "lt"]
+    header.terminator = Branch(end, body)
+    body.instructions = ["width", "push 2", "mul", "height", "add"] + load("$0") + ["add", "print"] + load("$0") + ["push 1", "add"] + store("$0")
+    body.terminator = Jump(header)
+    end.terminator = Return()
+    return cfg
+
+# Runs the graph, optimized by the SSA optimizer or only laid out, and returns the machine and the optimizer
+def run_graph(cfg, optimize):
+    optimizer = None
+    if optimize:
+        slots = itertools.count(100)
+        optimizer = SSAOptimizer(cfg, lambda: "$%d" % next(slots))
+        assert optimizer.optimize()
+        cfg.optimize()
+    else:
+        cfg.remove_unreachable()
+        cfg.layout()
+    machine = PixIRMachine(SlotAllocator(cfg.emit()).allocate())
+    machine.run()
+    return machine, optimizer
+
+###########################################################################################################################################
+
+def test_width_derived_value_is_hoisted():
+    unoptimized, _ = run_graph(width_loop(), optimize=False)
+    optimized, optimizer = run_graph(width_loop(), optimize=True)
+    assert optimized.events == unoptimized.events == [("print", 96 + i) for i in range(10)]
+    # __width * 2 + __height is computed once, before the loop, rather than on every iteration
+    assert optimizer.statistics["hoisted"] >= 2
+    assert unoptimized.statistics["opcodes"]["width"] == 10
+    assert optimized.statistics["opcodes"]["width"] == 1
+    assert optimized.statistics["opcodes"]["mul"] == 1
+    assert optimized.statistics["instructions"] < unoptimized.statistics["instructions"]
+
+###########################################################################################################################################
+
+def counting_loop(limit):
+    # for (let i: int = 0; i < limit; i = i + 1) { print i * 4; }
+    return ("FOR", ("DECLARATION", "TYPE_INT", "i", integer(0)),
+            ("RELATIONAL_OPERATOR", identifier("i"), integer(limit), "<"),
+            ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+            ("BLOCK", [("PRINT", ("MUL", identifier("i"), integer(4)))]))
+
+PROGRAMS = {
+    "in the program": [counting_loop(6)],
+    # fun quads() -> int { for (...) { print i * 4; } return 0; }
+    "in a function": [
+        ("FUNCTION_DEF", "quads", [], "int", ("BLOCK", [counting_loop(6), ("RETURN", integer(0))])),
+        ("PRINT", ("FUNCTION_CALL", "quads", [])),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_multiplication_by_induction_variable_is_reduced(name):
+    program = PROGRAMS[name]
+    unoptimized = run(program)
+    optimized = run(program, optimize=True)
+    assert optimized.events == unoptimized.events
+    assert [event for event in optimized.events if event[0] == "print"][:6] == [("print", 4 * i) for i in range(6)]
+
+    generator, _ = compile_program(program, optimize=True)
+    assert generator.ssa_optimizer.statistics["reduced"] >= 1
+    # i * 4 is stepped by 4 on every iteration instead of being multiplied out
+    assert "mul" not in generator.code
+    assert unoptimized.statistics["opcodes"]["mul"] == 6
+    assert "mul" not in optimized.statistics["opcodes"]
+    assert optimized.statistics["instructions"] < unoptimized.statistics["instructions"]
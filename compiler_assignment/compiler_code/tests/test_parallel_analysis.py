@@ -0,0 +1,120 @@
+# Checking function bodies in a process pool must print, record and raise exactly what a sequential
+# analysis does: output in source order, nothing after the first error, and scope snapshots for every block
+import contextlib
+import io
+import pytest
+import semantic_analyser
+from semantic_analyser import SemanticAnalyzer, SemanticError
+from visitor import iter_nodes
+from types_ import INT
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def declaration(name, expression):
+    return ("DECLARATION", "TYPE_INT", name, expression)
+
+# A function whose body declares its local twice, which prints an error without stopping the analysis
+def noisy_function(name):
+    return ("FUNCTION_DEF", name, [("p", "TYPE_INT")], "TYPE_INT", ("BLOCK", [
+        declaration("v", identifier("p")),
+        declaration("v", integer(1)),
+        ("IF", ("RELATIONAL_OPERATOR", identifier("v"), integer(0), "<"), ("BLOCK", [("PRINT", identifier("g"))])),
+        ("RETURN", ("PLUS", identifier("v"), identifier("g"))),
+    ]))
+
+# A function whose body uses a variable that is not declared
+def failing_function(name):
+    return ("FUNCTION_DEF", name, [], "TYPE_INT", ("BLOCK", [("RETURN", identifier("missing"))]))
+
+PROGRAMS = {
+    "bodies with output between statements with output": [
+        declaration("g", integer(1)),
+        noisy_function("f"),
+        declaration("g", integer(2)),
+        noisy_function("h"),
+        ("PRINT", ("FUNCTION_CALL", "h", [("FUNCTION_CALL", "f", [identifier("g")])])),
+    ],
+    "failing body before top-level statements": [
+        declaration("g", integer(1)),
+        noisy_function("f"),
+        failing_function("broken"),
+        declaration("g", integer(2)),
+        noisy_function("h"),
+        ("PRINT", ("FUNCTION_CALL", "f", [identifier("g")])),
+    ],
+    "failing top-level statement after bodies": [
+        declaration("g", integer(1)),
+        noisy_function("f"),
+        noisy_function("h"),
+        ("PRINT", identifier("missing")),
+        failing_function("broken"),
+    ],
+    "two failing bodies": [
+        declaration("g", integer(1)),
+        failing_function("first"),
+        noisy_function("f"),
+        failing_function("second"),
+    ],
+}
+
+def analyze(program, workers=None):
+    analyzer = SemanticAnalyzer(program)
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        try:
+            analyzer.analyze(workers)
+            error = None
+        except SemanticError as e:
+            error = str(e)
+    return analyzer, output.getvalue(), error
+
+def recorded(analyzer):
+    nodes = [node for statement in analyzer.ast for node in iter_nodes(statement)]
+    return [analyzer.type_of(node) for node in nodes], [id(node) in analyzer.scope_snapshots for node in nodes]
+
+@pytest.fixture
+def parallel(monkeypatch):
+    # Even the small test programs are checked in a process pool
+    monkeypatch.setattr(semantic_analyser, "worth_parallel_checking", lambda ast: True)
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_parallel_analysis_reports_what_sequential_analysis_reports(parallel, name):
+    sequential, expected_output, expected_error = analyze(PROGRAMS[name])
+    analyzer, output, error = analyze(PROGRAMS[name], workers=2)
+    assert output == expected_output
+    assert error == expected_error
+    assert recorded(analyzer) == recorded(sequential)
+
+def test_output_is_in_source_order(parallel):
+    _, output, _ = analyze(PROGRAMS["bodies with output between statements with output"], workers=2)
+    lines = output.splitlines()
+    assert len(lines) == 3
+    assert "'v'" in lines[0] and "'g'" in lines[1] and "'v'" in lines[2]
+
+def test_nothing_after_a_failing_body_is_checked(parallel):
+    analyzer, output, error = analyze(PROGRAMS["failing body before top-level statements"], workers=2)
+    assert "missing" in error
+    # Only f's body printed before the failure; the second g and h are not reported
+    assert output.count("Error:") == 1
+    assert analyzer.symbol_table.lookup("h") is None
+    later = PROGRAMS["failing body before top-level statements"][3]
+    assert analyzer.type_of(later[3]) is None
+
+def test_blocks_checked_by_workers_can_be_rechecked(parallel):
+    program = PROGRAMS["bodies with output between statements with output"]
+    analyzer, _, error = analyze(program, workers=2)
+    assert error is None
+    body = program[3][4]
+    inner_block = body[1][2][2]
+    assert id(body) in analyzer.scope_snapshots and id(inner_block) in analyzer.scope_snapshots
+    # The inner block sees the second declaration of g and h's locals, however many statements came after it
+    assert analyzer.recheck(inner_block) is None
+    assert analyzer.type_of(inner_block[1][0][1]) is INT
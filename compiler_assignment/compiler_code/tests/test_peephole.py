@@ -0,0 +1,104 @@
+# Peephole rewrites must leave programs printing and drawing exactly what they did, and must never match
+# across a label, where control can arrive from somewhere other than the instruction before it
+import pytest
+from peephole import PeepholeOptimizer
+from pixir_machine import PixIRMachine
+from pipeline import compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def optimize(code):
+    optimizer = PeepholeOptimizer(code)
+    return optimizer.optimize(), optimizer.applied
+
+def run_code(code):
+    machine = PixIRMachine(code)
+    machine.run()
+    return machine
+
+###########################################################################################################################################
+
+def test_store_then_load_keeps_a_copy():
+    code, applied = optimize(["push 5", "push 0", "push 0", "st", "push 0", "push 0", "ld", "print", "ret"])
+    assert code == ["push 5", "dup", "push 0", "push 0", "st", "print", "ret"]
+    assert applied == {"store_then_load": 1}
+
+def test_store_and_load_either_side_of_a_label_stay():
+    # The load at the head of the loop also runs after the store at the end of the loop body
+    code = ["push 1", "alloc",
+            "push 0", "push 0", "push 0", "st",
+            ".LOOP", "push 0", "push 0", "ld", "push 1", "add", "dup", "print", "push 0", "push 0", "st",
+            "push 0", "push 0", "ld", "push 3", "lt", "cjmp .END", "jmp .LOOP",
+            ".END", "ret"]
+    optimized, _ = optimize(code)
+    head = optimized.index(".LOOP")
+    assert optimized[head - 4:head + 4] == code[2:10]
+    assert run_code(optimized).events == run_code(code).events == [("print", 1), ("print", 2), ("print", 3)]
+
+def test_value_pushed_before_a_label_is_not_dropped_after_it():
+    code = ["push 1", "cjmp .SKIP", "push 7", "print", ".SKIP", "drop", "ret"]
+    assert optimize(["push 1", ".SKIP", "drop", "ret"])[0] == ["push 1", ".SKIP", "drop", "ret"]
+    assert optimize(code)[0] == code
+
+def test_jump_to_next_keeps_a_label_others_jump_to():
+    code = ["push 0", "cjmp .NEXT", "push 1", "print", "jmp .NEXT", ".NEXT", "push 2", "print", "ret"]
+    optimized, applied = optimize(code)
+    assert optimized == ["push 0", "cjmp .NEXT", "push 1", "print", ".NEXT", "push 2", "print", "ret"]
+    assert applied == {"jump_to_next": 1}
+    assert run_code(optimized).events == run_code(code).events
+
+def test_conditional_jump_to_next_still_pops_its_condition():
+    code = ["push 4", "push 1", "cjmp .NEXT", ".NEXT", "print", "ret"]
+    optimized, _ = optimize(code)
+    assert optimized == ["push 4", ".NEXT", "print", "ret"]
+    assert run_code(optimized).events == [("print", 4)]
+
+def test_code_after_an_exit_is_removed_up_to_the_next_label():
+    code = ["push 1", "cjmp .ELSE", "push 1", "print", "jmp .END", "push 2", "print", ".ELSE", "push 3", "print", ".END", "ret"]
+    optimized, applied = optimize(code)
+    assert optimized == ["push 1", "cjmp .ELSE", "push 1", "print", "jmp .END", ".ELSE", "push 3", "print", ".END", "ret"]
+    assert applied["unreachable_after_exit"] == 2
+
+###########################################################################################################################################
+
+def counter_loop(body):
+    return ("FOR", ("DECLARATION", "TYPE_INT", "i", integer(0)),
+            ("RELATIONAL_OPERATOR", identifier("i"), integer(4), "<"),
+            ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+            ("BLOCK", body))
+
+PROGRAMS = {
+    "stores read back at once": [
+        ("DECLARATION", "TYPE_INT", "x", ("RANDI_STATEMENT", integer(10))),
+        ("DECLARATION", "TYPE_INT", "y", ("PLUS", identifier("x"), identifier("x"))),
+        ("PRINT", identifier("y")),
+    ],
+    "loop counters": [
+        ("DECLARATION", "TYPE_INT", "total", integer(0)),
+        counter_loop([("ASSIGNMENT", "total", ("PLUS", identifier("total"), identifier("i"))), ("PRINT", identifier("total"))]),
+        ("PRINT", identifier("total")),
+    ],
+    "branches that end in jumps": [
+        ("DECLARATION", "TYPE_INT", "x", ("RANDI_STATEMENT", integer(4))),
+        ("IF", ("RELATIONAL_OPERATOR", identifier("x"), integer(2), "<"),
+         ("BLOCK", [("PRINT", integer(1))]), ("ELSE", ("BLOCK", [("PRINT", identifier("x"))]))),
+        ("WHILE", ("RELATIONAL_OPERATOR", identifier("x"), integer(6), "<"),
+         ("BLOCK", [("ASSIGNMENT", "x", ("PLUS", identifier("x"), integer(1))), ("PRINT", identifier("x"))])),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_program_runs_as_unoptimized(name):
+    generator, _ = compile_program(PROGRAMS[name])
+    optimized, applied = optimize(generator.code)
+    assert applied
+    unoptimized = run_code(generator.code)
+    optimized_run = run_code(optimized)
+    assert optimized_run.events == unoptimized.events
+    assert optimized_run.statistics["instructions"] < unoptimized.statistics["instructions"]
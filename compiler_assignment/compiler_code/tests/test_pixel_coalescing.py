@@ -0,0 +1,105 @@
+# Runs of constant pixel writes replaced by rectangles must leave every pixel in the colour it had, at every
+# point the display is shown
+import pytest
+from pixel_coalescing import PixelCoalescer
+from semantic_analyser import SemanticAnalyzer
+from pipeline import run, observed
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def colour(value):
+    return ("COLOR_LITERAL", value)
+
+def pixel(x, y, value):
+    return ("PIXEL_STATEMENT", [x if isinstance(x, tuple) else integer(x), y if isinstance(y, tuple) else integer(y), colour(value)])
+
+def counter_loop(name, start, limit, body):
+    return ("FOR", ("DECLARATION", "TYPE_INT", name, integer(start)),
+            ("RELATIONAL_OPERATOR", identifier(name), integer(limit), "<"),
+            ("ASSIGNMENT", name, ("PLUS", identifier(name), integer(1))),
+            ("BLOCK", body))
+
+PROGRAMS = {
+    "a row of pixels": [pixel(x, 3, "#ff0000") for x in range(5)],
+    "nested loops filling a rectangle": [
+        counter_loop("i", 2, 8, [counter_loop("j", 1, 4, [pixel(identifier("i"), identifier("j"), "#00ff00")])]),
+    ],
+    "later writes win": [
+        counter_loop("i", 0, 16, [pixel(identifier("i"), 0, "#0000FF")]),
+        pixel(2, 0, "#ffffff"),
+        pixel(0, 0, "#0000ff"),
+    ],
+    "runs broken by a delay and by a computed colour": [
+        pixel(0, 0, "#ff0000"), pixel(1, 0, "#ff0000"), pixel(2, 0, "#ff0000"),
+        ("DELAY", integer(10)),
+        pixel(0, 0, "#00ff00"), pixel(1, 0, "#00ff00"), pixel(2, 0, "#00ff00"),
+        ("DECLARATION", "TYPE_COLOUR", "c", colour("#123456")),
+        ("PIXEL_STATEMENT", [integer(0), integer(1), identifier("c")]),
+        pixel(1, 1, "#123456"), pixel(2, 1, "#123456"),
+    ],
+    "loop writes outside a run": [
+        ("DECLARATION", "TYPE_INT", "n", ("RANDI_STATEMENT", integer(3))),
+        counter_loop("i", 0, 4, [pixel(identifier("i"), identifier("n"), "#ff00ff"), ("DELAY", integer(1))]),
+    ],
+}
+
+def coalesce(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    coalescer = PixelCoalescer(program, analyzer.expression_types)
+    return coalescer.coalesce(), coalescer.statistics
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_coalesced_program_shows_the_same_display(name):
+    program = PROGRAMS[name]
+    expected = observed(run(program).events)
+    assert observed(run(program, passes=("coalesce",)).events) == expected
+    assert observed(run(program, passes=("fold", "propagate", "coalesce"), optimize=True).events) == expected
+
+def test_row_becomes_one_rectangle():
+    coalesced, statistics = coalesce(PROGRAMS["a row of pixels"])
+    assert coalesced == [("PIXELR_STATEMENT", [integer(0), integer(3), integer(5), integer(1), colour("#ff0000")])]
+    assert statistics == {"replaced": 5, "rectangles": 1}
+
+def test_nested_loops_become_one_rectangle():
+    coalesced, _ = coalesce(PROGRAMS["nested loops filling a rectangle"])
+    assert coalesced == [("PIXELR_STATEMENT", [integer(2), integer(1), integer(6), integer(3), colour("#00ff00")])]
+    assert run(coalesced).statistics["opcodes"]["pixelr"] == 1
+
+def test_last_colour_of_each_pixel_is_drawn():
+    coalesced, _ = coalesce(PROGRAMS["later writes win"])
+    # The blue row with one white pixel in it, in as few rectangles as there are runs of each colour
+    assert sorted(coalesced, key=lambda node: node[1][0][1]) == [
+        ("PIXELR_STATEMENT", [integer(0), integer(0), integer(2), integer(1), colour("#0000ff")]),
+        ("PIXEL_STATEMENT", [integer(2), integer(0), colour("#ffffff")]),
+        ("PIXELR_STATEMENT", [integer(3), integer(0), integer(13), integer(1), colour("#0000ff")]),
+    ]
+
+def test_runs_end_at_statements_that_are_not_constant_writes():
+    coalesced, statistics = coalesce(PROGRAMS["runs broken by a delay and by a computed colour"])
+    tags = [node[0] for node in coalesced]
+    # Each row of three before and after the delay is one rectangle, and so are the two pixels after the
+    # write of a variable's colour, which stays as it is
+    assert tags == ["PIXELR_STATEMENT", "DELAY", "PIXELR_STATEMENT", "DECLARATION", "PIXEL_STATEMENT", "PIXELR_STATEMENT"]
+    assert coalesced[4] == PROGRAMS["runs broken by a delay and by a computed colour"][8]
+    assert statistics["replaced"] == 8
+
+def test_loop_is_only_replaced_when_its_rectangles_stand_for_enough_writes():
+    # Six writes in three rectangles: fewer statements than the loop's writes, but not few enough
+    program = [counter_loop("i", 0, 6, [pixel(identifier("i"), 0, "#0000ff")]), pixel(2, 0, "#ffffff"), pixel(0, 0, "#0000ff")]
+    coalesced, _ = coalesce(program)
+    assert coalesced == program
+
+def test_loops_with_unknown_positions_are_kept():
+    program = PROGRAMS["loop writes outside a run"]
+    coalesced, statistics = coalesce(program)
+    assert coalesced == program
+    assert statistics["replaced"] == 0
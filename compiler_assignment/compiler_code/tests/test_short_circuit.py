@@ -0,0 +1,106 @@
+# 'and' and 'or' only evaluate their right operand when the left one leaves the outcome open, in conditions
+# and in values alike, with or without the generator's optimizations
+import itertools
+import pytest
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def compare(left, right, operator):
+    return ("RELATIONAL_OPERATOR", left, right, operator)
+
+def logical(left, right, operator):
+    return ("LOGICAL_OPERATOR", left, right, operator)
+
+# fun noisy(x: int) -> bool { __print x; return x > 0; }, which shows whether it ran
+NOISY = ("FUNCTION_DEF", "noisy", [("x", "TYPE_INT")], "TYPE_BOOL", ("BLOCK", [
+    ("PRINT", identifier("x")),
+    ("RETURN", compare(identifier("x"), integer(0), ">")),
+]))
+
+def noisy(value):
+    return ("FUNCTION_CALL", "noisy", [value])
+
+def events(program):
+    # The program's output, which must be the same whether the generator optimizes or not
+    unoptimized = run(program).events
+    assert run(program, optimize=True).events == unoptimized
+    return unoptimized
+
+def printed(*values):
+    return [("print", value) for value in values]
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("operator", ["and", "or"])
+@pytest.mark.parametrize("a, b", list(itertools.product([0, 1], repeat=2)))
+def test_condition_truth_table(operator, a, b):
+    program = [
+        ("DECLARATION", "TYPE_INT", "a", integer(a)),
+        ("DECLARATION", "TYPE_INT", "b", integer(b)),
+        ("IF", logical(compare(identifier("a"), integer(1), "=="), compare(identifier("b"), integer(1), "=="), operator),
+         ("BLOCK", [("PRINT", integer(1))]), ("ELSE", ("BLOCK", [("PRINT", integer(0))]))),
+    ]
+    expected = (a and b) if operator == "and" else (a or b)
+    assert events(program) == printed(int(bool(expected)))
+
+@pytest.mark.parametrize("x", [-2, 3, 7])
+def test_right_operand_runs_only_when_needed_in_a_condition(x):
+    # if (x > 5 and noisy(x)) print 100; if (x > 5 or noisy(x)) print 200
+    program = [
+        NOISY,
+        ("DECLARATION", "TYPE_INT", "x", integer(x)),
+        ("IF", logical(compare(identifier("x"), integer(5), ">"), noisy(identifier("x")), "and"), ("BLOCK", [("PRINT", integer(100))])),
+        ("IF", logical(compare(identifier("x"), integer(5), ">"), noisy(identifier("x")), "or"), ("BLOCK", [("PRINT", integer(200))])),
+    ]
+    expected = []
+    if x > 5:
+        expected += printed(x, 100, 200)
+    else:
+        expected += printed(x) + (printed(200) if x > 0 else [])
+    assert events(program) == expected
+
+@pytest.mark.parametrize("x", [-2, 3, 7])
+def test_right_operand_runs_only_when_needed_in_a_value(x):
+    # let p: bool = x > 5 and noisy(x); let q: bool = x > 5 or noisy(x); print p; print q
+    program = [
+        NOISY,
+        ("DECLARATION", "TYPE_INT", "x", integer(x)),
+        ("DECLARATION", "TYPE_BOOL", "p", logical(compare(identifier("x"), integer(5), ">"), noisy(identifier("x")), "and")),
+        ("DECLARATION", "TYPE_BOOL", "q", logical(compare(identifier("x"), integer(5), ">"), noisy(identifier("x")), "or")),
+        ("PRINT", identifier("p")),
+        ("PRINT", identifier("q")),
+    ]
+    # noisy runs for 'and' when x > 5 and for 'or' when it is not, so exactly once either way
+    assert events(program) == printed(x, int(x > 5 and x > 0), int(x > 5 or x > 0))
+
+def test_nested_operators_in_a_loop_condition():
+    # let i = 1; while ((i < 2 or i == 3) and noisy(i)) { i = i + 1 }; print i
+    program = [
+        NOISY,
+        ("DECLARATION", "TYPE_INT", "i", integer(1)),
+        ("WHILE", ("LOGICAL_AND",
+                   logical(compare(identifier("i"), integer(2), "<"), ("EQUALITY_OPERATOR", identifier("i"), integer(3), "=="), "or"),
+                   noisy(identifier("i"))),
+         ("BLOCK", [("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1)))])),
+        ("PRINT", identifier("i")),
+    ]
+    # i = 1 passes both tests; i = 2 fails the left operand, so noisy is not called again
+    assert events(program) == printed(1, 2)
+
+def test_pure_operands_are_combined_without_branches():
+    program = [
+        ("DECLARATION", "TYPE_INT", "x", ("RANDI_STATEMENT", integer(10))),
+        ("DECLARATION", "TYPE_BOOL", "p", logical(compare(identifier("x"), integer(5), ">"), compare(identifier("x"), integer(8), "<"), "and")),
+        ("PRINT", identifier("p")),
+    ]
+    generator, _ = compile_program(program)
+    assert "and" in generator.code
+    assert not any(line.startswith("cjmp") for line in generator.code)
+    events(program)
@@ -0,0 +1,105 @@
+# Variables may only share a frame slot if they are never live at the same time, which includes a value kept
+# around a loop's back edge to be read again on the next iteration
+import pytest
+from slot_allocation import SlotAllocator
+from pixir_machine import PixIRMachine
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def store(slot):
+    return [f"push ${slot}", "push 0", "st"]
+
+def load(slot):
+    return [f"push ${slot}", "push 0", "ld"]
+
+def allocate(code, reuse=True, shared=()):
+    allocator = SlotAllocator(code, reuse=reuse, shared=shared)
+    return allocator.allocate(), allocator
+
+def run_code(code):
+    machine = PixIRMachine(code)
+    machine.run()
+    return machine
+
+# k = 7; i = 0; while (i < 3) { print k; t = i * 10; print t; i = i + 1; }; u = 5; print u
+# k is last read before t is first stored, but is read again on the next iteration
+BACK_EDGE = (["push 7"] + store(0) + ["push 0"] + store(1)
+             + [".LOOP"] + load(1) + ["push 3", "lt", "cjmp .END"]
+             + load(0) + ["print"]
+             + load(1) + ["push 10", "mul"] + store(2) + load(2) + ["print"]
+             + load(1) + ["push 1", "add"] + store(1) + ["jmp .LOOP"]
+             + [".END", "push 5"] + store(3) + load(3) + ["print", "ret"])
+
+###########################################################################################################################################
+
+def test_value_read_on_the_next_iteration_keeps_its_slot():
+    code, allocator = allocate(BACK_EDGE)
+    slots = allocator.slots
+    assert slots[0] != slots[2]
+    assert len({slots[0], slots[1], slots[2]}) == 3
+    # Nothing from the loop is live once it is left, so u takes one of its slots
+    assert allocator.frame_size == 3
+    unshared, _ = allocate(BACK_EDGE, reuse=False)
+    assert run_code(code).events == run_code(unshared).events == [
+        ("print", 7), ("print", 0), ("print", 7), ("print", 10), ("print", 7), ("print", 20), ("print", 5)]
+
+def test_disjoint_lifetimes_share_a_slot():
+    code = ["push 1"] + store(0) + load(0) + ["print", "push 2"] + store(1) + load(1) + ["print", "ret"]
+    allocated, allocator = allocate(code)
+    assert allocator.slots[0] == allocator.slots[1]
+    assert allocator.frame_size == 1
+    assert run_code(allocated).events == [("print", 1), ("print", 2)]
+
+def test_slots_used_by_functions_are_never_shared():
+    code = ["push 1"] + store(0) + load(0) + ["print", "push 2"] + store(1) + load(1) + ["print", "ret"]
+    _, allocator = allocate(code, shared={0})
+    assert allocator.slots[0] != allocator.slots[1]
+
+def test_store_nothing_reads_does_not_overwrite_a_live_slot():
+    # x = 1; y = 2 (never read); print x
+    code = ["push 1"] + store(0) + ["push 2"] + store(1) + load(0) + ["print", "ret"]
+    allocated, allocator = allocate(code)
+    assert allocator.slots[0] != allocator.slots[1]
+    assert run_code(allocated).events == [("print", 1)]
+
+###########################################################################################################################################
+
+def counter_loop(name, limit, body):
+    return ("FOR", ("DECLARATION", "TYPE_INT", name, integer(0)),
+            ("RELATIONAL_OPERATOR", identifier(name), integer(limit), "<"),
+            ("ASSIGNMENT", name, ("PLUS", identifier(name), integer(1))),
+            ("BLOCK", body))
+
+PROGRAMS = {
+    "loops one after another": [
+        counter_loop("i", 3, [("DECLARATION", "TYPE_INT", "a", ("PLUS", identifier("i"), integer(1))), ("PRINT", identifier("a"))]),
+        counter_loop("j", 3, [("DECLARATION", "TYPE_INT", "b", ("PLUS", identifier("j"), integer(2))), ("PRINT", identifier("b"))]),
+        counter_loop("k", 3, [("DECLARATION", "TYPE_INT", "c", ("PLUS", identifier("k"), integer(3))), ("PRINT", identifier("c"))]),
+    ],
+    "value kept across nested loops": [
+        ("DECLARATION", "TYPE_INT", "seed", ("RANDI_STATEMENT", integer(100))),
+        counter_loop("i", 3, [
+            ("PRINT", identifier("seed")),
+            counter_loop("j", 2, [
+                ("DECLARATION", "TYPE_INT", "t", ("MUL", identifier("i"), identifier("j"))),
+                ("PRINT", identifier("t")),
+            ]),
+            ("DECLARATION", "TYPE_INT", "u", ("PLUS", identifier("i"), integer(7))),
+            ("PRINT", identifier("u")),
+        ]),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_shared_slots_run_as_separate_slots(name):
+    unoptimized = run(PROGRAMS[name])
+    optimized = run(PROGRAMS[name], optimize=True)
+    assert optimized.events == unoptimized.events
+    assert optimized.statistics["largest frame"] < unoptimized.statistics["largest frame"]
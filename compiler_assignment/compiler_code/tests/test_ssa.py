@@ -0,0 +1,129 @@
+# SSA construction puts phis where control flow joins, and the SSA optimizations run on the program and on
+# every function, leaving what the program prints and draws unchanged
+import pytest
+from cfg import ControlFlowGraph, Jump, Branch, Return
+from ssa import SSAOptimizer, Region, resolve
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def store(slot):
+    return [f"push {slot}", "push 0", "st"]
+
+def load(slot):
+    return [f"push {slot}", "push 0", "ld"]
+
+# Builds the SSA form of the graph's program code, without optimizing it
+def build(cfg):
+    optimizer = SSAOptimizer(cfg, lambda: "$99")
+    optimizer.region = Region(cfg, cfg.entry)
+    optimizer.build()
+    return optimizer
+
+def operands(phi):
+    return sorted(arg.operand for arg in phi.args)
+
+###########################################################################################################################################
+
+def test_phi_where_the_branches_of_an_if_join():
+    # x = 1 or x = 2, depending on a random number; then print x
+    cfg = ControlFlowGraph()
+    then_block, else_block, end = cfg.new_block("THEN"), cfg.new_block("ELSE"), cfg.new_block("ENDIF")
+    cfg.entry.instructions = ["push 4", "irnd"]
+    cfg.entry.terminator = Branch(else_block, then_block)
+    then_block.instructions = ["push 1"] + store("$0")
+    then_block.terminator = Jump(end)
+    else_block.instructions = ["push 2"] + store("$0")
+    else_block.terminator = Jump(end)
+    end.instructions = load("$0") + ["print"]
+    end.terminator = Return()
+
+    optimizer = build(cfg)
+    [phi] = optimizer.blocks[id(end)].phis
+    assert operands(phi) == ["1", "2"]
+    assert optimizer.blocks[id(end)].statements[0].args == [phi]
+
+def test_phi_at_the_head_of_a_while_loop():
+    # i = 0; while (i < 3) { i = i + 1; }; print i
+    cfg = ControlFlowGraph()
+    header, body, end = cfg.new_block("WHILE_START"), cfg.new_block("WHILE_BODY"), cfg.new_block("WHILE_END")
+    cfg.entry.instructions = ["push 0"] + store("$0")
+    cfg.entry.terminator = Jump(header)
+    header.instructions = load("$0") + ["push 3", "lt"]
+    header.terminator = Branch(end, body)
+    body.instructions = load("$0") + ["push 1", "add"] + store("$0")
+    body.terminator = Jump(header)
+    end.instructions = load("$0") + ["print"]
+    end.terminator = Return()
+
+    optimizer = build(cfg)
+    [phi] = optimizer.blocks[id(header)].phis
+    increment = optimizer.blocks[id(body)].statements[0]
+    assert phi.args[0].operand == "0" and phi.args[1] is increment
+    # The body's own phi, with the header as its only predecessor, stands for the header's
+    assert resolve(increment.args[0]) is phi
+    # The loop is left from its header, so the value printed is the phi's
+    assert [resolve(arg) for arg in optimizer.blocks[id(end)].statements[0].args] == [phi]
+
+###########################################################################################################################################
+
+# fun scale(n: int) -> int { let k: int = 2 + 3; return n * k + n * k; }
+SCALE = ("FUNCTION_DEF", "scale", [("n", "int")], "int", ("BLOCK", [
+    ("DECLARATION", "TYPE_INT", "k", ("PLUS", integer(2), integer(3))),
+    ("RETURN", ("PLUS", ("MUL", identifier("n"), identifier("k")), ("MUL", identifier("n"), identifier("k")))),
+]))
+
+# fun bump() -> int { total = total + 1; return total; }, which changes a variable of the program
+BUMP = ("FUNCTION_DEF", "bump", [], "int", ("BLOCK", [
+    ("ASSIGNMENT", "total", ("PLUS", identifier("total"), integer(1))),
+    ("RETURN", identifier("total")),
+]))
+
+PROGRAMS = {
+    "constant and repeated values in a function": [
+        SCALE,
+        ("PRINT", ("FUNCTION_CALL", "scale", [integer(4)])),
+        ("PRINT", ("FUNCTION_CALL", "scale", [("RANDI_STATEMENT", integer(1))])),
+    ],
+    "calls change the program's variables": [
+        ("DECLARATION", "TYPE_INT", "total", integer(10)),
+        BUMP,
+        ("DECLARATION", "TYPE_INT", "before", identifier("total")),
+        ("FUNCTION_CALL", "bump", []),
+        ("PRINT", ("PLUS", identifier("before"), identifier("total"))),
+        ("PRINT", ("PLUS", ("FUNCTION_CALL", "bump", []), identifier("total"))),
+    ],
+    "calls in a loop and in its condition": [
+        ("DECLARATION", "TYPE_INT", "total", integer(0)),
+        BUMP,
+        SCALE,
+        ("DECLARATION", "TYPE_INT", "i", integer(0)),
+        ("WHILE", ("RELATIONAL_OPERATOR", ("FUNCTION_CALL", "bump", []), integer(4), "<"), ("BLOCK", [
+            ("IF", ("RELATIONAL_OPERATOR", identifier("i"), integer(1), ">"), ("BLOCK", [
+                ("PRINT", ("FUNCTION_CALL", "scale", [identifier("i")])),
+            ])),
+            ("ASSIGNMENT", "i", ("PLUS", identifier("i"), integer(1))),
+        ])),
+        ("PRINT", identifier("total")),
+    ],
+}
+
+@pytest.mark.parametrize("name", PROGRAMS)
+def test_optimized_program_runs_as_unoptimized(name):
+    program = PROGRAMS[name]
+    assert run(program, optimize=True).events == run(program).events
+
+def test_functions_are_optimized():
+    generator, _ = compile_program(PROGRAMS["constant and repeated values in a function"], optimize=True)
+    statistics = generator.ssa_optimizer.statistics
+    # 2 + 3 is known inside the function, and n * k is only computed once
+    assert statistics["constants"] >= 1
+    assert statistics["numbered"] >= 1
+    function = generator.code[generator.code.index(".scale"):]
+    assert function.count("mul") == 1
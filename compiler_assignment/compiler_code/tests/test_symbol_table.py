@@ -0,0 +1,112 @@
+# Symbol table versions are immutable: a snapshot keeps seeing the bindings it was taken with whatever is
+# declared or updated afterwards, and a scoped node can be rechecked later in the environment it had
+import pickle
+import random
+import pytest
+from hamt import PersistentMap
+from semantic_analyser import SemanticAnalyzer, SemanticError, SymbolTable
+from types_ import INT, FLOAT
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+# Keys that all hash alike, so they end up in one collision node
+class Colliding:
+    def __init__(self, name):
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, Colliding) and other.name == self.name
+
+    def __hash__(self):
+        return 7
+
+###########################################################################################################################################
+
+def test_map_versions_match_dictionaries():
+    rng = random.Random(26)
+    versions = [(PersistentMap(), {})]
+    for _ in range(2000):
+        persistent, expected = versions[rng.randrange(len(versions))]
+        key, value = rng.randrange(300), rng.random()
+        versions.append((persistent.set(key, value), {**expected, key: value}))
+    # Every version, old or new, still holds exactly its own bindings
+    for persistent, expected in versions:
+        assert len(persistent) == len(expected)
+        assert dict(persistent.items()) == expected
+
+def test_colliding_keys_are_kept_apart():
+    first = PersistentMap().set(Colliding("a"), 1).set(Colliding("b"), 2)
+    second = first.set(Colliding("a"), 3)
+    assert (first[Colliding("a")], first[Colliding("b")]) == (1, 2)
+    assert (second[Colliding("a")], second[Colliding("b")]) == (3, 2)
+    assert len(second) == 2 and Colliding("c") not in second
+
+def test_map_survives_pickling():
+    persistent = PersistentMap()
+    for key in range(100):
+        persistent = persistent.set(f"v{key}", key)
+    assert dict(pickle.loads(pickle.dumps(persistent)).items()) == dict(persistent.items())
+
+def test_snapshots_keep_their_bindings():
+    table = SymbolTable()
+    table.add("x", "TYPE_INT")
+    outer = table.snapshot()
+    table.enter_scope()
+    table.add("y", "float")
+    inner = table.snapshot()
+    # Updating x from the inner scope makes a new version of the outer scope; the snapshots keep theirs
+    table.update("x", "TYPE_FLOAT")
+    table.add("z", "int")
+    assert (table.lookup("x"), inner.lookup("x"), outer.lookup("x")) == (FLOAT, INT, INT)
+    assert inner.lookup("z") is None and outer.lookup("y") is None
+    table.restore(inner)
+    assert table.lookup("y") is FLOAT and table.lookup("z") is None
+    table.exit_scope()
+    assert table.lookup("y") is None and table.lookup("x") is INT
+
+def test_scopes_shadow_and_reject_redeclarations():
+    table = SymbolTable()
+    table.add("x", "int")
+    with pytest.raises(SemanticError):
+        table.add("x", "float")
+    table.enter_scope()
+    table.add("x", "float")
+    assert table.lookup("x") is FLOAT
+    table.exit_scope()
+    assert table.lookup("x") is INT
+    with pytest.raises(SemanticError):
+        table.exit_scope()
+
+def test_blocks_are_rechecked_in_their_captured_environment():
+    # let x: int = 1; { __print x + 1; } let later: int = 2; fun f(p: int) -> int { return p + x; }
+    block = ("BLOCK", [("PRINT", ("PLUS", identifier("x"), integer(1)))])
+    function = ("FUNCTION_DEF", "f", [("p", "TYPE_INT")], "TYPE_INT", ("BLOCK", [("RETURN", ("PLUS", identifier("p"), identifier("x")))]))
+    program = [("DECLARATION", "TYPE_INT", "x", integer(1)), block, ("DECLARATION", "TYPE_INT", "later", integer(2)), function]
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    current = analyzer.symbol_table.snapshot()
+
+    # An edit to the block is checked without replaying the program; the function sees its parameter again
+    addition = ("PLUS", identifier("x"), integer(41))
+    block[1].append(("PRINT", addition))
+    analyzer.recheck(block)
+    assert analyzer.type_of(addition) is INT
+    analyzer.recheck(function)
+
+    # 'later' is declared after the block, so the block cannot see it, and the environment is put back
+    block[1].append(("PRINT", identifier("later")))
+    with pytest.raises(SemanticError, match="later"):
+        analyzer.recheck(block)
+    assert analyzer.symbol_table.snapshot() is current
+
+def test_unvisited_node_cannot_be_rechecked():
+    analyzer = SemanticAnalyzer([])
+    analyzer.analyze()
+    with pytest.raises(SemanticError):
+        analyzer.recheck(("BLOCK", []))
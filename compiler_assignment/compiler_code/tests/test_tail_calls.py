@@ -0,0 +1,49 @@
+# Self tail calls run as loops in one frame, which must be allocated once however often the loop goes round
+import pytest
+from semantic_analyser import SemanticAnalyzer
+from code_generation import PixIRCodeGenerator
+from pixir_machine import PixIRMachine
+
+###########################################################################################################################################
+
+# Counts down, declaring a local on each pass so that the function's frame has more than its parameters:
+#   fun count(n: int, total: int) -> int {
+#       let step: int = n * 2;
+#       if (n == 0) { return total; }
+#       return count(n + -1, total + step);
+#   }
+#   __print(count(iterations, 0));
+def countdown(iterations):
+    return [
+        ("FUNCTION_DEF", "count", [("n", "int"), ("total", "int")], "int", ("BLOCK", [
+            ("DECLARATION", "TYPE_INT", "step", ("MUL", ("IDENTIFIER", "n"), ("INTEGER_LITERAL", 2))),
+            ("IF", ("EQUALITY_OPERATOR", ("IDENTIFIER", "n"), ("INTEGER_LITERAL", 0), "=="),
+             ("BLOCK", [("RETURN", ("IDENTIFIER", "total"))])),
+            ("RETURN", ("FUNCTION_CALL", "count", [("PLUS", ("IDENTIFIER", "n"), ("INTEGER_LITERAL", -1)),
+                                                   ("PLUS", ("IDENTIFIER", "total"), ("IDENTIFIER", "step"))])),
+        ])),
+        ("PRINT", ("FUNCTION_CALL", "count", [("INTEGER_LITERAL", iterations), ("INTEGER_LITERAL", 0)])),
+    ]
+
+def compile_program(ast, optimize):
+    analyzer = SemanticAnalyzer(ast)
+    analyzer.analyze()
+    return PixIRCodeGenerator(ast, analyzer.expression_types, optimize=optimize).generate()
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("optimize", [False, True])
+@pytest.mark.parametrize("iterations", [1, 50])
+def test_tail_calls_allocate_the_frame_once(iterations, optimize):
+    machine = PixIRMachine(compile_program(countdown(iterations), optimize))
+    assert machine.run() == [("print", iterations * (iterations + 1))]
+    # One alloc for the call, none for the tail iterations, so the frame stays the size it started at
+    assert machine.statistics["allocs"] <= 2
+    assert machine.statistics["largest frame"] <= 4
+
+def test_frame_is_allocated_before_the_tail_call_target():
+    code = compile_program(countdown(3), optimize=False).split("\n")
+    entry = code.index(".count")
+    start = next(index for index, line in enumerate(code) if line.startswith(".count_START"))
+    assert "alloc" in code[entry:start]
+    assert "alloc" not in code[start:]
@@ -0,0 +1,80 @@
+# Semantic analysis records the type of every expression against the node object itself, so equal-looking
+# nodes keep types of their own and later passes look types up instead of working them out again
+from semantic_analyser import SemanticAnalyzer, TypeAnnotations
+from code_generation import PixIRCodeGenerator
+from visitor import iter_nodes
+from types_ import INT, FLOAT, BOOL, COLOUR
+from pipeline import run
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def analyze(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    return analyzer
+
+###########################################################################################################################################
+
+def test_annotations_are_keyed_by_node_identity():
+    annotations = TypeAnnotations()
+    first, second = identifier("x"), identifier("x")
+    annotations.record(first, INT)
+    assert first == second and first is not second
+    assert annotations.lookup(first) is INT and annotations.lookup(second) is None
+    assert first in annotations and second not in annotations
+    annotations.forget(first)
+    assert annotations.lookup(first) is None and len(annotations) == 0
+
+def test_annotations_keep_their_nodes_alive():
+    # A node built and dropped again must not lend its id to a later node
+    annotations = TypeAnnotations()
+    annotations.record(("PLUS", integer(1), integer(2)), INT)
+    later = [("PLUS", integer(1), integer(2)) for _ in range(100)]
+    assert all(annotations.lookup(node) is None for node in later)
+
+def test_equal_looking_nodes_get_their_own_types():
+    # let x: int = 1; { let x: float = 2.5; __print x; } __print x;
+    inner, outer = identifier("x"), identifier("x")
+    program = [
+        ("DECLARATION", "TYPE_INT", "x", integer(1)),
+        ("BLOCK", [("DECLARATION", "TYPE_FLOAT", "x", ("FLOAT_LITERAL", 2.5)), ("PRINT", inner)]),
+        ("PRINT", outer),
+    ]
+    analyzer = analyze(program)
+    assert analyzer.type_of(inner) is FLOAT and analyzer.type_of(outer) is INT
+
+def test_every_expression_is_typed():
+    # fun f(p: float) -> float { return p * 2; } let b: bool = f(1) < 3 and true; __pixel 1, 2, #ff0000;
+    call = ("FUNCTION_CALL", "f", [integer(1)])
+    comparison = ("RELATIONAL_OPERATOR", call, integer(3), "<")
+    colour = ("COLOR_LITERAL", "#ff0000")
+    program = [
+        ("FUNCTION_DEF", "f", [("p", "TYPE_FLOAT")], "TYPE_FLOAT", ("BLOCK", [("RETURN", ("MUL", identifier("p"), integer(2)))])),
+        ("DECLARATION", "TYPE_BOOL", "b", ("LOGICAL_OPERATOR", comparison, ("BOOLEAN_LITERAL", True), "and")),
+        ("PIXEL_STATEMENT", [integer(1), integer(2), colour]),
+    ]
+    analyzer = analyze(program)
+    assert analyzer.type_of(call) is FLOAT and analyzer.type_of(comparison) is BOOL
+    assert analyzer.type_of(program[0][4][1][0][1]) is FLOAT
+    assert analyzer.type_of(colour) is COLOUR
+    untyped = [node for node in iter_nodes(program) if node[0].endswith(("LITERAL", "OPERATOR", "IDENTIFIER", "CALL", "MUL"))
+               and analyzer.type_of(node) is None]
+    assert untyped == []
+
+def test_code_generator_uses_the_recorded_types():
+    # let f: float = 3; __print f < 4; the 3 is generated as a float because of its recorded use, not its shape
+    program = [
+        ("DECLARATION", "TYPE_FLOAT", "f", integer(3)),
+        ("PRINT", ("RELATIONAL_OPERATOR", identifier("f"), integer(4), "<")),
+    ]
+    analyzer = analyze(program)
+    generator = PixIRCodeGenerator(program, analyzer.expression_types, optimize=False)
+    generator.generate()
+    assert "push 3.0" in generator.code and "lt" in generator.code
+    assert run(program).events == [("print", 1)]
@@ -0,0 +1,104 @@
+# Expressions are generated as values of the type they are used as: int literals used as floats are pushed as
+# floats, comparisons of a bool with true or false test the bool itself, and equal colours are one constant.
+# Each program must run as the same program written with those conversions spelt out.
+import pytest
+from pipeline import run, compile_program
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def real(value):
+    return ("FLOAT_LITERAL", value)
+
+def identifier(name):
+    return ("IDENTIFIER", name)
+
+def boolean(value):
+    return ("BOOLEAN_LITERAL", value)
+
+def equals(left, right, operator="=="):
+    return ("EQUALITY_OPERATOR", left, right, operator)
+
+# fun half(x: float) -> float { return x * 0.5; } and fun one() -> float { return 1; }
+HALF = ("FUNCTION_DEF", "half", [("x", "TYPE_FLOAT")], "TYPE_FLOAT", ("BLOCK", [("RETURN", ("MUL", identifier("x"), real(0.5)))]))
+ONE = ("FUNCTION_DEF", "one", [], "TYPE_FLOAT", ("BLOCK", [("RETURN", integer(1))]))
+ONE_SPELT_OUT = ("FUNCTION_DEF", "one", [], "TYPE_FLOAT", ("BLOCK", [("RETURN", real(1.0))]))
+
+# Each program, and the same program with its conversions written out in the source
+PAIRS = {
+    "int literals used as floats": (
+        [
+            HALF, ONE,
+            ("DECLARATION", "TYPE_FLOAT", "f", integer(3)),
+            ("ASSIGNMENT", "f", ("PLUS", identifier("f"), integer(2))),
+            ("PRINT", identifier("f")),
+            ("PRINT", ("FUNCTION_CALL", "half", [integer(5)])),
+            ("PRINT", ("FUNCTION_CALL", "one", [])),
+            ("PRINT", ("RELATIONAL_OPERATOR", identifier("f"), integer(5), "<=")),
+        ],
+        [
+            HALF, ONE_SPELT_OUT,
+            ("DECLARATION", "TYPE_FLOAT", "f", real(3.0)),
+            ("ASSIGNMENT", "f", ("PLUS", identifier("f"), real(2.0))),
+            ("PRINT", identifier("f")),
+            ("PRINT", ("FUNCTION_CALL", "half", [real(5.0)])),
+            ("PRINT", ("FUNCTION_CALL", "one", [])),
+            ("PRINT", ("RELATIONAL_OPERATOR", identifier("f"), real(5.0), "<=")),
+        ],
+    ),
+    "bools compared with literals": (
+        [
+            ("DECLARATION", "TYPE_BOOL", "b", ("RELATIONAL_OPERATOR", ("RANDI_STATEMENT", integer(2)), integer(1), "<")),
+            ("PRINT", equals(identifier("b"), boolean(True))),
+            ("PRINT", equals(boolean(False), identifier("b"))),
+            ("PRINT", equals(identifier("b"), boolean(True), "!=")),
+            ("IF", equals(identifier("b"), boolean(False)), ("BLOCK", [("PRINT", integer(1))]), ("ELSE", ("BLOCK", [("PRINT", integer(2))]))),
+        ],
+        [
+            ("DECLARATION", "TYPE_BOOL", "b", ("RELATIONAL_OPERATOR", ("RANDI_STATEMENT", integer(2)), integer(1), "<")),
+            ("PRINT", identifier("b")),
+            ("PRINT", equals(identifier("b"), boolean(False))),
+            ("PRINT", equals(identifier("b"), boolean(False))),
+            ("IF", identifier("b"), ("BLOCK", [("PRINT", integer(2))]), ("ELSE", ("BLOCK", [("PRINT", integer(1))]))),
+        ],
+    ),
+    "colours in either case": (
+        [("PIXEL_STATEMENT", [integer(1), integer(2), ("COLOR_LITERAL", "#FF00AA")]),
+         ("PIXEL_STATEMENT", [integer(3), integer(4), ("COLOR_LITERAL", "#ff00aa")])],
+        [("PIXEL_STATEMENT", [integer(1), integer(2), ("COLOR_LITERAL", "#ff00aa")]),
+         ("PIXEL_STATEMENT", [integer(3), integer(4), ("COLOR_LITERAL", "#ff00aa")])],
+    ),
+}
+
+def events(program):
+    unoptimized = run(program).events
+    assert run(program, optimize=True).events == unoptimized
+    return unoptimized
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("name", PAIRS)
+def test_runs_as_with_conversions_spelt_out(name):
+    program, spelt_out = PAIRS[name]
+    assert events(program) == events(spelt_out)
+
+def test_int_literals_used_as_floats_are_pushed_as_floats():
+    program, spelt_out = PAIRS["int literals used as floats"]
+    assert compile_program(program)[0].code == compile_program(spelt_out)[0].code
+    printed = [value for _, value in events(program)]
+    assert printed[:3] == [5.0, 2.5, 1.0] and all(isinstance(value, float) for value in printed[:3])
+
+def test_bool_comparisons_test_the_bool():
+    program, _ = PAIRS["bools compared with literals"]
+    code = compile_program(program)[0].code
+    # Only 'b != true' and 'false == b' are negations; the if branches on b with its outcomes swapped
+    assert code.count("not") == 2
+    assert "eq" not in code and "neq" not in code
+
+def test_equal_colours_are_one_constant():
+    program, _ = PAIRS["colours in either case"]
+    code = compile_program(program)[0].code
+    assert code.count("push #ff00aa") == 2
+    assert [event[3] for event in events(program)] == ["#ff00aa", "#ff00aa"]
@@ -0,0 +1,82 @@
+# Every spelling of a PArL type is the same object, in this process and in any other, and operands are
+# checked against the promotion lattice where int is the only type that promotes, to float
+import itertools
+import pickle
+import pytest
+from types_ import INT, FLOAT, BOOL, COLOUR, STRING, ALL_TYPES, type_named, join, is_assignable
+from semantic_analyser import SemanticAnalyzer, SemanticError
+
+###########################################################################################################################################
+
+def integer(value):
+    return ("INTEGER_LITERAL", value)
+
+def real(value):
+    return ("FLOAT_LITERAL", value)
+
+def colour(value):
+    return ("COLOR_LITERAL", value)
+
+def analyze(program):
+    analyzer = SemanticAnalyzer(program)
+    analyzer.analyze()
+    return analyzer
+
+###########################################################################################################################################
+
+@pytest.mark.parametrize("names, data_type", [
+    (["int", "TYPE_INT"], INT),
+    (["float", "TYPE_FLOAT"], FLOAT),
+    (["bool", "TYPE_BOOL"], BOOL),
+    (["colour", "color", "TYPE_COLOUR"], COLOUR),
+    (["string", "str"], STRING),
+])
+def test_every_spelling_is_one_object(names, data_type):
+    assert all(type_named(name) is data_type for name in names)
+    assert pickle.loads(pickle.dumps(data_type)) is data_type
+    assert ALL_TYPES[data_type.type_id] is data_type
+
+def test_unknown_names_are_not_types():
+    assert type_named("TYPE_VOID") is None
+
+def test_join_is_a_lattice():
+    for left, right in itertools.product(ALL_TYPES, repeat=2):
+        expected = left if left is right else FLOAT if {left, right} == {INT, FLOAT} else None
+        assert join(left, right) is expected
+        assert join(left, right) is join(right, left)
+    # Signatures and missing types join with nothing
+    assert join(INT, None) is None and join(([], INT), INT) is None
+
+def test_only_int_is_assignable_to_another_type():
+    assert is_assignable(INT, FLOAT)
+    assert not is_assignable(FLOAT, INT)
+    assert all(is_assignable(data_type, data_type) for data_type in ALL_TYPES)
+    assert not is_assignable(BOOL, INT) and not is_assignable(COLOUR, INT)
+
+def test_mixed_arithmetic_is_promoted():
+    mixed = ("PLUS", integer(1), real(2.5))
+    comparison = ("RELATIONAL_OPERATOR", integer(1), real(2.5), "<")
+    analyzer = analyze([("DECLARATION", "float", "f", mixed), ("PRINT", comparison)])
+    assert analyzer.type_of(mixed) is FLOAT
+    assert analyzer.type_of(comparison) is BOOL
+    assert analyzer.symbol_table.lookup("f") is FLOAT
+
+@pytest.mark.parametrize("statement", [
+    ("DECLARATION", "int", "i", real(2.5)),
+    ("DECLARATION", "TYPE_INT", "i", ("PLUS", integer(1), ("BOOLEAN_LITERAL", True))),
+    ("PRINT", ("RELATIONAL_OPERATOR", colour("#000000"), colour("#ffffff"), "<")),
+    ("PRINT", ("EQUALITY_OPERATOR", integer(1), colour("#ffffff"), "==")),
+])
+def test_incompatible_operands_are_rejected(statement):
+    with pytest.raises(SemanticError):
+        analyze([statement])
+
+def test_declared_spellings_resolve_to_one_type():
+    # 'color' and 'TYPE_COLOUR' declare the same type, so either can be assigned to the other
+    program = [
+        ("DECLARATION", "color", "a", colour("#123456")),
+        ("DECLARATION", "TYPE_COLOUR", "b", ("IDENTIFIER", "a")),
+        ("ASSIGNMENT", "a", ("IDENTIFIER", "b")),
+    ]
+    analyzer = analyze(program)
+    assert analyzer.symbol_table.lookup("a") is COLOUR is analyzer.symbol_table.lookup("b")
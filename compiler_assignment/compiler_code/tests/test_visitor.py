@@ -0,0 +1,64 @@
+# Every pass picks the visit method for a node from a table built once per class, including methods it
+# inherits, and reports nodes it has no method for with an error its callers already catch
+import pytest
+from visitor import ASTVisitor, VisitorError, iter_nodes
+from semantic_analyser import SemanticAnalyzer, SemanticError
+from code_generation import PixIRCodeGenerator, CodeGenerationError
+from xml_generation import ASTXMLGenerator
+
+###########################################################################################################################################
+
+class Counter(ASTVisitor):
+    def visit_INTEGER_LITERAL(self, node):
+        return node[1]
+
+    def visit_PLUS(self, node):
+        return self.visit(node[1]) + self.visit(node[2])
+
+class Doubler(Counter):
+    # Overrides one inherited method and adds one of its own
+    def visit_INTEGER_LITERAL(self, node):
+        return 2 * node[1]
+
+    def visit_MUL(self, node):
+        return self.visit(node[1]) * self.visit(node[2])
+
+SUM = ("PLUS", ("INTEGER_LITERAL", 1), ("PLUS", ("INTEGER_LITERAL", 2), ("INTEGER_LITERAL", 3)))
+
+###########################################################################################################################################
+
+def test_nodes_are_dispatched_on_their_tag():
+    assert Counter().visit(SUM) == 6
+    assert set(Counter.dispatch_table) == {"INTEGER_LITERAL", "PLUS"}
+
+def test_subclasses_inherit_and_override_visit_methods():
+    assert Doubler().visit(SUM) == 12
+    assert Doubler().visit(("MUL", ("INTEGER_LITERAL", 2), ("INTEGER_LITERAL", 5))) == 40
+    assert Doubler.dispatch_table["PLUS"] is Counter.visit_PLUS
+    # The subclass's table is its own; the base class does not learn its methods
+    assert "MUL" not in Counter.dispatch_table
+    assert Counter.dispatch_table["INTEGER_LITERAL"] is Counter.visit_INTEGER_LITERAL
+
+def test_node_without_a_visit_method_raises_a_visitor_error():
+    with pytest.raises(VisitorError, match="'MUL'"):
+        Counter().visit(("MUL", ("INTEGER_LITERAL", 2), ("INTEGER_LITERAL", 5)))
+    with pytest.raises(VisitorError):
+        Counter().visit(["not", "a", "node"])
+
+@pytest.mark.parametrize("make_pass, error", [
+    (lambda ast: SemanticAnalyzer(ast).analyze(), SemanticError),
+    (lambda ast: PixIRCodeGenerator(ast).generate(), CodeGenerationError),
+    (lambda ast: [ASTXMLGenerator(ast).visit(node) for node in ast], VisitorError),
+])
+def test_passes_report_unknown_nodes_as_visitor_errors(make_pass, error):
+    with pytest.raises(error) as raised:
+        make_pass([("NO_SUCH_NODE", ("INTEGER_LITERAL", 1))])
+    assert isinstance(raised.value, VisitorError)
+    assert "NO_SUCH_NODE" in raised.value.message
+
+def test_nodes_are_iterated_in_pre_order():
+    program = [("PRINT", SUM), ("FUNCTION_DEF", "f", [("x", "TYPE_INT")], "TYPE_INT", ("BLOCK", [("RETURN", ("IDENTIFIER", "x"))]))]
+    tags = [node[0] for node in iter_nodes(program)]
+    # The parameter pairs of a function are not nodes
+    assert tags == ["PRINT", "PLUS", "INTEGER_LITERAL", "PLUS", "INTEGER_LITERAL", "INTEGER_LITERAL",
+                    "FUNCTION_DEF", "BLOCK", "RETURN", "IDENTIFIER"]
@@ -0,0 +1,66 @@
+# Interned PArL types. There is exactly one object per type, so type checks are identity comparisons
+# and code that depends on a type can switch on its integer id.
+
+class PArLType:
+    def __init__(self, type_id, name, numeric=False):
+        # Small integer id, usable as an index into per-type tables
+        self.type_id = type_id
+        # Canonical spelling, as written in PArL source
+        self.name = name
+        # Whether the type takes part in numeric promotion
+        self.is_numeric = numeric
+
+    def __repr__(self):
+        return self.name
+
+    def __str__(self):
+        return self.name
+
+    # Unpickling (e.g. in a worker process) must hand back the same singleton, not a copy
+    def __reduce__(self):
+        return (type_named, (self.name,))
+
+###########################################################################################################################################
+
+INT = PArLType(0, "int", numeric=True)
+FLOAT = PArLType(1, "float", numeric=True)
+BOOL = PArLType(2, "bool")
+COLOUR = PArLType(3, "colour")
+STRING = PArLType(4, "string")
+
+# All types, indexed by type_id
+ALL_TYPES = (INT, FLOAT, BOOL, COLOUR, STRING)
+
+# Every spelling used across the compiler for each type: token types from declarations,
+# names from literals, and both spellings of colour
+TYPE_NAMES = {
+    "int": INT, "TYPE_INT": INT,
+    "float": FLOAT, "TYPE_FLOAT": FLOAT,
+    "bool": BOOL, "TYPE_BOOL": BOOL,
+    "colour": COLOUR, "color": COLOUR, "TYPE_COLOUR": COLOUR,
+    "string": STRING, "str": STRING,
+}
+
+# Returns the interned type for any of its spellings, or None if the name is not a type
+def type_named(name):
+    return TYPE_NAMES.get(name)
+
+###########################################################################################################################################
+
+# Least upper bound of two types in the promotion lattice, indexed by type_id. A type joins with
+# itself, int promotes to float, and every other pair has no common type (None).
+JOIN_TABLE = [[None] * len(ALL_TYPES) for _ in ALL_TYPES]
+for data_type in ALL_TYPES:
+    JOIN_TABLE[data_type.type_id][data_type.type_id] = data_type
+JOIN_TABLE[INT.type_id][FLOAT.type_id] = FLOAT
+JOIN_TABLE[FLOAT.type_id][INT.type_id] = FLOAT
+
+# Returns the common type two operands promote to, or None if they are incompatible
+def join(left, right):
+    if not isinstance(left, PArLType) or not isinstance(right, PArLType):
+        return None
+    return JOIN_TABLE[left.type_id][right.type_id]
+
+# Returns True if a value of type source can be used where target is expected
+def is_assignable(source, target):
+    return join(source, target) is target
@@ -0,0 +1,62 @@
+# Raised when a pass meets a node it has no visit method for. The errors of passes that report problems in
+# the program derive from it, so a caller catching those errors also catches nodes the pass cannot handle.
+class VisitorError(Exception):
+    def __init__(self, message="A node could not be visited."):
+        self.message = message
+        super().__init__(self.message)
+
+###########################################################################################################################################
+
+# Base class shared by every pass that walks the AST (semantic analysis, code generation, XML output)
+class ASTVisitor:
+    # Maps a node tag such as 'PLUS' to the function that visits it; built once per class
+    dispatch_table = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Collect every visit_<TAG> method once, when the class is created, so visiting a node
+        # is a single dictionary lookup instead of building a method name and calling getattr
+        dispatch_table = {}
+        for klass in reversed(cls.__mro__):
+            for attribute, value in vars(klass).items():
+                if attribute.startswith("visit_") and callable(value):
+                    dispatch_table[attribute[len("visit_"):]] = value
+        cls.dispatch_table = dispatch_table
+
+###########################################################################################################################################
+
+    def visit(self, node):
+        # Nodes are tuples whose first element is the tag used to pick the visit method
+        if isinstance(node, tuple):
+            visitor = self.dispatch_table.get(node[0])
+            if visitor is None:
+                return self.generic_visit(node)
+            return visitor(self, node)
+        return self.unsupported_node(node)
+
+    # Called for tags with no visit method; passes override this with their own error
+    def generic_visit(self, node):
+        raise VisitorError(f"No visit method implemented for node type '{node[0]}'.")
+
+    # Called for values that are not AST nodes at all
+    def unsupported_node(self, node):
+        return self.generic_visit(node)
+
+###########################################################################################################################################
+
+# Yields every node of the tree in pre-order, looking inside tuples and the lists used for statements and arguments
+def iter_nodes(node):
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if type(current) is tuple:
+            yield current
+            # A function's parameter list holds (name, type) pairs, not nodes
+            first_child = 3 if current[0] == "FUNCTION_DEF" else 1
+            for index in range(len(current) - 1, first_child - 1, -1):
+                child = current[index]
+                if type(child) is tuple or type(child) is list:
+                    stack.append(child)
+        elif type(current) is list:
+            stack.extend(reversed(current))
@@ -0,0 +1,114 @@
+# Microbenchmark comparing the cached dispatch table of ASTVisitor against the old per-visit
+# getattr(self, f"visit_{tag}") dispatch, for each of the three AST passes.
+import contextlib
+import io
+import time
+
+# Importing the passes runs their usage scripts on input.txt, so keep that output out of the report
+with contextlib.redirect_stdout(io.StringIO()):
+    from semantic_analyser import SemanticAnalyzer
+    from code_generation import PixIRCodeGenerator
+    from xml_generation import ASTXMLGenerator
+
+###########################################################################################################################################
+
+# Reproduces the dispatch every pass used before ASTVisitor: build the method name and getattr it per node
+class GetattrDispatch:
+    def visit(self, node):
+        if isinstance(node, tuple):
+            visitor = getattr(self, f"visit_{node[0]}", self.generic_visit)
+            return visitor(node)
+        return self.unsupported_node(node)
+
+class GetattrSemanticAnalyzer(GetattrDispatch, SemanticAnalyzer):
+    # Keep recording expression types, which SemanticAnalyzer.visit does on top of dispatching
+    def visit(self, node):
+        data_type = GetattrDispatch.visit(self, node)
+        if data_type is not None:
+            self.expression_types.record(node, data_type)
+        return data_type
+
+class GetattrCodeGenerator(GetattrDispatch, PixIRCodeGenerator):
+    pass
+
+class GetattrXMLGenerator(GetattrDispatch, ASTXMLGenerator):
+    pass
+
+###########################################################################################################################################
+
+# Builds a program of declarations and prints whose expressions are nested additions and multiplications
+def build_program(statements, depth):
+    program = []
+    for index in range(statements):
+        expression = ("INTEGER_LITERAL", index)
+        for level in range(depth):
+            expression = ("PLUS" if level % 3 else "MUL", expression, ("INTEGER_LITERAL", level))
+        program.append(("DECLARATION", "TYPE_INT", f"v{index}", expression))
+        program.append(("BLOCK", [("PRINT", ("IDENTIFIER", f"v{index}"))]))
+    return program
+
+#---------------------------------------------------------------------------------------------------------------------------------------
+
+# Counts how many visit calls one run of the pass makes over the program
+def count_visits(pass_class, program):
+    visits = 0
+    original_visit = pass_class.visit
+    defined_on_class = "visit" in vars(pass_class)
+
+    def counting_visit(self, node):
+        nonlocal visits
+        visits += 1
+        return original_visit(self, node)
+
+    pass_class.visit = counting_visit
+    try:
+        run_pass(pass_class, program)
+    finally:
+        if defined_on_class:
+            pass_class.visit = original_visit
+        else:
+            del pass_class.visit
+    return visits
+
+# Runs a single pass over the whole program
+def run_pass(pass_class, program):
+    instance = pass_class(program)
+    if isinstance(instance, PixIRCodeGenerator):
+        instance.generate()
+        return
+    with contextlib.redirect_stdout(io.StringIO()):
+        for node in program:
+            instance.visit(node)
+
+# Returns the best visits-per-second figure over several timed runs
+def visits_per_second(pass_class, program, visits, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        run_pass(pass_class, program)
+        best = min(best, time.perf_counter() - start)
+    return visits / best
+
+###########################################################################################################################################
+
+# Usage:
+
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    program = build_program(statements=400, depth=30)
+    repeats = 7
+
+    print("\n" + "-"*100)
+    print("\nVisitor dispatch benchmark (visits per second, best of %d runs):\n" % repeats)
+
+    for name, before, after in [
+        ("SemanticAnalyzer", GetattrSemanticAnalyzer, SemanticAnalyzer),
+        ("PixIRCodeGenerator", GetattrCodeGenerator, PixIRCodeGenerator),
+        ("ASTXMLGenerator", GetattrXMLGenerator, ASTXMLGenerator),
+    ]:
+        visits = count_visits(after, program)
+        before_rate = visits_per_second(before, program, visits, repeats)
+        after_rate = visits_per_second(after, program, visits, repeats)
+        print(f"{name:<20} {visits:>8} visits   getattr: {before_rate:>12,.0f}/s   cached: {after_rate:>12,.0f}/s   speed-up: {after_rate / before_rate:.2f}x")
+
+    print("\n" + "-"*100)
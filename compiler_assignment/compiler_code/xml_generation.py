@@ -1,26 +1,19 @@
 # Import all definitions from the lexer and parser code
 from lexer import *
 from parser_ import *
+from visitor import ASTVisitor, VisitorError
 
 # Class for generating an XML representation of the AST
-class ASTXMLGenerator:
+class ASTXMLGenerator(ASTVisitor):
     def __init__(self, ast):
         self.ast = ast
         self.indent_level = 0
         
 ###########################################################################################################################################
 
-    def visit(self, node):
-        # Determine the method name for the node type
-        method_name = f"visit_{node[0]}"
-        # Get the method to visit the node type, or use the generic visit method if not implemented
-        visit_method = getattr(self, method_name, self.generic_visit)
-        # Visit the node using the appropriate method
-        return visit_method(node)
-    
     # Generic visit method for unsupported node types
     def generic_visit(self, node):
-        raise NotImplementedError(f"Visit method for node type {node[0]} not implemented.")
+        raise VisitorError(f"No visit method implemented for node type '{node[0]}'.")
     
 ###########################################################################################################################################
         
@@ -158,20 +151,17 @@ class ASTXMLGenerator:
         print('</DivExpression>')
         
     def visit_LOGICAL_OPERATOR(self, node):
-        # Determine the logical operator based on the node's value
-        operator = "and" if node[1] == "and" else "or"
+        # The logical operator is kept as the last element of the node
+        operator = node[3]
         # Print opening tag for the logical operator expression
         self.indent()
         print(f'<LogicalExpression operator="{operator}">')
         # Increase indentation level for nested nodes
         self.indent_level += 1
 
-        # Visit left child node
-        self.visit(node[2]) 
-        
-        # Visit right child node if it exists        
-        if len(node) > 3:
-            self.visit(node[3]) 
+        # Visit left and right child nodes
+        self.visit(node[1])
+        self.visit(node[2])
 
         # Decrease indentation level and close logical expression tag
         self.indent_level -= 1
@@ -276,9 +266,7 @@ class ASTXMLGenerator:
     def visit_RELATIONAL_OPERATOR(self, node):
         # Indent and print the opening tag for the relational expression
         self.indent()
-        operator = node[0]
-        left_operand = node[1]
-        right_operand = node[2]
+        _, left_operand, right_operand, operator = node
         print(f'<RelationalExpression operator="{operator}">')
         self.indent_level += 1
         
@@ -291,6 +279,10 @@ class ASTXMLGenerator:
         self.indent()
         print('</RelationalExpression>')
 
+    def visit_EQUALITY_OPERATOR(self, node):
+        # Equality is printed the same way as the other comparisons
+        self.visit_RELATIONAL_OPERATOR(node)
+
     #---------------------------------------------------------------------------------------------------------------------------------------
         
     def visit_BLOCK(self, node):
@@ -566,34 +558,39 @@ class ASTXMLGenerator:
         
 # Usage:
 
-# Specify the name of the file
-filename = 'input.txt'#
-
-# Open the file and read the contents into a string
-with open(filename, 'r') as file:
-    source_code = file.read()#
-
-try:
-    # Tokenize the source code
-    lexer = Lexer(source_code)
-    tokens = lexer.tokenize()#
-
-    # Parse the tokens into an abstract syntax tree (AST)
-    parser = Parser(tokens)
-    ast = parser.parse()#
-
-    # Generate an XML representation of the AST
-    print("\n" + "-"*100)
-    print("\nXML Representation:\n")    
-    xml_generator = ASTXMLGenerator(ast)
-    for node in ast:
-        xml_generator.visit(node)#
-
-# Catch and report lexer errors
-except LexerError as e:
-    print(f"Error: {e}")
-# Catch and report parser errors
-except ParserError as e:
-    print(f"Error: {e}")
-    
-print("\n" + "-"*100)
\ No newline at end of file
+# Only run when the module is executed directly, not when another module or a worker process imports it
+if __name__ == "__main__":
+    # Specify the name of the file
+    filename = 'input.txt'#
+
+    # Open the file and read the contents into a string
+    with open(filename, 'r') as file:
+        source_code = file.read()#
+
+    try:
+        # Tokenize the source code
+        lexer = Lexer(source_code)
+        tokens = lexer.tokenize()#
+
+        # Parse the tokens into an abstract syntax tree (AST)
+        parser = Parser(tokens)
+        ast = parser.parse()#
+
+        # Generate an XML representation of the AST
+        print("\n" + "-"*100)
+        print("\nXML Representation:\n")    
+        xml_generator = ASTXMLGenerator(ast)
+        for node in ast:
+            xml_generator.visit(node)#
+
+    # Catch and report lexer errors
+    except LexerError as e:
+        print(f"Error: {e}")
+    # Catch and report parser errors
+    except ParserError as e:
+        print(f"Error: {e}")
+    # Catch and report nodes the generator has no visit method for
+    except VisitorError as e:
+        print(f"Error: {e}")
+
+    print("\n" + "-"*100)
\ No newline at end of file